@@ -0,0 +1,135 @@
+"""Accumulators for the outputs of the processors."""
+import os
+import shutil
+import tempfile
+import uuid
+import numpy as np
+from coffea import processor
+
+
+class ChunkedColumnAccumulator(processor.AccumulatorABC):
+    """
+    An appendable numpy ndarray, concatenated only once when it is read.
+
+    processor.column_accumulator concatenates on every add, so merging
+    the chunks copies the column over and over. This keeps the chunks
+    in a list instead, and once they take more than memory_budget bytes
+    spills them to a file in spill_dir, which the value is then
+    memory-mapped from. The spill files are kept until cleanup is called,
+    as the memory-mapped value reads them.
+    """
+
+    def __init__(self, value, memory_budget=None, spill_dir=None):
+        """
+        Initialize.
+
+        param value: the first chunk of the column, or an empty array
+            with the dtype and row shape of the column
+        param memory_budget: bytes of chunks kept in memory before they are
+            spilled to disk, None to never spill
+        param spill_dir: directory of the spill files, the system's
+            temporary directory if None
+        """
+        if not isinstance(value, np.ndarray):
+            raise ValueError("ChunkedColumnAccumulator only works with numpy arrays")
+        self._empty = np.zeros(dtype=value.dtype, shape=(0,) + value.shape[1:])
+        self._chunks = [value] if len(value) else []
+        # spilled chunks, as (path, number of rows)
+        self._files = []
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+
+    def __repr__(self):
+        """Representation with the column length."""
+        return f"ChunkedColumnAccumulator({len(self)} rows of {self._empty.dtype})"
+
+    def __len__(self):
+        """Number of rows in the column."""
+        return sum(len(chunk) for chunk in self._chunks) + sum(
+            rows for _, rows in self._files
+        )
+
+    @property
+    def nbytes(self):
+        """Bytes of the chunks held in memory."""
+        return sum(chunk.nbytes for chunk in self._chunks)
+
+    def identity(self):
+        """Empty column with the same dtype, row shape and spill settings."""
+        return ChunkedColumnAccumulator(self._empty, self.memory_budget, self.spill_dir)
+
+    def add(self, other):
+        """Append the chunks of other, taking over its spill files."""
+        if not isinstance(other, ChunkedColumnAccumulator):
+            raise ValueError(
+                f"ChunkedColumnAccumulator cannot be added to {type(other)!r}"
+            )
+        if other._empty.shape != self._empty.shape:
+            raise ValueError(
+                "Cannot add two ChunkedColumnAccumulator objects of dissimilar shape "
+                f"({self._empty.shape!r} vs {other._empty.shape!r})"
+            )
+        if other._files:
+            if other._empty.dtype != self._empty.dtype:
+                raise ValueError("Cannot take over spill files of a different dtype")
+            # the rows held in memory come before those of the files
+            self.spill()
+            self._files.extend(other._files)
+            other._files = []
+        self._chunks.extend(
+            chunk.astype(self._empty.dtype, copy=False) for chunk in other._chunks
+        )
+        if self.memory_budget is not None and self.nbytes > self.memory_budget:
+            self.spill()
+
+    def spill(self):
+        """Write the chunks held in memory to a new spill file."""
+        if not self._chunks:
+            return
+        spill_dir = self.spill_dir or tempfile.gettempdir()
+        path = os.path.join(spill_dir, f"column-{uuid.uuid4().hex}.bin")
+        with open(path, "wb") as file:
+            for chunk in self._chunks:
+                np.ascontiguousarray(chunk).tofile(file)
+        self._files.append((path, sum(len(chunk) for chunk in self._chunks)))
+        self._chunks = []
+
+    @property
+    def value(self):
+        """The column, memory-mapped from disk if any of it was spilled."""
+        if self._files:
+            self.spill()
+            if len(self._files) > 1:
+                # join the spill files on disk, not in memory
+                path, rows = self._files[0]
+                with open(path, "ab") as joined:
+                    for part, part_rows in self._files[1:]:
+                        with open(part, "rb") as file:
+                            shutil.copyfileobj(file, joined)
+                        os.remove(part)
+                        rows += part_rows
+                self._files = [(path, rows)]
+            path, rows = self._files[0]
+            return np.memmap(
+                path,
+                dtype=self._empty.dtype,
+                mode="r",
+                shape=(rows,) + self._empty.shape[1:],
+            )
+        if not self._chunks:
+            return self._empty
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    def cleanup(self):
+        """
+        Delete the spill files, emptying the column.
+
+        A memory-mapped value read before must not be used after.
+        """
+        for path, _ in self._files:
+            if os.path.exists(path):
+                os.remove(path)
+        self._files = []
+        self._chunks = []
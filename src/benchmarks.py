@@ -0,0 +1,348 @@
+"""Benchmarks of the processing steps on chunk sized inputs."""
+import logging
+import os
+import tempfile
+import time
+import awkward as ak
+import numpy as np
+import scipy.stats as st
+import uproot
+from coffea.nanoevents import NanoEventsFactory
+import bremsstrahlung_processor as bp
+import helpers
+import inference
+import momentum_estimator as me
+from helpers import eta_to_theta
+
+# default chunksize of processor.run_uproot_job
+CHUNKSIZE = 100000
+MUON_GUN_FILE = "/eos/cms/store/user/wnash/CSCDigiTree-PDFSet12.root"
+
+# average number of hits per event in the synthetic chunks
+CALO_HITS = {"hcal": 500, "ecalPreshower": 50, "ecalBarrel": 150, "ecalEndcap": 150}
+CSC_HITS = 5
+
+
+def _jagged(flat, counts):
+    """Turn a flat numpy array into a jagged awkward array."""
+    return ak.unflatten(flat, counts)
+
+
+def synthetic_branches(n_events, seed=0):
+    """
+    Generate CSCDigiTree-like branches for a muon gun.
+
+    Each event has one or two muons, with a few calorimeter deposits and
+    a CSC sim hit per layer along their path, on top of uniform noise.
+
+    return: dictionary of branch name to (jagged) array
+    """
+    rng = np.random.default_rng(seed)
+    n_muons = rng.integers(1, 3, n_events)
+    total_muons = np.sum(n_muons)
+    muon_eta = rng.uniform(1.2, 2.4, total_muons) * rng.choice([-1, 1], total_muons)
+    muon_phi = rng.uniform(-np.pi, np.pi, total_muons)
+    muon_p = np.exp(rng.uniform(np.log(10), np.log(4000), total_muons))
+    muon_pt = muon_p * np.sin(eta_to_theta(muon_eta))
+    branches = {
+        "gen_pt": _jagged(muon_pt.astype(np.float32), n_muons),
+        "gen_eta": _jagged(muon_eta.astype(np.float32), n_muons),
+        "gen_phi": _jagged(muon_phi.astype(np.float32), n_muons),
+    }
+
+    def hits(n_noise, n_per_muon, spread):
+        """Hit positions, uniform noise first and then those around each muon."""
+        noise = rng.poisson(n_noise, n_events)
+        along = np.repeat(np.arange(total_muons), n_per_muon)
+        eta = np.concatenate(
+            (
+                rng.uniform(-3.0, 3.0, np.sum(noise)),
+                muon_eta[along] + rng.normal(0, spread, len(along)),
+            )
+        )
+        phi = np.concatenate(
+            (
+                rng.uniform(-np.pi, np.pi, np.sum(noise)),
+                muon_phi[along] + rng.normal(0, spread, len(along)),
+            )
+        )
+        phi = (phi + np.pi) % (2 * np.pi) - np.pi
+        # reorder so that the hits of an event are contiguous
+        event = np.concatenate(
+            (
+                np.repeat(np.arange(n_events), noise),
+                np.repeat(np.arange(n_events), n_muons * n_per_muon),
+            )
+        )
+        order = np.argsort(event, kind="stable")
+        is_muon = np.arange(len(event)) >= np.sum(noise)
+        counts = np.bincount(event, minlength=n_events)
+        return eta[order], phi[order], is_muon[order], along, counts
+
+    for calorimeter, n_noise in CALO_HITS.items():
+        eta, phi, is_muon, _, counts = hits(n_noise, 3, 0.05)
+        energy_em = rng.exponential(0.05, len(eta)) + is_muon * rng.exponential(
+            0.3, len(eta)
+        )
+        energy_had = rng.exponential(0.05, len(eta)) + is_muon * rng.exponential(
+            1.0, len(eta)
+        )
+        for name, values in (
+            ("eta", eta),
+            ("phi", phi),
+            ("energyEM", energy_em),
+            ("energyHad", energy_had),
+        ):
+            branches[f"{calorimeter}_calo_hits_{name}"] = _jagged(
+                values.astype(np.float32), counts
+            )
+
+    # a hit in each of the 6 layers of the 4 stations along each muon
+    eta, phi, is_muon, along, counts = hits(CSC_HITS, 24, 0.01)
+    station = np.zeros(len(eta), np.int64)
+    station[is_muon] = np.tile(np.repeat(np.arange(4), 6), total_muons)
+    endcap = (eta < 0).astype(np.int64)
+    ring = (np.abs(eta) < 1.6).astype(np.int64)
+    chamber = ((phi + np.pi) / (2 * np.pi) * 36).astype(np.int64) % 36
+    ch_id = (endcap << 10) | (station << 8) | (ring << 6) | chamber
+    p_at_entry = np.zeros(len(eta))
+    p_at_entry[is_muon] = muon_p[along] * (1 - 0.005 * (station[is_muon] + 1))
+    for name, values in (
+        ("ch_id", ch_id.astype(np.int32)),
+        ("pdg_id", np.where(is_muon, 13, 11).astype(np.int32)),
+        ("phiAtEntry", phi.astype(np.float32)),
+        ("thetaAtEntry", eta_to_theta(eta).astype(np.float32)),
+        ("pAtEntry", p_at_entry.astype(np.float32)),
+        ("energyLoss", rng.exponential(1e-6, len(eta)).astype(np.float32)),
+    ):
+        branches[f"sim_hits_{name}"] = _jagged(values, counts)
+
+    return branches
+
+
+def load_chunk(filename=MUON_GUN_FILE, chunksize=CHUNKSIZE):
+    """Get the first chunk of a CSCDigiTree, or a synthetic one if the file isn't there."""
+    if not os.path.exists(filename):
+        logging.warning(f"{filename} not found, using a synthetic chunk")
+        filename = os.path.join(
+            tempfile.gettempdir(), f"CSCDigiTree-synthetic-{chunksize}.root"
+        )
+        if not os.path.exists(filename):
+            with uproot.recreate(filename) as file:
+                file["CSCDigiTree"] = synthetic_branches(chunksize)
+    return NanoEventsFactory.from_root(
+        filename,
+        treepath="CSCDigiTree",
+        entry_stop=chunksize,
+        schemaclass=bp.BremsstrahlungSchema,
+    ).events()
+
+
+def best_time(function, *args, repeat=3, **kwargs):
+    """Best wall time of several calls, after a first one which compiles."""
+    function(*args, **kwargs)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_association(events):
+    """Compare the separate association passes with the fused kernel."""
+    gen_muons, calorimeters, csc_hits = bp.get_collections(events)
+    outer_muon_sim_hits = csc_hits[
+        (np.abs(csc_hits.pdg_id) == 13) & (csc_hits.station == 4)
+    ]
+    # don't time the reading of the branches
+    gen_muons = ak.materialized(gen_muons)
+    hcal = ak.materialized(calorimeters["hcal"])
+    ecal_parts = tuple(ak.materialized(calorimeters[em]) for em in bp.EM_CALORIMETERS)
+    csc_hits = ak.materialized(csc_hits)
+    outer_muon_sim_hits = ak.materialized(outer_muon_sim_hits)
+
+    def concatenate():
+        return ak.concatenate(ecal_parts, axis=-1)
+
+    # the separate passes need a single ecal collection
+    ecal = concatenate()
+
+    def separate(energy_kernel, p_at_exit_kernel):
+        for deposits in (hcal, ecal, csc_hits):
+            energy_kernel(ak.ArrayBuilder(), gen_muons, deposits).snapshot()
+        p_at_exit_kernel(ak.ArrayBuilder(), gen_muons, outer_muon_sim_hits).snapshot()
+
+    def weighted():
+        for deposits in (hcal, ecal, csc_hits):
+            bp.get_deltar_weighted_associated_energy(
+                ak.ArrayBuilder(), gen_muons, deposits
+            ).snapshot()
+
+    def fused(weighted):
+        bp.get_muon_associations(
+            ak.ArrayBuilder(),
+            gen_muons,
+            (hcal,),
+            ecal_parts,
+            (csc_hits,),
+            (outer_muon_sim_hits,),
+            weighted,
+        ).snapshot()
+
+    def preallocated(weighted):
+        bp.muon_associations(
+            gen_muons, hcal, ecal_parts, csc_hits, outer_muon_sim_hits, weighted
+        )
+
+    timings = {
+        "ecal concatenation": best_time(concatenate),
+        "full scan passes": best_time(
+            separate, bp.get_associated_energy, bp.get_p_at_exit
+        ),
+        "indexed passes": best_time(
+            separate, bp.get_indexed_associated_energy, bp.get_indexed_p_at_exit
+        ),
+        "weighted passes": best_time(weighted),
+        "fused": best_time(fused, False),
+        "fused, weighted": best_time(fused, True),
+        "fused, preallocated": best_time(preallocated, False),
+        "fused, preallocated, weighted": best_time(preallocated, True),
+    }
+    logging.info(f"Association of {len(events)} events:")
+    logging.info(f"\tconcatenated ecal copy: {ecal.layout.nbytes / 1e6:.1f} MB")
+    for name, seconds in timings.items():
+        logging.info(f"\t{name}: {seconds:.3f} s")
+    return timings
+
+
+def numpy_theta_to_eta(theta):
+    """The chain of allocating NumPy calls theta_to_eta replaces."""
+    return -np.log(np.tan(theta / 2.0))
+
+
+def numpy_pt_eta_to_p(pt, eta):
+    """The chain of allocating NumPy calls pt_eta_to_p replaces."""
+    return pt / np.sin(2.0 * np.arctan(np.exp(-eta)))
+
+
+def benchmark_kinematics(events):
+    """Compare the in place kinematics helpers with the allocating chains."""
+    gen = events.gen
+    pt = ak.to_numpy(ak.flatten(gen.pt))
+    eta = ak.to_numpy(ak.flatten(gen.eta))
+    theta = ak.to_numpy(ak.flatten(events.sim_hits.thetaAtEntry))
+    p_out = np.empty_like(pt)
+    eta_out = np.empty_like(theta)
+    timings = {
+        "theta_to_eta, numpy": best_time(numpy_theta_to_eta, theta),
+        "theta_to_eta": best_time(helpers.theta_to_eta, theta),
+        "theta_to_eta, out=": best_time(helpers.theta_to_eta, theta, out=eta_out),
+        "theta_to_eta, numpy, jagged": best_time(
+            numpy_theta_to_eta, events.sim_hits.thetaAtEntry
+        ),
+        "theta_to_eta, jagged": best_time(
+            helpers.theta_to_eta, events.sim_hits.thetaAtEntry
+        ),
+        "pt_eta_to_p, numpy": best_time(numpy_pt_eta_to_p, pt, eta),
+        "pt_eta_to_p": best_time(helpers.pt_eta_to_p, pt, eta),
+        "pt_eta_to_p, out=": best_time(helpers.pt_eta_to_p, pt, eta, out=p_out),
+        "pt_eta_to_p, numpy, jagged": best_time(numpy_pt_eta_to_p, gen.pt, gen.eta),
+        "pt_eta_to_p, jagged": best_time(helpers.pt_eta_to_p, gen.pt, gen.eta),
+    }
+    logging.info(f"Kinematics of {len(pt)} muons and {len(theta)} sim hits:")
+    for name, seconds in timings.items():
+        logging.info(f"\t{name}: {seconds * 1e3:.2f} ms")
+    return timings
+
+
+def benchmark_moyal(n=1000000, seed=0):
+    """Compare the Moyal kernels of helpers with scipy.stats.moyal."""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 100, n)
+    loc = rng.uniform(0, 20, n)
+    scale = rng.uniform(0.5, 10, n)
+    timings = {}
+    for name in ("pdf", "logpdf", "cdf"):
+        scipy_function = getattr(st.moyal, name)
+        function = getattr(helpers, f"moyal_{name}")
+        timings[f"{name}, scipy"] = best_time(scipy_function, x, loc=loc, scale=scale)
+        timings[name] = best_time(function, x, loc, scale)
+        timings[f"{name}, scalar, scipy"] = best_time(
+            scipy_function, 5.0, loc=1.0, scale=2.0
+        )
+        timings[f"{name}, scalar"] = best_time(function, 5.0, 1.0, 2.0)
+    logging.info(f"Moyal functions of {n} points:")
+    for name, seconds in timings.items():
+        logging.info(f"\t{name}: {seconds * 1e3:.4f} ms")
+    return timings
+
+
+def benchmark_momentum_estimate(n=100000, popt=(2.0, 0.004, 0.002, 3e4), seed=0):
+    """Compare the throughput and accuracy of the momentum estimates."""
+    pred_dp = np.random.default_rng(seed).exponential(10, n)
+    popt = np.array(popt)
+    table = me.interval_table(popt)
+    estimates = {
+        "10 GeV scan": lambda dp: me.estimate_momentum(dp, popt),
+        "1 GeV scan": lambda dp: me.estimate_momentum(
+            dp, popt, p_axis=np.arange(me.P_AXIS[0], me.P_AXIS[-1] + 0.5, 1.0)
+        ),
+        "refined": lambda dp: me.refine_momentum(dp, popt),
+        "table": lambda dp: me.interpolate_momentum(dp, table),
+    }
+    # the reference is a 0.1 GeV scan of a subset
+    subset = pred_dp[:1000]
+    reference = me.estimate_momentum(
+        subset,
+        popt,
+        p_axis=np.arange(me.P_AXIS[0], me.P_AXIS[-1] + 0.05, 0.1),
+        chunk_size=100,
+    )
+    logging.info(f"Momentum estimate of {n} muons:")
+    timings = {}
+    for name, estimate in estimates.items():
+        timings[name] = best_time(estimate, pred_dp, repeat=1)
+        errors = [
+            np.max(np.abs(value - expected))
+            for value, expected in zip(estimate(subset), reference)
+        ]
+        logging.info(
+            f"\t{name}: {timings[name]:.3f} s, largest difference to a 0.1 GeV "
+            f"scan of p: {errors[0]:.2f}, low: {errors[1]:.2f}, high: {errors[2]:.2f} GeV"
+        )
+    return timings
+
+
+def benchmark_inference(n=1000000, n_features=13, units=32, depth=4, seed=0):
+    """Time loading and evaluating a NumPy model of models.neural_network."""
+    rng = np.random.default_rng(seed)
+    shapes = [(n_features, units)] + [(units, units)] * (depth - 1) + [(units, 1)]
+    model = inference.DenseModel(
+        [rng.normal(size=shape) / np.sqrt(shape[0]) for shape in shapes],
+        [rng.normal(size=shape[1]) for shape in shapes],
+        ["relu"] * len(shapes),
+        rng.normal(size=n_features),
+        rng.uniform(0.5, 2, size=n_features),
+    )
+    features = rng.normal(size=(n, n_features))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, inference.MODEL_FILE)
+        model.save(path)
+        load_time = best_time(inference.load_model, path)
+    predict_time = best_time(model.predict, features)
+    logging.info(
+        f"NumPy inference: load {1000 * load_time:.2f} ms, "
+        f"predict {n / predict_time:.3g} muons/s"
+    )
+    return load_time, predict_time
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    events = load_chunk()
+    benchmark_association(events)
+    benchmark_kinematics(events)
+    benchmark_moyal()
+    benchmark_momentum_estimate()
+    benchmark_inference()
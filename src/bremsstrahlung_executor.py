@@ -3,11 +3,14 @@ import glob
 import coffea.hist as hist
 import coffea.processor as processor
 import matplotlib.pyplot as plt
-import pandas as pd
-from coffea.nanoevents import BaseSchema
 from matplotlib.colors import LogNorm
-from bremsstrahlung_processor import BremsstrahlungProcessor
-from helpers import OUTPUT_DIR
+from bremsstrahlung_processor import (
+    DATASET_COLUMNS,
+    BremsstrahlungProcessor,
+    BremsstrahlungSchema,
+)
+from helpers import OUTPUT_DIR, log_metrics
+from ntuple import write_ntuple
 
 
 # increase resolution of output .png files
@@ -21,14 +24,16 @@ files = glob.glob("/eos/cms/store/user/wnash/CSCDigiTree-PDFSet12.root")
 
 fileset = {"dummy": files}
 
-out = processor.run_uproot_job(
+out, metrics = processor.run_uproot_job(
     fileset=fileset,
     treename="CSCDigiTree",
-    processor_instance=BremsstrahlungProcessor(),
+    # spill each column to disk past 256 MB, rather than running out of memory
+    processor_instance=BremsstrahlungProcessor(memory_budget=256 * 2**20),
     executor=processor.futures_executor,
     # executor=processor.iterative_executor,
-    executor_args={"schema": BaseSchema, "workers": 8},
+    executor_args={"schema": BremsstrahlungSchema, "workers": 8, "savemetrics": True},
 )
+log_metrics(metrics)
 
 fig, ax = plt.subplots()
 
@@ -100,10 +105,11 @@ ax = hist.plot2d(
 )
 plt.savefig(OUTPUT_DIR + "muon_pexit_vs_p.png")
 
-columns = ["p", "dp", "eta", "phi", "hcal", "ecal", "csc"]
-data = {}
-for col in columns:
-    data[col] = out[col].value
-
-df = pd.DataFrame(data)
-df.to_pickle(OUTPUT_DIR + "brem_dataset.pkl")
+# stream the columns, which may be memory-mapped, to the file
+write_ntuple(
+    OUTPUT_DIR + "brem_dataset.parquet",
+    {col: out[col].value for col in DATASET_COLUMNS},
+)
+# delete the spill files of the columns
+for col in DATASET_COLUMNS:
+    out[col].cleanup()
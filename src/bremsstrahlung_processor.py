@@ -2,15 +2,11 @@
 import awkward as ak
 import numpy as np
 import numba
+from numba import literal_unroll
 from coffea import hist, processor
-from helpers import (
-    serial_to_endcap,
-    serial_to_station,
-    serial_to_ring,
-    serial_to_chamber,
-    theta_to_eta,
-    pt_eta_to_p,
-)
+from accumulators import ChunkedColumnAccumulator
+from cscdigitree_schema import CSCDigiTreeSchema
+from helpers import pt_eta_to_p
 
 # register our candidate behaviors
 from coffea.nanoevents.methods import candidate
@@ -21,17 +17,135 @@ ak.behavior.update(candidate.behavior)
 PI = 3.14159
 DR_CUT = 0.2
 
+HAD_CALORIMETERS = ["hcal"]
+EM_CALORIMETERS = ["ecalPreshower", "ecalBarrel", "ecalEndcap"]
+
+# the CSC energy is also split by the station of the hits
+N_STATIONS = 4
+STATION_FIELDS = tuple(f"csc_station{station}" for station in range(1, N_STATIONS + 1))
+# per-muon columns saved for the momentum loss regression
+DATASET_COLUMNS = ["p", "dp", "eta", "phi", "hcal", "ecal", "csc"] + list(
+    STATION_FIELDS
+)
+
+# the only branches of the CSCDigiTree the processor reads
+BRANCHES = (
+    ["gen_pt", "gen_eta", "gen_phi"]
+    + [
+        f"{calorimeter}_calo_hits_{var}"
+        for calorimeter in HAD_CALORIMETERS + EM_CALORIMETERS
+        for var in ["eta", "phi", "energyEM", "energyHad"]
+    ]
+    + [
+        f"sim_hits_{var}"
+        for var in [
+            "ch_id",
+            "pdg_id",
+            "phiAtEntry",
+            "thetaAtEntry",
+            "pAtEntry",
+            "energyLoss",
+        ]
+    ]
+)
+
+# deposits are binned in eta cells slightly wider than DR_CUT,
+# so everything within DR_CUT of a muon is in its cell or the two neighbours
+ETA_MAX = 5.2
+ETA_CELL = 1.001 * DR_CUT
+N_ETA_CELLS = int(np.ceil(2 * ETA_MAX / ETA_CELL)) + 2
+# below this many muons in an event a full scan is cheaper than building the index
+INDEX_MIN_MUONS = 3
+
 
 @numba.njit
-def delta_r(obj1, obj2):
+def delta_r_eta_phi(eta1, phi1, eta2, phi2):
     """Calculate dR = sqrt(d_eta^2 + d_phi^2)."""
-    d_eta = obj1.eta - obj2.eta
-    d_phi = np.abs(obj1.phi - obj2.phi)
+    d_eta = eta1 - eta2
+    d_phi = np.abs(phi1 - phi2)
     if d_phi > PI:
         d_phi -= 2 * PI
     return np.sqrt(d_eta * d_eta + d_phi * d_phi)
 
 
+@numba.njit
+def delta_r(obj1, obj2):
+    """Calculate dR = sqrt(d_eta^2 + d_phi^2)."""
+    return delta_r_eta_phi(obj1.eta, obj1.phi, obj2.eta, obj2.phi)
+
+
+@numba.njit
+def eta_cell(eta):
+    """Get the eta cell, with under/overflow cells at either end."""
+    if not eta >= -ETA_MAX:
+        return 0
+    if eta >= ETA_MAX:
+        return N_ETA_CELLS - 1
+    return int((eta + ETA_MAX) / ETA_CELL) + 1
+
+
+@numba.njit
+def eta_index(event_deposits):
+    """
+    Bin the (non-empty) deposits of a single event into eta cells.
+
+    Phi is not binned, so the wrap-around is left to delta_r.
+
+    return: (starts, order, eta, phi) where the deposits of cell c
+        are at positions starts[c]:starts[c + 1] of the eta and phi arrays,
+        and order holds their index in event_deposits
+    """
+    n_deposits = len(event_deposits)
+    cells = np.empty(n_deposits, np.int64)
+    starts = np.zeros(N_ETA_CELLS + 1, np.int64)
+    for i, deposit in enumerate(event_deposits):
+        cells[i] = eta_cell(deposit.eta)
+        starts[cells[i] + 1] += 1
+    for cell in range(N_ETA_CELLS):
+        starts[cell + 1] += starts[cell]
+
+    # counting sort, keeping the dtype of the inputs so delta_r is unchanged
+    first = event_deposits[0]
+    eta = np.full(n_deposits, first.eta)
+    phi = np.full(n_deposits, first.phi)
+    order = np.empty(n_deposits, np.int64)
+    fill = starts[:-1].copy()
+    for i, deposit in enumerate(event_deposits):
+        j = fill[cells[i]]
+        fill[cells[i]] += 1
+        eta[j] = deposit.eta
+        phi[j] = deposit.phi
+        order[j] = i
+    return starts, order, eta, phi
+
+
+@numba.njit
+def match_in_window(muon, index, matched):
+    """
+    Find the deposits within DR_CUT of the muon, visiting only neighbouring cells.
+
+    param muon: object with an eta and phi
+    param index: as returned by eta_index
+    param matched: buffer at least as long as the event deposits
+
+    return: the number of matches, whose indices are written to the front of
+        matched in their original order, so sums are identical to a full scan
+    """
+    starts, order, eta, phi = index
+    cell = eta_cell(muon.eta)
+    n_matched = 0
+    for j in range(starts[max(cell - 1, 0)], starts[min(cell + 2, N_ETA_CELLS)]):
+        if delta_r_eta_phi(muon.eta, muon.phi, eta[j], phi[j]) < DR_CUT:
+            # insertion sort, there are only a handful of matches
+            k = n_matched
+            while k > 0 and matched[k - 1] > order[j]:
+                matched[k] = matched[k - 1]
+                k -= 1
+            matched[k] = order[j]
+            n_matched += 1
+    return n_matched
+
+
 @numba.njit
 def get_associated_energy(associated_array, gen_muons, detector_deposits):
     """Find the energy deposits associated with each gen muon."""
@@ -80,11 +194,491 @@ def get_p_at_exit(p_at_exit, gen_muons, sim_hits):
     return p_at_exit
 
 
+@numba.njit
+def add_associated_energy(out, event_muons, event_deposits, index_min_muons):
+    """
+    Add the energy of the deposits within DR_CUT of each muon of an event to out.
+
+    Events with at least index_min_muons muons only visit
+    the deposits in the neighbouring eta cells of each muon.
+    """
+    if len(event_muons) < index_min_muons or len(event_deposits) == 0:
+        for m, muon in enumerate(event_muons):
+            associated_deposits = out[m]
+            for deposit in event_deposits:
+                if delta_r(muon, deposit) < DR_CUT:
+                    associated_deposits += deposit.energy
+            out[m] = associated_deposits
+    else:
+        index = eta_index(event_deposits)
+        matched = np.empty(len(event_deposits), np.int64)
+        for m, muon in enumerate(event_muons):
+            associated_deposits = out[m]
+            for k in range(match_in_window(muon, index, matched)):
+                associated_deposits += event_deposits[matched[k]].energy
+            out[m] = associated_deposits
+
+
+@numba.njit
+def add_all_energy(out, weighted_out, event_muons, event_deposits):
+    """
+    Add the energy within DR_CUT, and the deltaR weighted energy of all deposits,
+    to each muon of an event, computing each deltaR only once.
+    """
+    for m, muon in enumerate(event_muons):
+        # accumulate locally, out and weighted_out may share memory
+        associated_deposits = out[m]
+        weighted_deposits = weighted_out[m]
+        for deposit in event_deposits:
+            dr = delta_r(muon, deposit)
+            if dr < DR_CUT:
+                associated_deposits += deposit.energy
+            # far away deposits count for more
+            weighted_deposits += dr * deposit.energy
+        out[m] = associated_deposits
+        weighted_out[m] = weighted_deposits
+
+
+@numba.njit
+def set_p_at_exit(out, event_muons, event_hits, index_min_muons):
+    """
+    Set out to the momentum of the last hit within DR_CUT of each muon of an event.
+
+    Muons without any such hit are left untouched.
+    """
+    if len(event_muons) < index_min_muons or len(event_hits) == 0:
+        for m, muon in enumerate(event_muons):
+            for hit in event_hits:
+                if delta_r(muon, hit) < DR_CUT:
+                    # entry of chamber is last measure part of muon
+                    out[m] = hit.p_at_entry
+    else:
+        index = eta_index(event_hits)
+        matched = np.empty(len(event_hits), np.int64)
+        for m, muon in enumerate(event_muons):
+            n_matched = match_in_window(muon, index, matched)
+            if n_matched > 0:
+                out[m] = event_hits[matched[n_matched - 1]].p_at_entry
+
+
+@numba.njit
+def add_station_energy(
+    out, station_out, weighted_out, event_muons, event_hits, weighted, index_min_muons
+):
+    """
+    Add the energy of the hits within DR_CUT of each muon of an event to out,
+    and to the row of station_out for the station of each hit.
+
+    The split by station is a segmented reduction in the same pass over
+    the hits, keyed on their decoded station. If weighted, the deltaR
+    weighted energy of all hits is also added to weighted_out.
+    """
+    stations = np.empty(N_STATIONS)
+    if weighted or len(event_muons) < index_min_muons or len(event_hits) == 0:
+        for m, muon in enumerate(event_muons):
+            # accumulate locally, the outputs may share memory
+            associated_hits = out[m]
+            weighted_hits = weighted_out[m]
+            stations[:] = station_out[:, m]
+            for hit in event_hits:
+                dr = delta_r(muon, hit)
+                if dr < DR_CUT:
+                    associated_hits += hit.energy
+                    stations[hit.station - 1] += hit.energy
+                if weighted:
+                    weighted_hits += dr * hit.energy
+            out[m] = associated_hits
+            station_out[:, m] = stations
+            if weighted:
+                weighted_out[m] = weighted_hits
+    else:
+        index = eta_index(event_hits)
+        matched = np.empty(len(event_hits), np.int64)
+        for m, muon in enumerate(event_muons):
+            associated_hits = out[m]
+            stations[:] = station_out[:, m]
+            for k in range(match_in_window(muon, index, matched)):
+                hit = event_hits[matched[k]]
+                associated_hits += hit.energy
+                stations[hit.station - 1] += hit.energy
+            out[m] = associated_hits
+            station_out[:, m] = stations
+
+
+@numba.njit
+def get_indexed_associated_energy(
+    associated_array, gen_muons, detector_deposits, index_min_muons=INDEX_MIN_MUONS
+):
+    """
+    Find the energy deposits associated with each gen muon.
+
+    Same as get_associated_energy, but events with at least index_min_muons
+    muons only visit the deposits in the neighbouring eta cells of each muon.
+    """
+    for event_muons, event_deposits in zip(gen_muons, detector_deposits):
+        associated_deposits = np.zeros(len(event_muons))
+        add_associated_energy(
+            associated_deposits, event_muons, event_deposits, index_min_muons
+        )
+        associated_array.begin_list()
+        for value in associated_deposits:
+            associated_array.append(value)
+        associated_array.end_list()
+    return associated_array
+
+
+@numba.njit
+def get_indexed_p_at_exit(
+    p_at_exit, gen_muons, sim_hits, index_min_muons=INDEX_MIN_MUONS
+):
+    """
+    Get the muon momentum as it leaves the detector.
+
+    Same as get_p_at_exit, but events with at least index_min_muons
+    muons only visit the hits in the neighbouring eta cells of each muon.
+    """
+    for event_muons, event_hits in zip(gen_muons, sim_hits):
+        muon_p_at_exit = np.full(len(event_muons), -1.0)
+        set_p_at_exit(muon_p_at_exit, event_muons, event_hits, index_min_muons)
+        p_at_exit.begin_list()
+        for value in muon_p_at_exit:
+            p_at_exit.append(value)
+        p_at_exit.end_list()
+    return p_at_exit
+
+
+# quantities filled by the fused association kernels, the weighted ones last
+ASSOCIATION_FIELDS = (
+    ("hcal", "ecal", "csc", "p_exit")
+    + STATION_FIELDS
+    + ("hcal_weighted", "ecal_weighted", "csc_weighted")
+)
+N_UNWEIGHTED_FIELDS = 4 + N_STATIONS
+
+
+@numba.njit
+def add_collections_energy(out, event_muons, collections, event, index_min_muons):
+    """
+    add_associated_energy for the deposits of an event in each collection in turn.
+
+    The collections are visited in place, giving the same sums as
+    on their concatenation.
+    """
+    for collection in literal_unroll(collections):
+        add_associated_energy(out, event_muons, collection[event], index_min_muons)
+
+
+@numba.njit
+def add_collections_all_energy(out, weighted_out, event_muons, collections, event):
+    """add_all_energy for the deposits of an event in each collection in turn."""
+    for collection in literal_unroll(collections):
+        add_all_energy(out, weighted_out, event_muons, collection[event])
+
+
+@numba.njit
+def add_collections_station_energy(
+    out,
+    station_out,
+    weighted_out,
+    event_muons,
+    collections,
+    event,
+    weighted,
+    index_min_muons,
+):
+    """add_station_energy for the hits of an event in each collection in turn."""
+    for collection in literal_unroll(collections):
+        add_station_energy(
+            out,
+            station_out,
+            weighted_out,
+            event_muons,
+            collection[event],
+            weighted,
+            index_min_muons,
+        )
+
+
+@numba.njit
+def fill_event_associations(
+    event_values,
+    gen_muons,
+    hcal,
+    ecal,
+    csc_hits,
+    outer_hits,
+    event,
+    weighted,
+    index_min_muons,
+):
+    """Fill the zero-initialized rows of event_values, ordered as ASSOCIATION_FIELDS."""
+    event_muons = gen_muons[event]
+    if weighted:
+        # the weighted energy needs every deposit, so the index can't help
+        add_collections_all_energy(
+            event_values[0], event_values[-3], event_muons, hcal, event
+        )
+        add_collections_all_energy(
+            event_values[1], event_values[-2], event_muons, ecal, event
+        )
+    else:
+        add_collections_energy(
+            event_values[0], event_muons, hcal, event, index_min_muons
+        )
+        add_collections_energy(
+            event_values[1], event_muons, ecal, event, index_min_muons
+        )
+    # the weighted csc energy shares the row of the csc energy if not weighted,
+    # which add_station_energy leaves alone
+    add_collections_station_energy(
+        event_values[2],
+        event_values[4 : 4 + N_STATIONS],
+        event_values[-1] if weighted else event_values[2],
+        event_muons,
+        csc_hits,
+        event,
+        weighted,
+        index_min_muons,
+    )
+    event_values[3] = -1.0
+    for collection in literal_unroll(outer_hits):
+        set_p_at_exit(event_values[3], event_muons, collection[event], index_min_muons)
+
+
+@numba.njit
+def get_muon_associations(
+    associations,
+    gen_muons,
+    hcal,
+    ecal,
+    csc_hits,
+    outer_hits,
+    weighted=False,
+    index_min_muons=INDEX_MIN_MUONS,
+):
+    """
+    Fill all the per-muon detector quantities in a single pass over the events.
+
+    param hcal, ecal, csc_hits, outer_hits: tuples of collections,
+        the deposits of a detector can be split over several collections
+    param weighted: also fill the deltaR weighted energies, which need every
+        deposit of the event to be visited
+
+    return: records with the associated hcal, ecal and csc energy, the
+        momentum p_exit at the last of the outer_hits (-1 if there is none),
+        the csc energy in each station (csc_station1 to csc_station4),
+        and if weighted, the hcal_weighted, ecal_weighted and csc_weighted energy
+    """
+    for event in range(len(gen_muons)):
+        n_muons = len(gen_muons[event])
+        event_values = np.zeros((len(ASSOCIATION_FIELDS), n_muons))
+        fill_event_associations(
+            event_values,
+            gen_muons,
+            hcal,
+            ecal,
+            csc_hits,
+            outer_hits,
+            event,
+            weighted,
+            index_min_muons,
+        )
+
+        associations.begin_list()
+        for m in range(n_muons):
+            associations.begin_record()
+            associations.field("hcal").real(event_values[0, m])
+            associations.field("ecal").real(event_values[1, m])
+            associations.field("csc").real(event_values[2, m])
+            associations.field("p_exit").real(event_values[3, m])
+            associations.field("csc_station1").real(event_values[4, m])
+            associations.field("csc_station2").real(event_values[5, m])
+            associations.field("csc_station3").real(event_values[6, m])
+            associations.field("csc_station4").real(event_values[7, m])
+            if weighted:
+                associations.field("hcal_weighted").real(event_values[8, m])
+                associations.field("ecal_weighted").real(event_values[9, m])
+                associations.field("csc_weighted").real(event_values[10, m])
+            associations.end_record()
+        associations.end_list()
+    return associations
+
+
+@numba.njit
+def fill_muon_associations(
+    out,
+    gen_muons,
+    hcal,
+    ecal,
+    csc_hits,
+    outer_hits,
+    weighted=False,
+    index_min_muons=INDEX_MIN_MUONS,
+):
+    """
+    Same as get_muon_associations, but fill a preallocated buffer.
+
+    param out: zero-initialized buffer of shape (fields, muons in all events),
+        with a row per ASSOCIATION_FIELDS (only the first N_UNWEIGHTED_FIELDS
+        are used if not weighted)
+    """
+    start = 0
+    for event in range(len(gen_muons)):
+        stop = start + len(gen_muons[event])
+        fill_event_associations(
+            out[:, start:stop],
+            gen_muons,
+            hcal,
+            ecal,
+            csc_hits,
+            outer_hits,
+            event,
+            weighted,
+            index_min_muons,
+        )
+        start = stop
+    return out
+
+
+def unflatten_like(flat, jagged):
+    """Wrap a flat array as a jagged array with the same lists as jagged."""
+    layout = ak.to_layout(jagged)
+    if isinstance(layout, ak.layout.ListOffsetArray64) and layout.offsets[0] == 0:
+        # share the offsets, no copy needed
+        return ak.Array(
+            ak.layout.ListOffsetArray64(layout.offsets, ak.layout.NumpyArray(flat))
+        )
+    return ak.unflatten(flat, ak.num(jagged))
+
+
+def as_collections(collections):
+    """Get a tuple of collections from a single collection or a list of them."""
+    if isinstance(collections, (list, tuple)):
+        return tuple(collections)
+    return (collections,)
+
+
+def muon_associations(gen_muons, hcal, ecal, csc_hits, outer_hits, weighted=False):
+    """
+    Get the per-muon detector quantities, using preallocated flat buffers.
+
+    param hcal, ecal, csc_hits, outer_hits: a collection, or a list of
+        collections which are visited in place rather than concatenated
+
+    return: the same records as get_muon_associations
+    """
+    n_fields = len(ASSOCIATION_FIELDS) if weighted else N_UNWEIGHTED_FIELDS
+    out = np.zeros((n_fields, ak.sum(ak.num(gen_muons))))
+    fill_muon_associations(
+        out,
+        gen_muons,
+        as_collections(hcal),
+        as_collections(ecal),
+        as_collections(csc_hits),
+        as_collections(outer_hits),
+        weighted,
+    )
+    return ak.zip(
+        {
+            field: unflatten_like(out[i], gen_muons)
+            for i, field in enumerate(ASSOCIATION_FIELDS[:n_fields])
+        }
+    )
+
+
+def plain_zip(fields):
+    """Zip fields into records without any parameters or behavior."""
+    return ak.zip(
+        {
+            name: ak.Array(ak.without_parameters(field), behavior={})
+            for name, field in fields.items()
+        },
+        behavior={},
+    )
+
+
+def get_collections(events):
+    """
+    Build the collections used for the association from the CSCDigiTreeSchema ones.
+
+    The kernels can only read fields, so the quantities the behaviors
+    derive are zipped in as fields. The collections carry no parameters
+    nor behavior, which are part of their numba type: the NanoEvents ones
+    differ in every chunk and would recompile the kernels each time.
+
+    return: the gen muons, a dictionary of calorimeter deposits
+        and the CSC sim hits
+    """
+    gen = events.gen
+    gen_muons = plain_zip(
+        {
+            "pt": gen.pt,
+            "p": pt_eta_to_p(gen.pt, gen.eta),
+            "eta": gen.eta,
+            "phi": gen.phi,
+        }
+    )
+
+    calorimeters = {}
+    for calorimeter in HAD_CALORIMETERS + EM_CALORIMETERS:
+        calo_hits = events[calorimeter + "_calo_hits"]
+        calorimeters[calorimeter] = plain_zip(
+            {
+                "had": calo_hits.energyHad,
+                "em": calo_hits.energyEM,
+                "energy": calo_hits.energy,
+                "eta": calo_hits.eta,
+                "phi": calo_hits.phi,
+            }
+        )
+
+    sim_hits = events.sim_hits
+    chamber_id = sim_hits.chamber_id
+    csc_hits = plain_zip(
+        {
+            "ch_id": sim_hits.ch_id,
+            "pdg_id": sim_hits.pdg_id,
+            "phi": sim_hits.phi,
+            "eta": sim_hits.eta,
+            "endcap": chamber_id.endcap,
+            "station": chamber_id.station,
+            "ring": chamber_id.ring,
+            "chamber": chamber_id.chamber,
+            "chamber_index": chamber_id.index,
+            "p_at_entry": sim_hits.pAtEntry,
+            "energy": sim_hits.energyLoss,
+        }
+    )
+
+    return gen_muons, calorimeters, csc_hits
+
+
+class BremsstrahlungSchema(CSCDigiTreeSchema):
+    """CSCDigiTree with only the branches used by the BremsstrahlungProcessor."""
+
+    branches = BRANCHES
+
+
 class BremsstrahlungProcessor(processor.ProcessorABC):
     """Runs the analysis."""
 
-    def __init__(self):
-        """Initialize."""
+    def __init__(self, preallocate=True, memory_budget=None, spill_dir=None):
+        """
+        Initialize.
+
+        param preallocate: fill the associations into preallocated buffers,
+            rather than with an ak.ArrayBuilder
+        param memory_budget: bytes of each output column kept in memory
+            before it is spilled to disk, None to keep it all in memory
+        param spill_dir: directory the columns are spilled to
+        """
+        self._preallocate = preallocate
+
+        def column():
+            return ChunkedColumnAccumulator(
+                np.zeros(shape=(0,)), memory_budget=memory_budget, spill_dir=spill_dir
+            )
+
         self._accumulator = processor.dict_accumulator(
             {
                 "allevents": processor.defaultdict_accumulator(float),
@@ -135,13 +729,7 @@ class BremsstrahlungProcessor(processor.ProcessorABC):
                         100,
                     ),
                 ),
-                "p": processor.column_accumulator(np.zeros(shape=(0,))),
-                "dp": processor.column_accumulator(np.zeros(shape=(0,))),
-                "phi": processor.column_accumulator(np.zeros(shape=(0,))),
-                "eta": processor.column_accumulator(np.zeros(shape=(0,))),
-                "hcal": processor.column_accumulator(np.zeros(shape=(0,))),
-                "ecal": processor.column_accumulator(np.zeros(shape=(0,))),
-                "csc": processor.column_accumulator(np.zeros(shape=(0,))),
+                **{field: column() for field in DATASET_COLUMNS},
             }
         )
 
@@ -158,14 +746,7 @@ class BremsstrahlungProcessor(processor.ProcessorABC):
 
         output["allevents"][dataset] += len(events)
 
-        gen_muons = ak.zip(
-            {
-                "pt": events.gen_pt,
-                "p": pt_eta_to_p(events.gen_pt, events.gen_eta),
-                "eta": events.gen_eta,
-                "phi": events.gen_phi,
-            }
-        )
+        gen_muons, calorimeters, csc_hits = get_collections(events)
 
         output["all_muons"].fill(
             p=ak.flatten(gen_muons.p),
@@ -173,78 +754,35 @@ class BremsstrahlungProcessor(processor.ProcessorABC):
             phi=ak.flatten(gen_muons.phi),
         )
 
-        had_calorimeters = [
-            "hcal",
-        ]
-
-        em_calorimeters = ["ecalPreshower", "ecalBarrel", "ecalEndcap"]
-
-        calorimeter_names = had_calorimeters + em_calorimeters
-
-        calorimeters = {}
-        for calorimeter in calorimeter_names:
-            calorimeters[calorimeter] = ak.zip(
-                {
-                    "had": events[calorimeter + "_calo_hits_energyHad"],
-                    "em": events[calorimeter + "_calo_hits_energyEM"],
-                    "energy": events[calorimeter + "_calo_hits_energyEM"]
-                    + events[calorimeter + "_calo_hits_energyHad"],
-                    "eta": events[calorimeter + "_calo_hits_eta"],
-                    "phi": events[calorimeter + "_calo_hits_phi"],
-                }
-            )
-
-        calorimeters["ecal"] = ak.concatenate(
-            (calorimeters[em] for em in em_calorimeters), axis=-1
-        )
-
-        csc_hits = ak.zip(
-            {
-                "ch_id": events.sim_hits_ch_id,
-                "pdg_id": events.sim_hits_pdg_id,
-                "phi": events.sim_hits_phiAtEntry,
-                "eta": theta_to_eta(events.sim_hits_thetaAtEntry),
-                "endcap": serial_to_endcap(events.sim_hits_ch_id),
-                "station": serial_to_station(events.sim_hits_ch_id),
-                "ring": serial_to_ring(events.sim_hits_ch_id),
-                "chamber": serial_to_chamber(events.sim_hits_ch_id),
-                "p_at_entry": events.sim_hits_pAtEntry,
-                "energy": events.sim_hits_energyLoss,
-            }
-        )
-
-        associated_hcal_energy = ak.ArrayBuilder()
-        associated_hcal_energy = get_associated_energy(
-            associated_hcal_energy, gen_muons, calorimeters["hcal"]
-        )
-
-        associated_ecal_energy = ak.ArrayBuilder()
-        associated_ecal_energy = get_associated_energy(
-            associated_ecal_energy, gen_muons, calorimeters["ecal"]
-        )
-
-        # todo, split this up by chamber / station
-        associated_csc_energy = ak.ArrayBuilder()
-        associated_csc_energy = get_associated_energy(
-            associated_csc_energy, gen_muons, csc_hits
-        )
-
         outer_muon_sim_hits = csc_hits[
             (np.abs(csc_hits.pdg_id) == 13) & (csc_hits.station == 4)
         ]
-        p_at_exit = ak.ArrayBuilder()
-        p_at_exit = get_p_at_exit(p_at_exit, gen_muons, outer_muon_sim_hits)
+
+        # the ecal deposits are spread over several collections
+        detectors = (
+            (calorimeters["hcal"],),
+            tuple(calorimeters[em] for em in EM_CALORIMETERS),
+            (csc_hits,),
+            (outer_muon_sim_hits,),
+        )
+        if self._preallocate:
+            associations = muon_associations(gen_muons, *detectors)
+        else:
+            associations = get_muon_associations(
+                ak.ArrayBuilder(), gen_muons, *detectors
+            ).snapshot()
 
         muons = ak.zip(
             {
                 "p": gen_muons.p,
                 "eta": gen_muons.eta,
                 "phi": gen_muons.phi,
-                "p_exit": p_at_exit,
-                "hcal": associated_hcal_energy,
-                "ecal": associated_ecal_energy,
-                "csc": associated_csc_energy,
-                "dp": gen_muons.p - p_at_exit,
+                "p_exit": associations.p_exit,
+                "hcal": associations.hcal,
+                "ecal": associations.ecal,
+                "csc": associations.csc,
+                **{field: associations[field] for field in STATION_FIELDS},
+                "dp": gen_muons.p - associations.p_exit,
             }
         )
 
@@ -271,14 +809,23 @@ class BremsstrahlungProcessor(processor.ProcessorABC):
         for var in ["p", "dp", "phi", "eta", "hcal", "ecal", "csc"]:
             if var in ["ecal", "hcal", "csc"]:
                 # save logarithm of these energies
-                output[var] += processor.column_accumulator(
+                output[var] += ChunkedColumnAccumulator(
                     np.log10(ak.flatten(muons_w_deposits_st4[var]).to_numpy())
                 )
             else:
-                output[var] += processor.column_accumulator(
+                output[var] += ChunkedColumnAccumulator(
                     ak.flatten(muons_w_deposits_st4[var]).to_numpy()
                 )
 
+        # save the fraction of the csc energy in each station,
+        # which stays finite for stations without any associated hit
+        csc = ak.flatten(muons_w_deposits_st4.csc).to_numpy()
+        for field in STATION_FIELDS:
+            station = ak.flatten(muons_w_deposits_st4[field]).to_numpy()
+            output[field] += ChunkedColumnAccumulator(
+                np.divide(station, csc, out=np.zeros_like(station), where=csc > 0)
+            )
+
         return output
 
     def postprocess(self, accumulator):
@@ -0,0 +1,100 @@
+"""Compare the training time, throughput and resolution of the dp models."""
+import logging
+import time
+import numpy as np
+from tensorflow.keras.layers.experimental import preprocessing
+from helpers import OUTPUT_DIR
+from models import PREDICT_BATCH_SIZE, gradient_boosted_trees, neural_network
+from ntuple import read_subset
+import training_data
+
+NTUPLE = OUTPUT_DIR + "brem_dataset.parquet"
+# the forest reads the whole training set in a single epoch
+FOREST_BATCH_SIZE = 8192
+
+
+def dp_resolution(pred_dp, true_dp):
+    """
+    Get the bias and resolution of the predicted momentum loss.
+
+    param pred_dp: predicted momentum loss of each muon
+    param true_dp: true momentum loss of each muon
+    return: the median and the half width of the central 68% of the
+        relative residuals pred_dp / true_dp - 1, of the muons which lost
+        momentum
+    """
+    pred_dp, true_dp = np.ravel(pred_dp), np.ravel(true_dp)
+    # the relative residual of a muon without any loss is undefined
+    lost = true_dp != 0
+    residuals = pred_dp[lost] / true_dp[lost] - 1
+    low, median, high = np.quantile(residuals, [0.16, 0.5, 0.84])
+    return median, (high - low) / 2
+
+
+def benchmark_model(name, model, train, validation, test_features, test_labels):
+    """
+    Train a model and time its training and inference.
+
+    param name: name of the model in the log
+    param model: compiled Keras model
+    param train: training tf.data.Dataset
+    param validation: validation tf.data.Dataset, None to not validate
+    param test_features: numpy array of the features of the test muons
+    param test_labels: numpy array of the momentum loss of the test muons
+    return: dictionary of the training time, inference throughput in muons
+        per second, and bias and resolution on the test muons
+    """
+    start = time.perf_counter()
+    if validation is None:
+        model.fit(train)
+    else:
+        model.fit(train, epochs=20, validation_data=validation)
+    training_time = time.perf_counter() - start
+
+    # the first call traces the predict function
+    model.predict(test_features[:PREDICT_BATCH_SIZE], batch_size=PREDICT_BATCH_SIZE)
+    start = time.perf_counter()
+    predicts = model.predict(test_features, batch_size=PREDICT_BATCH_SIZE)
+    throughput = len(test_features) / (time.perf_counter() - start)
+
+    bias, resolution = dp_resolution(predicts, test_labels)
+    logging.info(
+        f"{name}: trained in {training_time:.1f} s, predicts {throughput:.3g} "
+        f"muons/s, dp bias {bias:.3f} and resolution {resolution:.3f}"
+    )
+    return {
+        "training_time": training_time,
+        "throughput": throughput,
+        "bias": bias,
+        "resolution": resolution,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    features = training_data.feature_columns(NTUPLE)
+    test = read_subset(NTUPLE, "test")
+    test_features = test[features].to_numpy(np.float32)
+    test_labels = test[training_data.LABEL].to_numpy()
+
+    train = training_data.dataset(NTUPLE, "train")
+    normalizer = preprocessing.Normalization(axis=-1)
+    normalizer.adapt(train.map(lambda features, label: features))
+    benchmark_model(
+        "Neural network",
+        neural_network(normalizer),
+        train,
+        training_data.dataset(NTUPLE, "validation"),
+        test_features,
+        test_labels,
+    )
+    benchmark_model(
+        "Gradient boosted trees",
+        gradient_boosted_trees(),
+        training_data.dataset(
+            NTUPLE, "train", batch_size=FOREST_BATCH_SIZE, shuffle=False
+        ),
+        None,
+        test_features,
+        test_labels,
+    )
@@ -0,0 +1,161 @@
+"""K-fold cross-validation of the momentum loss network, a fold per process."""
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers.experimental import preprocessing
+from helpers import OUTPUT_DIR, available_cores
+from models import PREDICT_BATCH_SIZE, neural_network, set_threads
+from momentum_estimator import (
+    INTERVAL_TABLE_FILE,
+    interpolate_momentum,
+    interval_metrics,
+    load_interval_table,
+)
+from ntuple import write_fold_matrix
+import training_data
+
+N_FOLDS = 5
+MATRIX_FILE = "cross_validation_matrix.npy"
+
+
+def _batches(matrix, ranges, n_features, batch_size, seed):
+    """
+    Make a generator function of the batches of ranges of matrix rows.
+
+    The rows of the matrix are already in a random order, so each epoch
+    only shuffles the order of the batches, which are views of the matrix.
+    """
+    bounds = [
+        (start, min(start + batch_size, stop))
+        for start_row, stop in ranges
+        for start in range(start_row, stop, batch_size)
+    ]
+    rng = np.random.default_rng(seed)
+
+    def generate():
+        for i in rng.permutation(len(bounds)):
+            start, stop = bounds[i]
+            # the label dp follows the features and p
+            yield matrix[start:stop, :n_features], matrix[start:stop, n_features + 1]
+
+    return generate
+
+
+def train_fold(fold, path, offsets, n_features, table, epochs, batch_size, seed):
+    """
+    Train on all folds but one and measure the momentum estimates of the other.
+
+    param fold: the fold to test on
+    param path: the .npy matrix of write_fold_matrix, of the features, p and dp
+    param offsets: first row of each fold of the matrix, and its number of rows
+    param n_features: number of feature columns of the matrix
+    param table: interval table of momentum_estimator.interval_table
+    param epochs: training epochs
+    param batch_size: rows per training batch
+    param seed: seed of the order of the batches
+    return: momentum_estimator.interval_metrics of the test fold
+    """
+    matrix = np.load(path, mmap_mode="r")
+    generate = _batches(
+        matrix,
+        [(offsets[0], offsets[fold]), (offsets[fold + 1], offsets[-1])],
+        n_features,
+        batch_size,
+        seed + fold,
+    )
+    train = tf.data.Dataset.from_generator(
+        generate,
+        output_signature=(
+            tf.TensorSpec(shape=(None, n_features), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        ),
+    ).prefetch(tf.data.AUTOTUNE)
+    normalizer = preprocessing.Normalization(axis=-1)
+    normalizer.adapt(train.map(lambda features, label: features))
+    model = neural_network(normalizer)
+    model.fit(train, epochs=epochs, verbose=0)
+
+    test = matrix[offsets[fold] : offsets[fold + 1]]
+    predicts = model.predict(test[:, :n_features], batch_size=PREDICT_BATCH_SIZE)
+    pred_p, low, high = interpolate_momentum(predicts, table)
+    # 68% interval
+    return interval_metrics(pred_p, low[:, 0], high[:, 0], test[:, n_features])
+
+
+def cross_validate(
+    ntuple,
+    table,
+    n_folds=N_FOLDS,
+    n_workers=None,
+    epochs=20,
+    batch_size=training_data.BATCH_SIZE,
+    seed=0,
+):
+    """
+    Cross-validate the momentum estimates of models.neural_network.
+
+    The features, p and dp of the ntuple are written once to a matrix
+    under OUTPUT_DIR, grouped by fold, which the worker processes
+    memory-map. Each fold trains in its own process on the cores split
+    evenly between the workers, so with a worker per fold the wall time
+    stays close to that of a single training.
+
+    param ntuple: the Parquet ntuple
+    param table: interval table of momentum_estimator.interval_table
+    param n_folds: number of folds
+    param n_workers: number of folds trained at once, by default all of them
+    param epochs: training epochs of each fold
+    param batch_size: rows per training batch
+    param seed: seed of the folds and of the order of the rows
+    return: the metrics of each fold, and the mean and standard deviation
+        over the folds of each metric
+    """
+    if n_workers is None:
+        n_workers = n_folds
+    features = training_data.feature_columns(ntuple)
+    path = OUTPUT_DIR + MATRIX_FILE
+    offsets = write_fold_matrix(path, ntuple, features + ["p", "dp"], n_folds, seed)
+    threads = max(1, available_cores() // n_workers)
+    # tensorflow doesn't survive a fork
+    with ProcessPoolExecutor(
+        n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=set_threads,
+        initargs=(threads, 1),
+    ) as pool:
+        metrics = list(
+            pool.map(
+                functools.partial(
+                    train_fold,
+                    path=path,
+                    offsets=offsets,
+                    n_features=len(features),
+                    table=table,
+                    epochs=epochs,
+                    batch_size=batch_size,
+                    seed=seed,
+                ),
+                range(n_folds),
+            )
+        )
+    summary = {
+        name: (
+            np.mean([fold[name] for fold in metrics]),
+            np.std([fold[name] for fold in metrics], ddof=1),
+        )
+        for name in metrics[0]
+    }
+    for name, (mean, std) in summary.items():
+        logging.info(f"{name}: {mean:.4f} +- {std:.4f} over {n_folds} folds")
+    return metrics, summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cross_validate(
+        OUTPUT_DIR + "brem_dataset.parquet",
+        load_interval_table(OUTPUT_DIR + INTERVAL_TABLE_FILE),
+    )
@@ -0,0 +1,229 @@
+"""NanoEvents schema grouping the flat CSCDigiTree branches into collections."""
+import re
+import awkward as ak
+from coffea.nanoevents import transforms
+from coffea.nanoevents.methods import base, candidate, vector
+from coffea.nanoevents.schemas.base import zip_forms
+from coffea.nanoevents.util import concat
+from helpers import (
+    PrunedSchema,
+    decode_chamber_id,
+    serial_to_endcap,
+    serial_to_station,
+    serial_to_ring,
+    serial_to_chamber,
+    theta_to_eta,
+)
+
+MUON_MASS = 0.105658375
+
+# the <prefix>_<field> branches of each collection, and its behavior
+MIXINS = {
+    "gen": "GenMuon",
+    "muon": "Muon",
+    "segment": "Segment",
+    "sim_hits": "SimHit",
+}
+CALO_HITS = re.compile(r"^([A-Za-z]+_calo_hits)_")
+CALO_HITS_MIXIN = "CaloHit"
+# fields which are renamed to what the behaviors expect
+RENAMED_FIELDS = {"muon": {"q": "charge"}}
+# local index branches and the collection they point into
+CROSS_REFERENCES = {"segment_mu_id": "muon"}
+
+
+behavior = {}
+behavior.update(base.behavior)
+# vector behavior is included in candidate behavior
+behavior.update(candidate.behavior)
+
+
+def _set_repr_name(classname):
+    def namefcn(self):
+        return classname
+
+    behavior[("__typestr__", classname)] = classname[0].lower() + classname[1:]
+    behavior[classname].__repr__ = namefcn
+
+
+@ak.mixin_class(behavior)
+class GenMuon(vector.PtEtaPhiMLorentzVector, base.NanoCollection):
+    """Generated muon, with the muon mass."""
+
+    @property
+    def mass(self):
+        """Muon mass, which isn't stored in the tree."""
+        return ak.full_like(self.pt, MUON_MASS)
+
+
+_set_repr_name("GenMuon")
+
+
+@ak.mixin_class(behavior)
+class Muon(candidate.PtEtaPhiMCandidate, base.NanoCollection):
+    """Reconstructed muon, with the muon mass."""
+
+    @property
+    def mass(self):
+        """Muon mass, which isn't stored in the tree."""
+        return ak.full_like(self.pt, MUON_MASS)
+
+
+_set_repr_name("Muon")
+
+
+@ak.mixin_class(behavior)
+class Segment(base.NanoCollection):
+    """CSC segment, with a reference to the muon it belongs to."""
+
+    @property
+    def muon(self):
+        """The associated muon, None for segments without one."""
+        return self._events().muon._apply_global_index(self.mu_idG)
+
+
+_set_repr_name("Segment")
+
+
+@ak.mixin_class(behavior)
+class SimHit(base.NanoCollection):
+    """CSC sim hit, with its position and chamber decoded."""
+
+    @property
+    def eta(self):
+        """Pseudorapidity at entry."""
+        return theta_to_eta(self.thetaAtEntry)
+
+    @property
+    def phi(self):
+        """Phi at entry."""
+        return self.phiAtEntry
+
+    @property
+    def endcap(self):
+        """Endcap of the chamber."""
+        return serial_to_endcap(self.ch_id)
+
+    @property
+    def station(self):
+        """Station of the chamber."""
+        return serial_to_station(self.ch_id)
+
+    @property
+    def ring(self):
+        """Ring of the chamber."""
+        return serial_to_ring(self.ch_id)
+
+    @property
+    def chamber(self):
+        """Chamber number."""
+        return serial_to_chamber(self.ch_id)
+
+    @property
+    def chamber_id(self):
+        """Endcap, station, ring, chamber and dense index, decoded together."""
+        return decode_chamber_id(self.ch_id)
+
+
+_set_repr_name("SimHit")
+
+
+@ak.mixin_class(behavior)
+class CaloHit(base.NanoCollection):
+    """Calorimeter deposit."""
+
+    @property
+    def energy(self):
+        """Total, electromagnetic and hadronic, energy."""
+        return self.energyEM + self.energyHad
+
+
+_set_repr_name("CaloHit")
+
+
+def collection_name(branch):
+    """
+    Name of the collection a branch belongs to.
+
+    return: the branch prefix, or None for a branch outside any collection
+    """
+    match = CALO_HITS.match(branch)
+    if match:
+        return match.group(1)
+    for name in MIXINS:
+        if branch.startswith(name + "_"):
+            return name
+    return None
+
+
+def offsets_form(form):
+    """Form of the offsets of a jagged branch."""
+    return {
+        "class": "NumpyArray",
+        "itemsize": 8,
+        "format": "i",
+        "primitive": "int64",
+        "form_key": concat(form["form_key"], "!offsets"),
+    }
+
+
+class CSCDigiTreeSchema(PrunedSchema):
+    """
+    CSCDigiTree schema builder.
+
+    Groups the <prefix>_<field> branches into lazily read collections:
+    gen and muon (Lorentz vectors with the muon mass), segment (with a
+    muon reference from mu_id), sim_hits and <calorimeter>_calo_hits.
+    Other branches are kept as they are. Subclass with `branches` set to
+    only read those.
+    """
+
+    branches = None
+
+    def __init__(self, base_form):
+        """Build the collections from the branches."""
+        super().__init__(base_form)
+        self._form["contents"] = self._build_collections(self._form["contents"])
+
+    def _build_collections(self, branch_forms):
+        # uproot writes an n<branch> counter with each jagged branch
+        branch_forms = {
+            branch: form
+            for branch, form in branch_forms.items()
+            if not (branch.startswith("n") and branch[1:] in branch_forms)
+        }
+        collections = {}
+        output = {}
+        for branch, form in branch_forms.items():
+            name = collection_name(branch)
+            if name is None:
+                output[branch] = form
+            else:
+                collections.setdefault(name, {})[branch[len(name) + 1 :]] = form
+
+        # turn the local indices into global ones, to take from the target
+        for indexer, target in CROSS_REFERENCES.items():
+            name = collection_name(indexer)
+            field = indexer[len(name) + 1 :]
+            if field in collections.get(name, {}) and target in collections:
+                target_form = next(iter(collections[target].values()))
+                collections[name][field + "G"] = transforms.local2global_form(
+                    collections[name][field], offsets_form(target_form)
+                )
+
+        for name, fields in collections.items():
+            renamed = RENAMED_FIELDS.get(name, {})
+            output[name] = zip_forms(
+                {renamed.get(field, field): form for field, form in fields.items()},
+                name,
+                record_name=MIXINS.get(name, CALO_HITS_MIXIN),
+            )
+            output[name]["content"].setdefault("parameters", {})
+            output[name]["content"]["parameters"]["collection_name"] = name
+
+        return output
+
+    @property
+    def behavior(self):
+        """Behaviors necessary to implement this schema."""
+        return behavior
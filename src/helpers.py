@@ -1,10 +1,28 @@
 """Helper functions for processing data."""
+import logging
+import math
+import os
+import awkward as ak
+import numba
 import numpy as np
-import scipy
+from coffea.nanoevents import BaseSchema
+from scipy.optimize import curve_fit
 
 OUTPUT_DIR = "../output/"
 
 
+def available_cores():
+    """
+    Get the number of cores the process may run on.
+
+    It is fewer than the cores of the node when the batch system pins the
+    job to some of them, which is only known on Linux.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
 def serial_to_endcap(x: int) -> int:
     """Convert serialized chamber id to endcap."""
     return (x >> 10) + 1
@@ -25,25 +43,251 @@ def serial_to_chamber(x: int) -> int:
     return (x & 0x0000003F) + 1
 
 
-def theta_to_eta(theta: float) -> float:
-    """Convert theta to pseudorapidity eta."""
-    return -np.log(np.tan(theta / 2.0))
+# the serialized chamber id has 11 bits
+N_CHAMBER_IDS = 1 << 11
+# chambers in each (station, ring), ring 4 is ME1/1a
+CHAMBERS_PER_RING = {
+    (1, 1): 36,
+    (1, 2): 36,
+    (1, 3): 36,
+    (1, 4): 36,
+    (2, 1): 18,
+    (2, 2): 36,
+    (3, 1): 18,
+    (3, 2): 36,
+    (4, 1): 18,
+    (4, 2): 36,
+}
+# padded to 8 bytes, so the table can be gathered from as int64
+CHAMBER_ID_DTYPE = np.dtype(
+    {
+        "names": ["endcap", "station", "ring", "chamber", "index"],
+        "formats": [np.int8, np.int8, np.int8, np.int8, np.int16],
+        "itemsize": 8,
+    }
+)
+
+
+def chamber_id_table():
+    """
+    Decode every serialized chamber id.
+
+    return: structured array indexed by the serialized id, with the
+        endcap, station, ring, chamber and a dense index of the
+        chamber, -1 for ids of chambers which don't exist
+    """
+    ch_id = np.arange(N_CHAMBER_IDS)
+    table = np.zeros(N_CHAMBER_IDS, dtype=CHAMBER_ID_DTYPE)
+    table["endcap"] = serial_to_endcap(ch_id)
+    table["station"] = serial_to_station(ch_id)
+    table["ring"] = serial_to_ring(ch_id)
+    table["chamber"] = serial_to_chamber(ch_id)
+    table["index"] = -1
+    index = 0
+    for endcap in (1, 2):
+        for (station, ring), n_chambers in CHAMBERS_PER_RING.items():
+            chambers = (
+                (table["endcap"] == endcap)
+                & (table["station"] == station)
+                & (table["ring"] == ring)
+                & (table["chamber"] <= n_chambers)
+            )
+            table["index"][chambers] = (
+                index + table["chamber"][chambers].astype(np.int16) - 1
+            )
+            index += n_chambers
+    return table
+
+
+CHAMBER_ID_TABLE = chamber_id_table()
+N_CHAMBERS = int(np.max(CHAMBER_ID_TABLE["index"])) + 1
+
+
+def decode_chamber_id(ch_id):
+    """
+    Decode serialized chamber ids with a single gather from CHAMBER_ID_TABLE.
+
+    param ch_id: numpy array, or flat or jagged awkward array, of ids
+    return: structured numpy array, or awkward record array of the same
+        shape, of endcap, station, ring, chamber and index
+    raise ValueError: if an id is outside of [0, N_CHAMBER_IDS), such as
+        a negative fill value, which the gather would decode as another
+        chamber or fail on
+    """
+    if not isinstance(ch_id, ak.Array):
+        ch_id = np.asarray(ch_id)
+        if ch_id.size and (ch_id.min() < 0 or ch_id.max() >= N_CHAMBER_IDS):
+            raise ValueError(
+                f"Chamber ids must be in [0, {N_CHAMBER_IDS}), got ids in "
+                f"[{ch_id.min()}, {ch_id.max()}]"
+            )
+        return CHAMBER_ID_TABLE.view(np.int64)[ch_id].view(CHAMBER_ID_DTYPE)
+    if ch_id.ndim == 1:
+        return ak.from_numpy(decode_chamber_id(ak.to_numpy(ch_id)))
+    decoded = decode_chamber_id(ak.flatten(ch_id))
+    return ak.unflatten(decoded, ak.num(ch_id))
+
+
+def _in_place(ufunc, x, *args, out=None):
+    """Apply a ufunc into out, or in place if x is a numpy array which can hold the result."""
+    if out is not None:
+        return ufunc(x, *args, out=out)
+    if (
+        isinstance(x, np.ndarray)
+        and x.dtype.kind == "f"
+        and not any(isinstance(arg, ak.Array) for arg in args)
+        and np.result_type(x, *args) == x.dtype
+        and np.broadcast(x, *args).shape == x.shape
+    ):
+        return ufunc(x, *args, out=x)
+    return ufunc(x, *args)
+
+
+def theta_to_eta(theta: float, out=None) -> float:
+    """
+    Convert theta to pseudorapidity eta.
+
+    The steps are done in place, so numpy arrays only need the one buffer.
+
+    param out: numpy array to write the result to
+    """
+    eta = np.multiply(theta, 0.5, out=out)
+    eta = _in_place(np.tan, eta, out=out)
+    eta = _in_place(np.log, eta, out=out)
+    return _in_place(np.negative, eta, out=out)
+
+
+def eta_to_theta(eta: float, out=None) -> float:
+    """
+    Convert pseudorapidity eta to theta.
+
+    param out: numpy array to write the result to
+    """
+    theta = np.negative(eta, out=out)
+    theta = _in_place(np.exp, theta, out=out)
+    theta = _in_place(np.arctan, theta, out=out)
+    return _in_place(np.multiply, theta, 2.0, out=out)
+
+
+def pt_eta_to_p(pt: float, eta: float, out=None) -> float:
+    """
+    Convert transverse momentum and pseudorapidity to momentum.
+
+    The momentum is computed in float64, as float32 rounds the cosh(eta)
+    of forward muons by up to a few MeV.
+
+    param out: numpy array to write the result to
+    """
+    if isinstance(eta, ak.Array):
+        eta = ak.values_astype(eta, np.float64)
+    else:
+        eta = np.asarray(eta, dtype=np.float64)
+    # sin(eta_to_theta(eta)) is 1 / cosh(eta)
+    p = np.cosh(eta, out=out)
+    return _in_place(np.multiply, p, pt, out=out)
+
+
+# the Moyal kernels are ufuncs, which can also be called from numba kernels
+MOYAL_SIGNATURES = ["float64(float64, float64, float64)"]
+LOG_SQRT_2PI = 0.5 * math.log(2 * math.pi)
+# below this the Moyal pdf underflows to zero, and exp(-z) would overflow
+MOYAL_MIN_Z = -50.0
+
+
+@numba.vectorize(MOYAL_SIGNATURES)
+def moyal_pdf(x, loc, scale):
+    """Moyal pdf, as scipy.stats.moyal.pdf, nan for a scale which isn't positive."""
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    if z < MOYAL_MIN_Z:
+        return 0.0
+    return math.exp(-0.5 * (z + math.exp(-z))) / math.sqrt(2 * math.pi) / scale
+
+
+@numba.vectorize(MOYAL_SIGNATURES)
+def moyal_logpdf(x, loc, scale):
+    """Log of the Moyal pdf, as scipy.stats.moyal.logpdf but finite where the pdf underflows."""
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    return -0.5 * (z + math.exp(-z)) - LOG_SQRT_2PI - math.log(scale)
+
+
+@numba.vectorize(MOYAL_SIGNATURES)
+def moyal_cdf(x, loc, scale):
+    """Moyal cdf, as scipy.stats.moyal.cdf."""
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    if z < MOYAL_MIN_Z:
+        return 0.0
+    return math.erfc(math.exp(-0.5 * z) / math.sqrt(2))
+
+
+@numba.vectorize(MOYAL_SIGNATURES)
+def _moyal_logpdf_dloc(x, loc, scale):
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    return 0.5 * (1 - math.exp(-z)) / scale
+
 
+@numba.vectorize(MOYAL_SIGNATURES)
+def _moyal_logpdf_dscale(x, loc, scale):
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    return (0.5 * (1 - math.exp(-z)) * z - 1) / scale
 
-def eta_to_theta(eta: float) -> float:
-    """Convert pseudorapidity eta to theta."""
-    return 2.0 * np.arctan(np.exp(-eta))
 
+@numba.vectorize(MOYAL_SIGNATURES)
+def _moyal_pdf_dloc(x, loc, scale):
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    if z < MOYAL_MIN_Z:
+        return 0.0
+    exp_z = math.exp(-z)
+    pdf = math.exp(-0.5 * (z + exp_z)) / math.sqrt(2 * math.pi) / scale
+    return pdf * 0.5 * (1 - exp_z) / scale
 
-def pt_eta_to_p(pt: float, eta: float) -> float:
-    """Convert transverse momentum and pseudorapidity to momentum."""
-    return pt / np.sin(eta_to_theta(eta))
+
+@numba.vectorize(MOYAL_SIGNATURES)
+def _moyal_pdf_dscale(x, loc, scale):
+    if not scale > 0:
+        return np.nan
+    z = (x - loc) / scale
+    if z < MOYAL_MIN_Z:
+        return 0.0
+    exp_z = math.exp(-z)
+    pdf = math.exp(-0.5 * (z + exp_z)) / math.sqrt(2 * math.pi) / scale
+    return pdf * (0.5 * (1 - exp_z) * z - 1) / scale
+
+
+def moyal_logpdf_gradient(x, loc, scale):
+    """
+    Derivatives of the log of the Moyal pdf.
+
+    return: derivatives by loc and by scale
+    """
+    return _moyal_logpdf_dloc(x, loc, scale), _moyal_logpdf_dscale(x, loc, scale)
+
+
+def moyal_pdf_gradient(x, loc, scale):
+    """
+    Derivatives of the Moyal pdf.
+
+    return: derivatives by loc and by scale
+    """
+    return _moyal_pdf_dloc(x, loc, scale), _moyal_pdf_dscale(x, loc, scale)
 
 
 def landau(X, mean_offset, mean_slope, scale_slope, norm):
     """
     Landau pdf as a function of energy loss and muon momentum.
 
+    The pdf is the Moyal pdf of moyal_pdf.
     https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.moyal.html#scipy.stats.moyal
 
     param x: x data to fit to
@@ -57,6 +301,58 @@ def landau(X, mean_offset, mean_slope, scale_slope, norm):
     return: probability of the energy loss de at a given e
     """
     dp, p = X
-    return norm * scipy.stats.moyal.pdf(
-        dp, loc=(mean_offset + mean_slope * p), scale=(scale_slope * p)
+    return norm * moyal_pdf(dp, mean_offset + mean_slope * p, scale_slope * p)
+
+
+class PrunedSchema(BaseSchema):
+    """
+    BaseSchema keeping only the branches a processor declares.
+
+    Only the branches in the form can be read, so a processor can't pay
+    for the I/O of one it doesn't use. Subclass with `branches` set,
+    None keeps all of them.
+    """
+
+    branches = None
+
+    def __init__(self, base_form):
+        """Drop the branches which aren't declared from the form."""
+        if self.branches is None:
+            super().__init__(base_form)
+            return
+        contents = base_form["contents"]
+        missing = [branch for branch in self.branches if branch not in contents]
+        if missing:
+            raise KeyError(f"Branches {missing} are not in the tree")
+        super().__init__(
+            dict(
+                base_form,
+                contents={branch: contents[branch] for branch in self.branches},
+            )
+        )
+
+
+def log_metrics(metrics):
+    """
+    Log the I/O of a run_uproot_job with savemetrics.
+
+    param metrics: the metrics returned alongside the output
+    """
+    logging.info(
+        f"Read {metrics['bytesread'] / 1e6:.1f} MB in {metrics['chunks']} chunks "
+        f"({metrics['bytesread'] / max(metrics['chunks'], 1) / 1e6:.1f} MB per chunk) "
+        f"from {len(metrics['columns'])} columns"
     )
+
+
+def gauss(x, H, A, x0, sigma):
+    """Gaussian function."""
+    return H + A * np.exp(-((x - x0) ** 2) / (2 * sigma**2))
+
+
+def gauss_fit(x, y):
+    """Fit a Gaussian to a sett of x/y points."""
+    mean = sum(x * y) / sum(y)
+    sigma = np.sqrt(sum(y * (x - mean) ** 2) / sum(y))
+    popt, pcov = curve_fit(gauss, x, y, p0=[min(y), max(y), mean, sigma])
+    return popt
@@ -0,0 +1,180 @@
+"""NumPy-only inference of the trained momentum loss models."""
+import numpy as np
+
+MODEL_FILE = "momentum_loss_model.npz"
+# the tf.keras.backend.epsilon floor of the Normalization standard deviation
+NORMALIZATION_EPSILON = 1e-7
+# rows evaluated at once, bounding the memory of the hidden layers
+BATCH_SIZE = 65536
+
+
+def _elu(x):
+    """Exponential linear unit, with alpha 1 as in Keras."""
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+
+def _sigmoid(x):
+    """Logistic function."""
+    return 1 / (1 + np.exp(-x))
+
+
+def _relu(x):
+    """Rectified linear unit."""
+    return np.maximum(x, 0)
+
+
+def _linear(x):
+    """Identity."""
+    return x
+
+
+def _tanh(x):
+    """Hyperbolic tangent."""
+    return np.tanh(x)
+
+
+ACTIVATIONS = {
+    "linear": _linear,
+    "relu": _relu,
+    "elu": _elu,
+    "tanh": _tanh,
+    "sigmoid": _sigmoid,
+}
+
+
+class DenseModel:
+    """A normalizer and stack of dense layers, evaluated with NumPy."""
+
+    def __init__(self, kernels, biases, activations, mean, variance, features=None):
+        """
+        Initialize.
+
+        param kernels: weight matrix of each dense layer
+        param biases: bias vector of each dense layer
+        param activations: name of the activation of each dense layer
+        param mean: mean of each feature
+        param variance: variance of each feature
+        param features: names of the feature columns
+        """
+        self.kernels = [np.asarray(kernel, dtype=np.float32) for kernel in kernels]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        unknown = set(activations) - set(ACTIVATIONS)
+        if unknown:
+            raise ValueError(f"Unknown activations {sorted(unknown)}")
+        self.activations = list(activations)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.variance = np.asarray(variance, dtype=np.float32)
+        self.scale = np.maximum(np.sqrt(self.variance), NORMALIZATION_EPSILON)
+        self.features = features
+        # the Landau fit parameters, if stored along
+        self.popt = None
+
+    def save(self, path):
+        """
+        Write the model to a single npz file, read back by load_model.
+
+        param path: the npz file to write
+        """
+        arrays = {
+            "activations": np.array(self.activations, dtype=str),
+            "mean": self.mean,
+            "variance": self.variance,
+        }
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            arrays[f"kernel_{i}"] = kernel
+            arrays[f"bias_{i}"] = bias
+        if self.features is not None:
+            arrays["features"] = np.array(self.features, dtype=str)
+        if self.popt is not None:
+            arrays["popt"] = self.popt
+        np.savez(path, **arrays)
+
+    def predict(self, features, batch_size=BATCH_SIZE):
+        """
+        Evaluate the model.
+
+        param features: array of the features of each muon
+        param batch_size: rows evaluated at once
+        return: array of the outputs of each muon, shaped as by Keras predict
+        """
+        features = np.asarray(features, dtype=np.float32)
+        outputs = np.empty((len(features), self.kernels[-1].shape[1]), dtype=np.float32)
+        for start in range(0, len(features), batch_size):
+            x = (features[start : start + batch_size] - self.mean) / self.scale
+            for kernel, bias, activation in zip(
+                self.kernels, self.biases, self.activations
+            ):
+                x = ACTIVATIONS[activation](x @ kernel + bias)
+            outputs[start : start + batch_size] = x
+        return outputs
+
+    def predict_columns(self, columns, batch_size=BATCH_SIZE):
+        """
+        Evaluate the model on named columns, as in a processor output.
+
+        param columns: dictionary, or DataFrame, of columns including features
+        param batch_size: rows evaluated at once
+        return: array of the outputs of each muon, shaped as by Keras predict
+        """
+        return self.predict(
+            np.stack([columns[name] for name in self.features], axis=-1), batch_size
+        )
+
+
+def load_model(path):
+    """
+    Read a model written by DenseModel.save or export_model.
+
+    param path: the npz file
+    return: DenseModel, with the Landau fit parameters as popt
+    """
+    with np.load(path) as arrays:
+        activations = arrays["activations"].tolist()
+        model = DenseModel(
+            [arrays[f"kernel_{i}"] for i in range(len(activations))],
+            [arrays[f"bias_{i}"] for i in range(len(activations))],
+            activations,
+            arrays["mean"],
+            arrays["variance"],
+            arrays["features"].tolist() if "features" in arrays else None,
+        )
+        if "popt" in arrays:
+            model.popt = arrays["popt"]
+    return model
+
+
+def export_model(model, path, features, popt=None):
+    """
+    Write a model of models.py to a single npz file.
+
+    Only the Normalization statistics and the Dense weights and activations
+    are stored, so the model can be evaluated by DenseModel without
+    TensorFlow.
+
+    param model: Sequential model of a Normalization and Dense layers
+    param path: the npz file to write
+    param features: names of the feature columns, in the order of the inputs
+    param popt: Landau fit parameters stored along, if not None
+    return: the DenseModel written
+    """
+    kernels, biases, activations = [], [], []
+    mean = variance = None
+    for layer in model.layers:
+        name = type(layer).__name__
+        if name == "Normalization":
+            mean, variance = np.ravel(layer.mean), np.ravel(layer.variance)
+        elif name == "Dense":
+            kernel, bias = layer.get_weights()
+            kernels.append(kernel)
+            biases.append(bias)
+            activations.append(layer.get_config()["activation"])
+        else:
+            raise ValueError(f"Cannot export a {name} layer")
+    if mean is None:
+        # no normalization
+        mean, variance = np.zeros(len(features)), np.ones(len(features))
+    dense_model = DenseModel(kernels, biases, activations, mean, variance, features)
+    if popt is not None:
+        dense_model.popt = np.asarray(popt, dtype=np.float64)
+    dense_model.save(path)
+    return dense_model
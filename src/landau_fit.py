@@ -0,0 +1,306 @@
+"""Fits of the momentum dependent Landau model of dp to dp vs p data."""
+import numba
+import numpy as np
+from scipy.optimize import curve_fit
+from helpers import landau, moyal_pdf, moyal_pdf_gradient
+
+N_PARAMETERS = 4
+# bins expecting fewer events are left out of the chi2, as they blow it up
+MIN_EXPECTED = 1e-2
+# range of the Levenberg-Marquardt damping of the unbinned fit
+MIN_DAMPING = 1e-4
+MAX_DAMPING = 1e10
+
+
+def histogram_values(histogram):
+    """
+    Get the counts of a p vs dp histogram as a 2D array.
+
+    param histogram: coffea histogram with only the p and dp axes
+    return: counts indexed by (p bin, dp bin), and the dp and p bin centers
+    """
+    values = histogram.values()
+    if len(values) != 1:
+        raise RuntimeError("Unexpected > 1 number of sparse axes in dp vs p graph")
+    (counts,) = values.values()
+    return (
+        counts,
+        histogram.axis("dp").centers(),
+        histogram.axis("p").centers(),
+    )
+
+
+def landau_jacobian(X, mean_offset, mean_slope, scale_slope, norm):
+    """
+    Derivatives of the Landau model of helpers.landau by its parameters.
+
+    param X: dp and p, of any broadcastable shapes
+    return: array of the broadcast shape with a last axis of the
+        derivatives by mean_offset, mean_slope, scale_slope and norm
+    """
+    dp, p = X
+    loc = mean_offset + mean_slope * p
+    scale = scale_slope * p
+    d_loc, d_scale = moyal_pdf_gradient(dp, loc, scale)
+    return np.stack(
+        np.broadcast_arrays(
+            norm * d_loc,
+            norm * d_loc * p,
+            norm * d_scale * p,
+            moyal_pdf(dp, loc, scale),
+        ),
+        axis=-1,
+    )
+
+
+def initial_parameters(counts, dp, p):
+    """
+    Estimate the parameters from the moments of dp in each p bin.
+
+    param counts: counts indexed by (p bin, dp bin)
+    param dp: dp bin centers
+    param p: p bin centers
+    return: mean_offset, mean_slope, scale_slope and norm
+    """
+    n = counts.sum(axis=1)
+    filled = n > 0
+    mean = counts[filled] @ dp / n[filled]
+    variance = counts[filled] @ dp**2 / n[filled] - mean**2
+    # the Moyal variance is pi^2 scale^2 / 2 and its mean is
+    # loc + (euler_gamma + log(2)) scale
+    scale = np.sqrt(2 * np.maximum(variance, 0)) / np.pi
+    loc = mean - (np.euler_gamma + np.log(2)) * scale
+    weights = np.sqrt(n[filled])
+    if np.count_nonzero(filled) > 1:
+        mean_slope, mean_offset = np.polyfit(p[filled], loc, 1, w=weights)
+    else:
+        mean_slope, mean_offset = 0.0, loc[0]
+    scale_slope = max(np.average(scale / p[filled], weights=weights), 1e-6)
+    shape = landau(np.meshgrid(dp, p), mean_offset, mean_slope, scale_slope, 1.0).sum()
+    return np.array([mean_offset, mean_slope, scale_slope, counts.sum() / shape])
+
+
+def _poisson_nll(counts, expected):
+    """Negative log likelihood of the counts, up to a constant."""
+    return np.sum(
+        expected - counts * np.log(np.maximum(expected, np.finfo(float).tiny))
+    )
+
+
+def _fit_poisson(counts, X, p0, max_iterations, tolerance):
+    """
+    Maximize the Poisson likelihood of the counts by Fisher scoring.
+
+    The Newton steps with the expected Hessian are invariant to the very
+    different scales of the parameters, and are halved until the
+    likelihood improves with a positive scale.
+    """
+    popt = np.asarray(p0, dtype=float)
+    expected = landau(X, *popt)
+    nll = _poisson_nll(counts, expected)
+    for _ in range(max_iterations):
+        jacobian = landau_jacobian(X, *popt).reshape(-1, N_PARAMETERS)
+        mu = np.maximum(expected.ravel(), np.finfo(float).tiny)
+        gradient = jacobian.T @ (1 - counts.ravel() / mu)
+        fisher = (jacobian.T / mu) @ jacobian
+        step = np.linalg.lstsq(fisher, gradient, rcond=None)[0]
+        for _ in range(50):
+            trial = popt - step
+            if trial[2] > 0:
+                trial_expected = landau(X, *trial)
+                trial_nll = _poisson_nll(counts, trial_expected)
+                if trial_nll <= nll:
+                    break
+            step = step / 2
+        else:
+            break
+        popt, expected = trial, trial_expected
+        converged = nll - trial_nll < tolerance * (1 + abs(trial_nll))
+        nll = trial_nll
+        if converged:
+            break
+    jacobian = landau_jacobian(X, *popt).reshape(-1, N_PARAMETERS)
+    mu = np.maximum(expected.ravel(), np.finfo(float).tiny)
+    pcov = np.linalg.pinv((jacobian.T / mu) @ jacobian)
+    return popt, pcov
+
+
+def fit_landau(
+    counts,
+    dp,
+    p,
+    p0=None,
+    likelihood="poisson",
+    max_iterations=100,
+    tolerance=1e-10,
+):
+    """
+    Fit the Landau model to the counts of a p vs dp histogram.
+
+    The model and its derivatives are evaluated on the whole (p, dp) grid
+    at once.
+
+    param counts: counts indexed by (p bin, dp bin)
+    param dp: dp bin centers
+    param p: p bin centers
+    param p0: starting parameters, estimated from the counts if None
+    param likelihood: "poisson" for a Poisson likelihood fit, or "chi2"
+        for a least squares fit with sqrt(counts) errors, which is
+        biased where there are few counts
+    param max_iterations: maximum number of steps of the Poisson fit
+    param tolerance: relative change of the likelihood at convergence
+    return: fitted mean_offset, mean_slope, scale_slope and norm,
+        their covariance, and the Pearson chi2 and number of degrees of
+        freedom of the bins expecting at least MIN_EXPECTED counts
+    """
+    counts = np.asarray(counts, dtype=float)
+    X = np.meshgrid(dp, p)
+    if p0 is None:
+        p0 = initial_parameters(counts, np.asarray(dp), np.asarray(p))
+    if likelihood == "poisson":
+        popt, pcov = _fit_poisson(counts, X, p0, max_iterations, tolerance)
+    elif likelihood == "chi2":
+        X = tuple(np.ravel(x) for x in X)
+        popt, pcov = curve_fit(
+            landau,
+            X,
+            counts.ravel(),
+            p0=p0,
+            sigma=np.sqrt(np.maximum(counts.ravel(), 1)),
+            absolute_sigma=True,
+            jac=landau_jacobian,
+            bounds=([-np.inf, -np.inf, 0, 0], np.inf),
+        )
+    else:
+        raise ValueError(f"Unknown likelihood {likelihood}")
+    expected = landau(X, *popt).reshape(counts.shape)
+    used = expected > MIN_EXPECTED
+    chi2 = np.sum((counts[used] - expected[used]) ** 2 / expected[used])
+    ndf = np.count_nonzero(used) - N_PARAMETERS
+    return popt, pcov, chi2, ndf
+
+
+# the negative log likelihood, its gradient and its Hessian, summed over the muons
+N_UNBINNED_TERMS = 1 + 3 + 3 * 3
+
+
+@numba.njit(parallel=True)
+def _unbinned_terms(dp, p, mean_offset, mean_slope, scale_slope, n_blocks):
+    """
+    Sum the unbinned likelihood terms over the muons, on parallel threads.
+
+    Each thread sums a block of the muons, and the partial sums are added.
+
+    return: array of the N_UNBINNED_TERMS sums, without the constant
+        log(2 pi) / 2 per muon of the negative log likelihood
+    """
+    partial = np.zeros((n_blocks, N_UNBINNED_TERMS))
+    size = (len(dp) + n_blocks - 1) // n_blocks
+    for block in numba.prange(n_blocks):
+        # derivatives of z by the parameters
+        dz = np.empty(3)
+        d2z = np.empty((3, 3))
+        terms = partial[block]
+        for i in range(block * size, min(len(dp), (block + 1) * size)):
+            scale = scale_slope * p[i]
+            z = (dp[i] - (mean_offset + mean_slope * p[i])) / scale
+            exp_z = np.exp(-z)
+            # -log(pdf) is (z + exp(-z)) / 2 + log(scale)
+            terms[0] += 0.5 * (z + exp_z) + np.log(scale)
+            dz[0] = -1 / scale
+            dz[1] = -p[i] / scale
+            dz[2] = -z / scale_slope
+            d2z[0, 0] = d2z[0, 1] = d2z[1, 0] = d2z[1, 1] = 0
+            d2z[0, 2] = d2z[2, 0] = 1 / (scale * scale_slope)
+            d2z[1, 2] = d2z[2, 1] = p[i] / (scale * scale_slope)
+            d2z[2, 2] = 2 * z / scale_slope**2
+            for j in range(3):
+                gradient_j = 0.5 * (1 - exp_z) * dz[j] + (j == 2) / scale_slope
+                terms[1 + j] += gradient_j
+                for k in range(3):
+                    terms[4 + 3 * j + k] += (
+                        0.5 * exp_z * dz[j] * dz[k]
+                        + 0.5 * (1 - exp_z) * d2z[j, k]
+                        - (j == 2 and k == 2) / scale_slope**2
+                    )
+    return partial.sum(axis=0)
+
+
+def landau_nll(dp, p, mean_offset, mean_slope, scale_slope, n_blocks=None):
+    """
+    Unbinned negative log likelihood of the Landau model of dp.
+
+    param dp: momentum loss of each muon
+    param p: momentum of each muon
+    param n_blocks: number of blocks the muons are split into, the number
+        of numba threads if None
+    return: the negative log likelihood, and its gradient and Hessian by
+        mean_offset, mean_slope and scale_slope
+    """
+    if n_blocks is None:
+        n_blocks = numba.get_num_threads()
+    terms = _unbinned_terms(
+        np.ascontiguousarray(dp, dtype=np.float64),
+        np.ascontiguousarray(p, dtype=np.float64),
+        mean_offset,
+        mean_slope,
+        scale_slope,
+        n_blocks,
+    )
+    nll = terms[0] + 0.5 * np.log(2 * np.pi) * len(dp)
+    return nll, terms[1:4], terms[4:].reshape(3, 3)
+
+
+def fit_landau_unbinned(
+    dp, p, p0=None, n_blocks=None, max_iterations=100, tolerance=1e-10
+):
+    """
+    Fit the Landau model to the dp and p of each muon by maximum likelihood.
+
+    The likelihood is maximized by Newton steps, damped as by
+    Levenberg-Marquardt until the likelihood improves with a positive
+    scale. Far from the minimum the Hessian isn't positive definite, as
+    the left tail of the pdf falls double exponentially.
+
+    param dp: momentum loss of each muon
+    param p: momentum of each muon
+    param p0: starting mean_offset, mean_slope and scale_slope, estimated
+        from the moments of dp in bins of p if None
+    param n_blocks: number of blocks the muons are split into for the
+        parallel sums, the number of numba threads if None
+    param max_iterations: maximum number of steps
+    param tolerance: relative change of the likelihood at convergence
+    return: fitted mean_offset, mean_slope and scale_slope, and their
+        covariance
+    """
+    dp = np.asarray(dp, dtype=np.float64)
+    p = np.asarray(p, dtype=np.float64)
+    if p0 is None:
+        counts, dp_edges, p_edges = np.histogram2d(dp, p, bins=(100, 100))
+        p0 = initial_parameters(
+            counts.T,
+            (dp_edges[1:] + dp_edges[:-1]) / 2,
+            (p_edges[1:] + p_edges[:-1]) / 2,
+        )[:3]
+    popt = np.asarray(p0, dtype=np.float64)
+    nll, gradient, hessian = landau_nll(dp, p, *popt, n_blocks=n_blocks)
+    for _ in range(max_iterations):
+        scaling = np.diag(np.abs(np.diag(hessian)))
+        damping = 0.0
+        while damping < MAX_DAMPING:
+            matrix = hessian + damping * scaling
+            if np.all(np.linalg.eigvalsh(matrix) > 0):
+                trial = popt - np.linalg.solve(matrix, gradient)
+                if trial[2] > 0:
+                    trial_terms = landau_nll(dp, p, *trial, n_blocks=n_blocks)
+                    if trial_terms[0] <= nll:
+                        break
+            damping = max(10 * damping, MIN_DAMPING)
+        else:
+            break
+        converged = nll - trial_terms[0] < tolerance * (1 + abs(trial_terms[0]))
+        popt = trial
+        nll, gradient, hessian = trial_terms
+        if converged:
+            break
+    return popt, np.linalg.pinv(hessian)
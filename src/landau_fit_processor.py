@@ -2,10 +2,18 @@
 import glob
 import matplotlib.pyplot as plt
 import coffea.processor as processor
-from coffea.nanoevents import BaseSchema
-from bremsstrahlung_processor import BremsstrahlungProcessor
-from helpers import landau, OUTPUT_DIR
-from scipy.optimize import curve_fit
+from bremsstrahlung_processor import BremsstrahlungProcessor, BremsstrahlungSchema
+from helpers import landau, log_metrics, OUTPUT_DIR
+from landau_fit import (
+    fit_landau,
+    fit_landau_unbinned,
+    histogram_values,
+)
+from momentum_estimator import (
+    INTERVAL_TABLE_FILE,
+    interval_table,
+    save_interval_table,
+)
 import numpy as np
 import logging
 import pickle
@@ -17,38 +25,19 @@ files = glob.glob("/eos/cms/store/user/wnash/CSCDigiTree-PDFSet12.root")
 
 fileset = {"dummy": files}
 
-out = processor.run_uproot_job(
+out, metrics = processor.run_uproot_job(
     fileset=fileset,
     treename="CSCDigiTree",
     processor_instance=BremsstrahlungProcessor(),
     executor=processor.futures_executor,
     # executor=processor.iterative_executor,
-    executor_args={"schema": BaseSchema, "workers": 8},
+    executor_args={"schema": BremsstrahlungSchema, "workers": 8, "savemetrics": True},
 )
+log_metrics(metrics)
 
 
-# get arrays of p, dp, and the effective probabilities
-# (number of events in each bin)
-for i, (_, values) in enumerate(out["p_loss"].project("p", "dp").values().items()):
-    if i > 0:
-        raise RuntimeError("Unexpected > 1 number of sparse axes in dp vs p graph")
-    else:
-        dp_vs_p_data = values
-
-dp_axis = out["p_loss"].project("p", "dp").axis("dp").centers()
-p_axis = out["p_loss"].project("p", "dp").axis("p").centers()
-
-
-# now make a single matrix which has all the relevant parameters:
-dp_data = []
-p_data = []
-ydata = []
-for i, dp in enumerate(dp_axis):
-    for j, p in enumerate(p_axis):
-        p_data.append(p)
-        dp_data.append(dp)
-        ydata.append(dp_vs_p_data[j][i])
-xdata = (np.array(dp_data), np.array(p_data))
+# get the number of events in each (p, dp) bin
+dp_vs_p_data, dp_axis, p_axis = histogram_values(out["p_loss"].project("p", "dp"))
 
 # we know that dp should be distributed
 # according to the Landau distribution
@@ -56,27 +45,23 @@ xdata = (np.array(dp_data), np.array(p_data))
 # mean and scale parameters are linearly
 # dependent on the momentum and fit the distribution
 # accordingly.
-popt, pcov = curve_fit(landau, xdata, np.array(ydata))
-
-chi_2 = 0
-ndf = len(ydata) - 4
-for y, dp, p in zip(ydata, dp_data, p_data):
-    e = landau((dp, p), *popt)
-    if e > 1e-2:  # stop div by zero issues
-        chi_2 += (y - e) / e
-    logging.info(y, e)
+popt, pcov, chi_2, ndf = fit_landau(dp_vs_p_data, dp_axis, p_axis)
+
 logging.info(f"Fit distribution: {popt}")
+logging.info(f"\t uncertainties: {np.sqrt(np.diag(pcov))}")
 logging.info(f"\t chi_2: {chi_2}, chi_2/ndf: {chi_2/ndf}")
 
+# compare with the unbinned fit to the dp and p of each muon,
+# which doesn't depend on the binning
+popt_unbinned, pcov_unbinned = fit_landau_unbinned(out["dp"].value, out["p"].value)
+logging.info(f"Unbinned fit: {popt_unbinned}")
+logging.info(f"\t uncertainties: {np.sqrt(np.diag(pcov_unbinned))}")
+
 
 fig, ax = plt.subplots()
 
 momenta = (400, 1200, 2000, 2800, 3600)
-for p in momenta:
-    fit_y = []
-    for dp in dp_axis:
-        fit_y.append(landau((dp, p), *popt))
-    ax.plot(dp_axis, np.array(fit_y))
+ax.plot(dp_axis, landau(np.meshgrid(dp_axis, momenta), *popt).T)
 ax.legend([f"$p$ = {p} GeV" for p in momenta])
 plt.xlabel("$\\Delta p$ [GeV]")
 plt.ylabel("Density (A.U.)")
@@ -87,11 +72,7 @@ fig.clear(True)
 fig, ax = plt.subplots()
 
 dps = (5, 10, 20, 50, 100)
-for dp in dps:
-    fit_y = []
-    for p in p_axis:
-        fit_y.append(landau((dp, p), *popt))
-    ax.plot(p_axis, np.array(fit_y))
+ax.plot(p_axis, landau(np.meshgrid(dps, p_axis), *popt))
 
 ax.legend([f"$\\Delta p$ = {dp} GeV" for dp in dps])
 plt.xlabel("$p$ [GeV]")
@@ -103,3 +84,6 @@ for suffix in (".png", ".pdf"):
 with open(OUTPUT_DIR + "landau_fit_parameters.pkl", "wb") as f:
     # Pickle the 'data' dictionary using the highest protocol available.
     pickle.dump(popt, f, pickle.HIGHEST_PROTOCOL)
+
+# tabulate the momentum estimate of this fit for each predicted dp
+save_interval_table(interval_table(popt), OUTPUT_DIR + INTERVAL_TABLE_FILE)
@@ -1,93 +1,99 @@
 """Learn muon momentum loss using energy deposits in the detector."""
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import awkward as ak
-import numba
-from helpers import landau, OUTPUT_DIR
-import keras_tuner as kt
+from helpers import OUTPUT_DIR, gauss_fit
+from momentum_estimator import (
+    INTERVAL_TABLE_FILE,
+    MIN,
+    MAX,
+    P_AXIS,
+    interpolate_momentum,
+    load_interval_table,
+    neg2_delta_log_likelihood,
+)
+from inference import MODEL_FILE, export_model
+from ntuple import read_subset
+import training_data
+import tuning
 from coffea import hist
 from tensorflow.keras.layers.experimental import preprocessing
 from matplotlib import colors
-import scipy.stats as st
-from models import neural_network
-import scipy
+from models import (
+    PREDICT_BATCH_SIZE,
+    ThroughputLogger,
+    neural_network,
+    set_threads,
+)
 import pickle
 import logging
 
 
-def gauss(x, H, A, x0, sigma):
-    """Gaussian function."""
-    return H + A * np.exp(-((x - x0) ** 2) / (2 * sigma ** 2))
-
-
-def gauss_fit(x, y):
-    """Fit a Gaussian to a sett of x/y points."""
-    mean = sum(x * y) / sum(y)
-    sigma = np.sqrt(sum(y * (x - mean) ** 2) / sum(y))
-    popt, pcov = scipy.optimize.curve_fit(gauss, x, y, p0=[min(y), max(y), mean, sigma])
-    return popt
-
-
-MIN = 0
-MAX = 4000
-
 # warning: reading untrusted pickled files is *not* safe
 
 # load the landau fit parameters
 with open(OUTPUT_DIR + "landau_fit_parameters.pkl", "rb") as f:
     popt = pickle.load(f)
 
-dataset = pd.read_pickle(OUTPUT_DIR + "brem_dataset.pkl")
+NTUPLE = OUTPUT_DIR + "brem_dataset.parquet"
 
-train_dataset = dataset.sample(frac=0.8, random_state=1)
-test_dataset = dataset.drop(train_dataset.index)
+# compile the model with XLA, use the cores given to the job and report
+# the samples per second of training and inference
+performance = False
+callbacks = []
+if performance:
+    set_threads()
+    callbacks.append(ThroughputLogger(training_data.BATCH_SIZE))
 
-train_features = train_dataset.copy()
-test_features = test_dataset.copy()
+# stream the training and validation sets, split by a hash of each muon,
+# so they need not fit in memory
+train_dataset = training_data.dataset(NTUPLE, "train")
+validation_dataset = training_data.dataset(NTUPLE, "validation")
 
-# get the momentum (not used for training)
-train_p = train_features.pop("p")
-test_p = test_features.pop("p")
-
-# get the momentum loss (training labels)
-train_labels = train_features.pop("dp")
-test_labels = test_features.pop("dp")
+# the features are eta, phi, the log of the calorimeter and csc energies
+# and the fraction of the csc energy in each station; the momentum is not
+# used for training and the momentum loss is the label
 
 # normalize the features such that it has mean 0, std 1
 normalizer = preprocessing.Normalization(axis=-1)
-normalizer.adapt(np.array(train_features))
+normalizer.adapt(train_dataset.map(lambda features, label: features))
 
 tune = False
 if tune:
-
-    def neural_network_with_normalizer(hp):
-        return neural_network(normalizer, hp)
-
-    # scan over possible hyper-parameters to find the best ones
-    tuner = kt.Hyperband(
-        neural_network_with_normalizer,
-        objective="val_loss",
-        max_epochs=20,
-        factor=3,
-        directory=OUTPUT_DIR,
-        project_name="hyperparameter_scan",
+    # load the best model of the scan over possible hyper-parameters run
+    # by tuning.py, with trials running at once in worker processes
+    tuner = tuning.hyperband(
+        tuning.NormalizedHyperModel(normalizer.mean, normalizer.variance)
     )
-
-    tuner.search(train_features, train_labels, epochs=10, validation_split=0.2)
-    model = tuner.get_best_models()[0]
+    best_models = tuner.get_best_models()
+    if not best_models:
+        raise RuntimeError(
+            f"No trials in {OUTPUT_DIR + tuning.PROJECT_NAME}, "
+            "run the scan first with python tuning.py"
+        )
+    model = best_models[0]
 else:
-    model = neural_network(normalizer=normalizer)
+    model = neural_network(normalizer=normalizer, jit_compile=performance)
 
 
 model.fit(
-    train_features,
-    train_labels,
-    epochs=20,
-    # Calculate validation results on 20% of the training data
-    validation_split=0.2,
+    train_dataset, epochs=20, validation_data=validation_dataset, callbacks=callbacks
+)
+# for the coffea processors, which evaluate it without tensorflow
+export_model(
+    model, OUTPUT_DIR + MODEL_FILE, training_data.feature_columns(NTUPLE), popt
+)
+
+test_features = read_subset(NTUPLE, "test")
+test_p = test_features.pop("p")
+test_labels = test_features.pop(training_data.LABEL)
+if performance:
+    callbacks = [ThroughputLogger(PREDICT_BATCH_SIZE)]
+predicts = model.predict(
+    test_features[training_data.feature_columns(NTUPLE)].to_numpy(np.float32),
+    batch_size=PREDICT_BATCH_SIZE,
+    callbacks=callbacks,
 )
-predicts = model.predict(test_features)
 
 
 fig, ax = plt.subplots()
@@ -109,7 +115,14 @@ plt.plot(lims, lims, color="black", linestyle="--")
 for suffix in (".png", ".pdf"):
     plt.savefig(OUTPUT_DIR + "predicted_vs_true_dp" + suffix)
 
-p_axis = np.array([p for p in range(MIN + 10, MAX, 10)])
+# interpolate the momentum estimate of every test muon
+# from the table made with the landau fit
+pred_dp = np.ravel(predicts)
+true_p = test_p.to_numpy()
+table = load_interval_table(OUTPUT_DIR + INTERVAL_TABLE_FILE)
+pred_p, low, high = interpolate_momentum(pred_dp, table)
+# 68% interval
+low, high = low[:, 0], high[:, 0]
 
 
 fig, ax = plt.subplots()
@@ -120,79 +133,32 @@ res_hist = hist.Hist(
     hist.Bin("p", "True $p$ [GeV]", 50, MIN, MAX),
     hist.Bin("pred_p", "Predicted $p$ [GeV]", 50, MIN, MAX),
 )
-
-# Calculate -2 ln L
-in_count = 0
-count = 0
-for pred_dp, true_p in zip(predicts, test_p):
-    if not count % 1000:
-        logging.info(f"Completed: {count}")
-
-    # Define a pdf for p given this momentum loss
-    class landau_p_pdf(st.rv_continuous):
-        def _pdf(self, x):
-            # norm = scipy.integrate.quad(lambda z: landau((pred_dp, z), *popt), 0, 1e5)
-            # return landau((pred_dp, x), *popt) / norm
-            return landau((pred_dp, x), *popt)
-
-    cv = landau_p_pdf(a=MIN, b=MAX, name="landau_p_pdf")
-
-    ydata = []
-    for p in p_axis:
-        ydata.append(-2 * cv.logpdf(p))
-    ydata = np.array(ydata)
-    ydata -= min(ydata)
-
-    @numba.njit
-    def find_bounds(ydata, xdata, ypoint=1):
-        """
-        Find where they array (assumed concave with one minimum) reaches the given number.
-
-        ydata: array of y points
-        xdata: array of x points
-        ypoint: look for where the ydata is equal to this point
-                for -2ln(L), 1 corresponds to 68%, 3.84 corresponds to 95%
-
-        pred_p is the location in x of the min y
-        """
-        pred_p = xdata[np.argmin(ydata)]
-        low = high = -999.0
-        for i, point in enumerate(ydata):
-            if low == high and point <= ypoint:
-                low = xdata[i]
-            if low != high and point > ypoint:
-                high = xdata[i - 1]
-                break
-        if high == -999.0:
-            high = xdata[-1]
-        return pred_p, low, high
-
-    pred_p, low, high = find_bounds(ydata, p_axis, 1.0)  # 68%
-
-    res_hist.fill(res_norm=(pred_p - true_p) / (high - low), pred_p=pred_p, p=true_p)
-
-    if count < 10:
-        fig.clear(True)
-        fig, ax = plt.subplots()
-        ax.plot(p_axis, np.array(ydata))
-        plt.xlabel("$p$ [GeV]")
-        plt.ylabel("$-2\\Delta ln\\mathcal{L}$")
-        ll_ybounds = [-1, 10]
-        plt.ylim(ll_ybounds)
-        plt.plot([true_p, true_p], ll_ybounds, color="black")
-        plt.plot([pred_p, pred_p], ll_ybounds, color="black", linestyle="--", alpha=0.5)
-        plt.plot([low, low], ll_ybounds, color="red", linestyle="--")
-        plt.plot([high, high], ll_ybounds, color="red", linestyle="--")
-        ax.legend(
-            ["Landau fit", "True momentum", "Predicted momentum", "$68\\%$ interval"]
-        )
-        for suffix in (".png", ".pdf"):
-            plt.savefig(OUTPUT_DIR + "momentum_pdf_" + str(count) + suffix)
-
-    count += 1
-    if true_p <= high and true_p >= low:
-        in_count += 1
-logging.info(f"Fraction in interval: {1.*in_count/(count)}")
+res_hist.fill(res_norm=(pred_p - true_p) / (high - low), pred_p=pred_p, p=true_p)
+
+for count, ydata in enumerate(neg2_delta_log_likelihood(pred_dp[:10], popt)):
+    fig.clear(True)
+    fig, ax = plt.subplots()
+    ax.plot(P_AXIS, ydata)
+    plt.xlabel("$p$ [GeV]")
+    plt.ylabel("$-2\\Delta ln\\mathcal{L}$")
+    ll_ybounds = [-1, 10]
+    plt.ylim(ll_ybounds)
+    plt.plot([true_p[count], true_p[count]], ll_ybounds, color="black")
+    plt.plot(
+        [pred_p[count], pred_p[count]],
+        ll_ybounds,
+        color="black",
+        linestyle="--",
+        alpha=0.5,
+    )
+    plt.plot([low[count], low[count]], ll_ybounds, color="red", linestyle="--")
+    plt.plot([high[count], high[count]], ll_ybounds, color="red", linestyle="--")
+    ax.legend(["Landau fit", "True momentum", "Predicted momentum", "$68\\%$ interval"])
+    for suffix in (".png", ".pdf"):
+        plt.savefig(OUTPUT_DIR + "momentum_pdf_" + str(count) + suffix)
+
+in_interval = (true_p <= high) & (true_p >= low)
+logging.info(f"Fraction in interval: {np.mean(in_interval)}")
 
 fig.clear()
 ax = hist.plot1d(res_hist.project("res_norm"), overflow="all")
@@ -1,6 +1,86 @@
 """Machine learning models."""
+import logging
+import time
 import tensorflow as tf
+import tensorflow_decision_forests as tfdf
 from tensorflow.keras import layers
+from helpers import available_cores
+
+# batch size of model.predict, which has no gradients to keep in memory
+PREDICT_BATCH_SIZE = 8192
+
+
+def set_threads(intra_op=None, inter_op=2):
+    """
+    Set the CPU threads of tensorflow, before it runs any operation.
+
+    By default tensorflow uses a thread per core of the node, even when
+    the batch system only gives the job a few of them.
+
+    param intra_op: threads within an operation, by default one per
+        core the process may run on
+    param inter_op: operations running at once
+    """
+    if intra_op is None:
+        intra_op = available_cores()
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Log the samples per second of each training epoch and prediction."""
+
+    def __init__(self, batch_size):
+        """
+        Initialize.
+
+        param batch_size: samples per batch, the last batch may be smaller
+        """
+        super().__init__()
+        self.batch_size = batch_size
+        self.samples_per_second = {"train": [], "predict": []}
+
+    def _begin(self):
+        self._batches = 0
+        self._start = self._last = time.perf_counter()
+
+    def _count(self):
+        self._batches += 1
+        self._last = time.perf_counter()
+
+    def _end(self, mode):
+        if not self._batches:
+            return
+        # up to the end of the last batch, leaving out the validation
+        samples_per_second = (
+            self._batches * self.batch_size / (self._last - self._start)
+        )
+        self.samples_per_second[mode].append(samples_per_second)
+        logging.info(f"{mode}: {samples_per_second:.4g} samples/s")
+
+    def on_epoch_begin(self, epoch, logs=None):
+        """Start timing the epoch."""
+        self._begin()
+
+    def on_train_batch_end(self, batch, logs=None):
+        """Count the batch."""
+        self._count()
+
+    def on_epoch_end(self, epoch, logs=None):
+        """Log the samples per second of the epoch."""
+        self._end("train")
+
+    def on_predict_begin(self, logs=None):
+        """Start timing the prediction."""
+        self._begin()
+
+    def on_predict_batch_end(self, batch, logs=None):
+        """Count the batch."""
+        self._count()
+
+    def on_predict_end(self, logs=None):
+        """Log the samples per second of the prediction."""
+        self._end("predict")
 
 
 def quantile_loss(y_true, y_pred, tau):
@@ -27,8 +107,52 @@ def fractional_quantile_loss(y_true, y_pred, tau):
     )
 
 
-def quantile_neural_network(normalizer, tau=0.5, hp=None):
-    """Get the neural network model which calculates a quantile loss."""
+class FractionalQuantileLoss(tf.keras.losses.Loss):
+    """
+    Sum of the fractional_quantile_loss of each column of the predictions,
+    plus with monotonic the amount by which each quantile exceeds the
+    next one, as a penalty so the quantiles don't cross.
+
+    Unlike a lambda over the loss functions it is traced once into the
+    training graph, fused by XLA, and serialized with the model.
+    """
+
+    def __init__(
+        self, taus=(0.5,), monotonic=False, name="fractional_quantile_loss", **kwargs
+    ):
+        """
+        Initialize.
+
+        param taus: quantile of each column of the predictions, in order
+        param monotonic: penalize quantiles exceeding the next one
+        """
+        super().__init__(name=name, **kwargs)
+        self.taus = [float(tau) for tau in taus]
+        self.monotonic = monotonic
+
+    def call(self, y_true, y_pred):
+        """Loss of each sample."""
+        y_true = tf.reshape(tf.cast(y_true, y_pred.dtype), [-1, 1])
+        taus = tf.constant(self.taus, dtype=y_pred.dtype)
+        e = y_pred - y_true
+        loss = tf.reduce_sum(
+            tf.maximum((taus * e) / y_true, ((taus - 1) * e) / y_true), axis=-1
+        )
+        if self.monotonic:
+            crossing = tf.maximum(y_pred[:, :-1] - y_pred[:, 1:], 0.0)
+            loss += tf.reduce_sum(crossing, axis=-1) / y_true[:, 0]
+        return loss
+
+    def get_config(self):
+        """Configuration to serialize the loss with the model."""
+        return {**super().get_config(), "taus": self.taus, "monotonic": self.monotonic}
+
+
+def quantile_neural_network(normalizer, tau=0.5, hp=None, jit_compile=False):
+    """
+    Get the neural network model which calculates a quantile loss,
+    compiled with XLA if jit_compile.
+    """
     if hp is None:
         activation = "relu"
         units = 416
@@ -58,14 +182,15 @@ def quantile_neural_network(normalizer, tau=0.5, hp=None):
 
     nn_model.compile(
         optimizer=tf.optimizers.Adam(learning_rate=learning_rate),
-        loss=lambda y, y_p: fractional_quantile_loss(y, y_p, tau=tau),
+        jit_compile=jit_compile,
+        loss=FractionalQuantileLoss(taus=[tau]),
     )
 
     return nn_model
 
 
-def neural_network(normalizer, hp=None):
-    """Get the neural network model."""
+def neural_network(normalizer, hp=None, jit_compile=False):
+    """Get the neural network model, compiled with XLA if jit_compile."""
     if hp is None:
         activation = "relu"
         units = 32
@@ -97,6 +222,83 @@ def neural_network(normalizer, hp=None):
 
     nn_model.compile(
         optimizer=tf.optimizers.Adam(learning_rate=learning_rate),
+        jit_compile=jit_compile,
         loss="mean_absolute_percentage_error",
     )
     return nn_model
+
+
+def multi_quantile_neural_network(
+    normalizer, taus=(0.16, 0.5, 0.84), monotonic=True, hp=None, jit_compile=False
+):
+    """
+    Get the neural network model which calculates several quantiles at once.
+
+    The dense layers are shared, and each unit of the output layer is the
+    head of one of the taus, in increasing order, so one pass predicts
+    the median and the 68% band of the default taus. It is compiled with
+    XLA if jit_compile.
+    """
+    taus = sorted(taus)
+    if hp is None:
+        activation = "relu"
+        units = 416
+        depth = 3
+        learning_rate = 1e-3
+    else:
+        # Tune the number of units
+        # Choose an optimal value between 32-512
+        activation = hp.Choice("activation", values=["relu", "elu"])
+        units = hp.Int("units", min_value=32, max_value=512, step=32)
+        depth = hp.Int("depth", min_value=1, max_value=5)
+        learning_rate = hp.Choice("learning_rate", values=[1e-1, 1e-2, 1e-3, 1e-4])
+
+    dense_layers = []
+    for _ in range(depth):
+        dense_layers.append(layers.Dense(units=units, activation=activation))
+
+    nn_model = tf.keras.Sequential(
+        [
+            normalizer,
+        ]
+        + dense_layers
+        + [
+            layers.Dense(units=len(taus), activation="relu"),
+        ]
+    )
+
+    nn_model.compile(
+        optimizer=tf.optimizers.Adam(learning_rate=learning_rate),
+        jit_compile=jit_compile,
+        loss=FractionalQuantileLoss(taus=taus, monotonic=monotonic),
+    )
+
+    return nn_model
+
+
+def gradient_boosted_trees(hp=None):
+    """
+    Get the gradient boosted trees model.
+
+    Trees don't need normalized features, so it takes the raw features of
+    the same datasets as the neural networks. It trains in a single epoch,
+    best on large unshuffled batches.
+    """
+    if hp is None:
+        num_trees = 300
+        max_depth = 6
+        shrinkage = 0.1
+    else:
+        num_trees = hp.Int("num_trees", min_value=100, max_value=1000, step=100)
+        max_depth = hp.Int("max_depth", min_value=3, max_value=10)
+        shrinkage = hp.Choice("shrinkage", values=[0.02, 0.05, 0.1, 0.2])
+
+    forest_model = tfdf.keras.GradientBoostedTreesModel(
+        task=tfdf.keras.Task.REGRESSION,
+        num_trees=num_trees,
+        max_depth=max_depth,
+        shrinkage=shrinkage,
+    )
+
+    forest_model.compile(metrics=["mean_absolute_percentage_error"])
+    return forest_model
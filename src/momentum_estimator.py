@@ -0,0 +1,387 @@
+"""Estimate muon momentum, with intervals, from the predicted momentum loss."""
+import numba
+import numpy as np
+from helpers import gauss_fit, landau, moyal_logpdf
+
+# momentum range of the scan, in GeV
+MIN = 0
+MAX = 4000
+P_AXIS = np.arange(MIN + 10, MAX, 10)
+# -2 delta ln L of the 68% and 95% intervals
+LEVELS = (1.0, 3.84)
+# muons evaluated at once, bounding the (muons x momenta) buffers
+CHUNK_SIZE = 10000
+
+
+def neg2_delta_log_likelihood(pred_dp, popt, p_axis=P_AXIS):
+    """
+    Evaluate -2 delta ln L of the Landau model on a grid of momenta.
+
+    param pred_dp: predicted momentum loss of each muon
+    param popt: fitted parameters of helpers.landau
+    param p_axis: momenta to evaluate the likelihood at
+    return: array of (muons, momenta), shifted to a minimum of zero for
+        each muon
+    """
+    pred_dp = np.reshape(pred_dp, (-1, 1))
+    with np.errstate(divide="ignore"):
+        neg2_log_l = -2 * np.log(landau((pred_dp, p_axis), *popt))
+    neg2_log_l -= np.min(neg2_log_l, axis=1, keepdims=True)
+    return neg2_log_l
+
+
+@numba.njit
+def find_bounds(neg2_log_l, p_axis, levels):
+    """
+    Find where each row of -2 delta ln L, with one minimum, crosses the levels.
+
+    param neg2_log_l: array of (muons, momenta)
+    param p_axis: momenta of the columns
+    param levels: values of -2 delta ln L to look for, 1 corresponds to
+        68% and 3.84 to 95%
+    return: momentum at the minimum of each muon, and the lowest momentum
+        below each level and the last one before it is exceeded again, of
+        (muons, levels). The low bound is -999 if there is none, the high
+        one the last momentum if the level isn't exceeded again.
+    """
+    n_muons = neg2_log_l.shape[0]
+    pred_p = np.empty(n_muons)
+    low = np.empty((n_muons, len(levels)))
+    high = np.empty((n_muons, len(levels)))
+    for muon in range(n_muons):
+        row = neg2_log_l[muon]
+        pred_p[muon] = p_axis[np.argmin(row)]
+        for level in range(len(levels)):
+            low[muon, level] = -999.0
+            high[muon, level] = p_axis[-1]
+            found_low = False
+            for i in range(len(row)):
+                if not found_low:
+                    if row[i] <= levels[level]:
+                        low[muon, level] = p_axis[i]
+                        found_low = True
+                elif row[i] > levels[level]:
+                    high[muon, level] = p_axis[i - 1]
+                    break
+    return pred_p, low, high
+
+
+def estimate_momentum(
+    pred_dp, popt, p_axis=P_AXIS, levels=LEVELS, chunk_size=CHUNK_SIZE
+):
+    """
+    Estimate the momentum of each muon by a likelihood scan.
+
+    The likelihood is evaluated on the (muons x momenta) grid in chunks
+    of muons, and its crossings found by a single compiled kernel.
+
+    param pred_dp: predicted momentum loss of each muon
+    param popt: fitted parameters of helpers.landau
+    param p_axis: momenta to scan
+    param levels: values of -2 delta ln L of the intervals
+    param chunk_size: muons evaluated at once
+    return: maximum likelihood momentum of each muon, and the low and high
+        bounds of its intervals, of (muons, levels)
+    """
+    pred_dp = np.ravel(pred_dp)
+    p_axis = np.asarray(p_axis, dtype=np.float64)
+    levels = np.asarray(levels, dtype=np.float64)
+    pred_p = np.empty(len(pred_dp))
+    low = np.empty((len(pred_dp), len(levels)))
+    high = np.empty((len(pred_dp), len(levels)))
+    for start in range(0, len(pred_dp), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        pred_p[chunk], low[chunk], high[chunk] = find_bounds(
+            neg2_delta_log_likelihood(pred_dp[chunk], popt, p_axis), p_axis, levels
+        )
+    return pred_p, low, high
+
+
+# momenta of the coarse scan bracketing the minimum and crossings
+N_COARSE = 41
+# tolerance, in GeV, and maximum iterations of the root finding
+XTOL = 1e-6
+MAX_ITERATIONS = 100
+
+
+@numba.njit
+def _objective(derivative, p, dp, popt, target):
+    """
+    -2 ln L of the momentum p minus target, or its derivative by p.
+
+    The log of the pdf stays finite where the pdf underflows, so the
+    crossings can be bracketed anywhere.
+    """
+    mean_offset, mean_slope, scale_slope, norm = popt[0], popt[1], popt[2], popt[3]
+    if derivative:
+        z = (dp - (mean_offset + mean_slope * p)) / (scale_slope * p)
+        # d ln L / dp, from those by the location and scale
+        d_log_l = (0.5 * (1 - np.exp(-z)) * (z + mean_slope / scale_slope) - 1) / p
+        return -2 * d_log_l
+    log_l = np.log(norm) + moyal_logpdf(
+        dp, mean_offset + mean_slope * p, scale_slope * p
+    )
+    return -2 * log_l - target
+
+
+@numba.njit
+def _brentq(derivative, x_pre, x_cur, f_pre, f_cur, dp, popt, target, xtol):
+    """
+    Find the root of _objective between x_pre and x_cur by Brent's method.
+
+    This follows scipy.optimize.brentq, with f_pre and f_cur of opposite
+    signs the values at the ends.
+    """
+    if f_pre == 0:
+        return x_pre
+    if f_cur == 0:
+        return x_cur
+    x_blk = f_blk = s_pre = s_cur = 0.0
+    for _ in range(MAX_ITERATIONS):
+        if f_pre != 0 and f_cur != 0 and (f_pre < 0) != (f_cur < 0):
+            x_blk, f_blk = x_pre, f_pre
+            s_pre = s_cur = x_cur - x_pre
+        if abs(f_blk) < abs(f_cur):
+            x_pre, x_cur, x_blk = x_cur, x_blk, x_cur
+            f_pre, f_cur, f_blk = f_cur, f_blk, f_cur
+        delta = (xtol + 4 * np.finfo(np.float64).eps * abs(x_cur)) / 2
+        s_bis = (x_blk - x_cur) / 2
+        if f_cur == 0 or abs(s_bis) < delta:
+            return x_cur
+        if abs(s_pre) > delta and abs(f_cur) < abs(f_pre):
+            if x_pre == x_blk:
+                # secant
+                s_try = -f_cur * (x_cur - x_pre) / (f_cur - f_pre)
+            else:
+                # inverse quadratic interpolation
+                d_pre = (f_pre - f_cur) / (x_pre - x_cur)
+                d_blk = (f_blk - f_cur) / (x_blk - x_cur)
+                s_try = (
+                    -f_cur
+                    * (f_blk * d_blk - f_pre * d_pre)
+                    / (d_blk * d_pre * (f_blk - f_pre))
+                )
+            if 2 * abs(s_try) < min(abs(s_pre), 3 * abs(s_bis) - delta):
+                s_pre, s_cur = s_cur, s_try
+            else:
+                s_pre = s_cur = s_bis
+        else:
+            s_pre = s_cur = s_bis
+        x_pre, f_pre = x_cur, f_cur
+        if abs(s_cur) > delta:
+            x_cur += s_cur
+        else:
+            x_cur += delta if s_bis > 0 else -delta
+        f_cur = _objective(derivative, x_cur, dp, popt, target)
+    return x_cur
+
+
+@numba.njit
+def _crossing(p_nodes, y_nodes, start, step, dp, popt, target, level, xtol):
+    """
+    Find where -2 delta ln L first exceeds the level, walking from the minimum.
+
+    param p_nodes: momenta of the coarse scan, and of the minimum
+    param y_nodes: -2 delta ln L at p_nodes
+    param start: index of the minimum in the nodes
+    param step: -1 to walk to lower momenta, 1 to higher ones
+    return: momentum of the crossing, or of the last node if there is none
+    """
+    i = start
+    while 0 <= i + step < len(p_nodes):
+        if y_nodes[i + step] > level:
+            return _brentq(
+                False,
+                p_nodes[i],
+                p_nodes[i + step],
+                y_nodes[i] - level,
+                y_nodes[i + step] - level,
+                dp,
+                popt,
+                target + level,
+                xtol,
+            )
+        i += step
+    return p_nodes[i]
+
+
+@numba.njit(parallel=True)
+def _refine(pred_dp, popt, p_coarse, levels, xtol):
+    """Refine the minimum and crossings of each muon, on parallel threads."""
+    n_muons = len(pred_dp)
+    n_coarse = len(p_coarse)
+    pred_p = np.empty(n_muons)
+    low = np.empty((n_muons, len(levels)))
+    high = np.empty((n_muons, len(levels)))
+    for muon in numba.prange(n_muons):
+        dp = pred_dp[muon]
+        y = np.empty(n_coarse)
+        for i in range(n_coarse):
+            y[i] = _objective(False, p_coarse[i], dp, popt, 0.0)
+        k = np.argmin(y)
+        # the minimum is where the derivative changes sign next to the
+        # coarse one, or at the edge of the range
+        p_hat, y_hat = p_coarse[k], y[k]
+        for j in (k - 1, k):
+            if 0 <= j and j + 1 < n_coarse:
+                g_low = _objective(True, p_coarse[j], dp, popt, 0.0)
+                g_high = _objective(True, p_coarse[j + 1], dp, popt, 0.0)
+                if g_low < 0 < g_high:
+                    root = _brentq(
+                        True,
+                        p_coarse[j],
+                        p_coarse[j + 1],
+                        g_low,
+                        g_high,
+                        dp,
+                        popt,
+                        0.0,
+                        xtol,
+                    )
+                    y_root = _objective(False, root, dp, popt, 0.0)
+                    if y_root < y_hat:
+                        p_hat, y_hat = root, y_root
+        pred_p[muon] = p_hat
+        # nodes of the coarse scan, with the minimum inserted in order
+        start = np.searchsorted(p_coarse, p_hat)
+        p_nodes = np.empty(n_coarse + 1)
+        y_nodes = np.empty(n_coarse + 1)
+        p_nodes[:start] = p_coarse[:start]
+        y_nodes[:start] = y[:start] - y_hat
+        p_nodes[start] = p_hat
+        y_nodes[start] = 0.0
+        p_nodes[start + 1 :] = p_coarse[start:]
+        y_nodes[start + 1 :] = y[start:] - y_hat
+        for level in range(len(levels)):
+            low[muon, level] = _crossing(
+                p_nodes, y_nodes, start, -1, dp, popt, y_hat, levels[level], xtol
+            )
+            high[muon, level] = _crossing(
+                p_nodes, y_nodes, start, 1, dp, popt, y_hat, levels[level], xtol
+            )
+    return pred_p, low, high
+
+
+def refine_momentum(
+    pred_dp,
+    popt,
+    p_range=(P_AXIS[0], P_AXIS[-1]),
+    levels=LEVELS,
+    n_coarse=N_COARSE,
+    xtol=XTOL,
+):
+    """
+    Estimate the momentum of each muon by root finding on the likelihood.
+
+    A coarse scan brackets the minimum and the crossings of each level,
+    which Brent's method then locates to xtol. Unlike the scan of
+    estimate_momentum, the precision doesn't depend on a grid.
+
+    param pred_dp: predicted momentum loss of each muon
+    param popt: fitted parameters of helpers.landau
+    param p_range: lowest and highest momentum
+    param levels: values of -2 delta ln L of the intervals
+    param n_coarse: momenta of the coarse scan
+    param xtol: tolerance of the momenta, in GeV
+    return: maximum likelihood momentum of each muon, and the low and high
+        bounds of its intervals, of (muons, levels). The bounds are at
+        the edges of the range if the level isn't crossed before them.
+    """
+    return _refine(
+        np.ascontiguousarray(np.ravel(pred_dp), dtype=np.float64),
+        np.asarray(popt, dtype=np.float64),
+        np.linspace(p_range[0], p_range[1], n_coarse),
+        np.asarray(levels, dtype=np.float64),
+        xtol,
+    )
+
+
+# predicted momentum losses of the interval table, in GeV, denser at low dp
+# where the estimate changes fastest
+DP_GRID = np.linspace(0, np.sqrt(200), 4001) ** 2
+INTERVAL_TABLE_FILE = "landau_interval_table.npz"
+
+
+def interval_table(
+    popt, dp_grid=DP_GRID, p_range=(P_AXIS[0], P_AXIS[-1]), levels=LEVELS
+):
+    """
+    Tabulate the momentum estimate on a grid of predicted momentum loss.
+
+    The estimate only depends on the predicted dp and the fitted
+    parameters, so it can be computed once per fit. It is found by
+    refine_momentum, so the table doesn't have the steps of a scan.
+
+    param popt: fitted parameters of helpers.landau
+    param dp_grid: increasing predicted momentum losses to tabulate
+    param p_range: lowest and highest momentum
+    param levels: values of -2 delta ln L of the intervals
+    return: dictionary of the dp grid, the levels, and the maximum
+        likelihood momentum and low and high bounds at each dp
+    """
+    pred_p, low, high = refine_momentum(dp_grid, popt, p_range, levels)
+    return {
+        "dp": np.asarray(dp_grid, dtype=np.float64),
+        "levels": np.asarray(levels, dtype=np.float64),
+        "pred_p": pred_p,
+        "low": low,
+        "high": high,
+    }
+
+
+def save_interval_table(table, filename):
+    """Save an interval table, next to the fit parameters it was made from."""
+    np.savez(filename, **table)
+
+
+def load_interval_table(filename):
+    """Load an interval table saved by save_interval_table."""
+    with np.load(filename) as table:
+        return {name: table[name] for name in table.files}
+
+
+def interpolate_momentum(pred_dp, table):
+    """
+    Estimate the momentum of each muon by interpolating an interval table.
+
+    Predicted dp outside of the table take the estimate at its edge.
+
+    param pred_dp: predicted momentum loss of each muon
+    param table: interval table of interval_table
+    return: maximum likelihood momentum of each muon, and the low and high
+        bounds of its intervals, of (muons, levels)
+    """
+    pred_dp = np.ravel(pred_dp)
+    dp = table["dp"]
+    pred_p = np.interp(pred_dp, dp, table["pred_p"])
+    low = np.stack(
+        [np.interp(pred_dp, dp, column) for column in table["low"].T], axis=-1
+    )
+    high = np.stack(
+        [np.interp(pred_dp, dp, column) for column in table["high"].T], axis=-1
+    )
+    return pred_p, low, high
+
+
+def interval_metrics(pred_p, low, high, true_p, bins=100, res_range=(-3, 3)):
+    """
+    Measure the resolution and coverage of momentum estimates.
+
+    param pred_p: estimated momentum of each muon
+    param low: low bound of the interval of each muon
+    param high: high bound of the interval of each muon
+    param true_p: true momentum of each muon
+    param bins: number of bins of the res_norm histogram
+    param res_range: range of the res_norm histogram
+    return: dictionary of the fraction of muons in their interval, and
+        the mean and width of a Gaussian fit to the histogram of
+        res_norm, (pred_p - true_p) / (high - low)
+    """
+    res_norm = (pred_p - true_p) / (high - low)
+    counts, edges = np.histogram(res_norm, bins=bins, range=res_range)
+    H, A, x0, sigma = gauss_fit((edges[1:] + edges[:-1]) / 2, counts)
+    return {
+        "fraction_in_interval": np.mean((true_p >= low) & (true_p <= high)),
+        "res_norm_mean": x0,
+        "res_norm_sigma": abs(sigma),
+    }
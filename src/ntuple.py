@@ -0,0 +1,231 @@
+"""Columnar ntuples of the processor outputs, stored as Parquet files."""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# rows per row group, the default chunksize of processor.run_uproot_job
+ROW_GROUP_SIZE = 100000
+# columns identifying a muon, which are hashed to split the rows
+SPLIT_COLUMNS = ("p", "eta", "phi")
+# range of the hash fraction of the rows of each subset
+SUBSETS = {"test": (0.0, 0.2), "validation": (0.2, 0.36), "train": (0.36, 1.0)}
+
+
+class NtupleWriter:
+    """
+    Writes a table of columns to a Parquet file, a row group at a time.
+
+    Use as a context manager, which closes the file.
+    """
+
+    def __init__(self, path, columns, dtype=np.float64):
+        """
+        Initialize.
+
+        param path: the Parquet file to write
+        param columns: names of the columns
+        param dtype: type of the columns
+        """
+        self.schema = pa.schema(
+            [(column, pa.from_numpy_dtype(dtype)) for column in columns]
+        )
+        # the floats hardly repeat, so dictionary encoding only costs time
+        self._writer = pq.ParquetWriter(path, self.schema, use_dictionary=False)
+
+    def __enter__(self):
+        """Return the writer."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the file."""
+        self.close()
+
+    def write(self, columns):
+        """
+        Append a row group.
+
+        param columns: dictionary of column name to numpy array
+        """
+        self._writer.write_table(
+            pa.table(
+                [np.asarray(columns[field.name]) for field in self.schema],
+                schema=self.schema,
+            )
+        )
+
+    def close(self):
+        """Finish the file."""
+        self._writer.close()
+
+
+def write_ntuple(path, columns, row_group_size=ROW_GROUP_SIZE):
+    """
+    Write columns to a Parquet file.
+
+    Only a row group of the columns is in memory at once, so memory-mapped
+    columns are streamed to the file.
+
+    param path: the Parquet file to write
+    param columns: dictionary of column name to numpy array, of equal lengths
+    param row_group_size: rows per row group
+    """
+    length = len(next(iter(columns.values())))
+    dtype = np.result_type(*columns.values())
+    with NtupleWriter(path, list(columns), dtype) as writer:
+        for start in range(0, length, row_group_size):
+            writer.write(
+                {
+                    column: values[start : start + row_group_size]
+                    for column, values in columns.items()
+                }
+            )
+
+
+def read_ntuple(path, columns=None):
+    """
+    Read a Parquet ntuple, memory-mapping the file.
+
+    param path: the Parquet file
+    param columns: names of the columns to read, None for all of them
+    return: pandas DataFrame of the columns
+    """
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    # free each column of the table once it is converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def iter_ntuple(path, columns=None, batch_size=ROW_GROUP_SIZE):
+    """
+    Read a Parquet ntuple in batches, memory-mapping the file.
+
+    param path: the Parquet file
+    param columns: names of the columns to read, None for all of them
+    param batch_size: rows per batch
+    return: generator of pandas DataFrames of the columns
+    """
+    file = pq.ParquetFile(path, memory_map=True)
+    for batch in file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def _splitmix64(x):
+    """Mix the bits of unsigned 64 bit integers, by the splitmix64 finalizer."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def split_fraction(columns, seed=0):
+    """
+    Hash each row to a fraction in [0, 1).
+
+    The hash only depends on the values of SPLIT_COLUMNS, so a row lands
+    in the same subset however the rows are ordered, sharded or read.
+
+    param columns: dictionary, or DataFrame, of columns including SPLIT_COLUMNS
+    param seed: seed of the hash, which changes the split
+    return: numpy array of the fraction of each row
+    """
+    hashed = np.full(len(columns[SPLIT_COLUMNS[0]]), seed, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for column in SPLIT_COLUMNS:
+            values = np.ascontiguousarray(columns[column], dtype=np.float64)
+            hashed = _splitmix64(hashed ^ values.view(np.uint64))
+    # the top 53 bits, as a double
+    return (hashed >> np.uint64(11)) * 2.0**-53
+
+
+def subset_mask(columns, subset, seed=0):
+    """
+    Select the rows of a subset of SUBSETS.
+
+    param columns: dictionary, or DataFrame, of columns including SPLIT_COLUMNS
+    param subset: "train", "validation" or "test"
+    param seed: seed of the hash, which changes the split
+    return: boolean numpy array of the rows in the subset
+    """
+    low, high = SUBSETS[subset]
+    fraction = split_fraction(columns, seed)
+    return (fraction >= low) & (fraction < high)
+
+
+def read_subset(path, subset, columns=None, seed=0, batch_size=ROW_GROUP_SIZE):
+    """
+    Read the rows of a subset of a Parquet ntuple, a batch at a time.
+
+    param path: the Parquet file
+    param subset: "train", "validation" or "test"
+    param columns: names of the columns to read, None for all of them
+    param seed: seed of the hash, which changes the split
+    param batch_size: rows read at once
+    return: pandas DataFrame of the columns of the rows in the subset
+    """
+    read_columns = columns
+    if columns is not None:
+        read_columns = list(columns) + [
+            column for column in SPLIT_COLUMNS if column not in columns
+        ]
+    batches = [
+        batch[subset_mask(batch, subset, seed)]
+        for batch in iter_ntuple(path, read_columns, batch_size)
+    ]
+    dataset = pd.concat(batches, ignore_index=True)
+    return dataset if columns is None else dataset[list(columns)]
+
+
+def fold_index(columns, n_folds, seed=0):
+    """
+    Assign each row to a fold of a cross-validation, by split_fraction.
+
+    param columns: dictionary, or DataFrame, of columns including SPLIT_COLUMNS
+    param n_folds: number of folds
+    param seed: seed of the hash, which changes the folds
+    return: numpy array of the fold of each row
+    """
+    fold = (split_fraction(columns, seed) * n_folds).astype(np.int64)
+    return np.minimum(fold, n_folds - 1)
+
+
+def write_fold_matrix(
+    path, ntuple, columns, n_folds, seed=0, batch_size=ROW_GROUP_SIZE
+):
+    """
+    Write columns of a Parquet ntuple to a float32 matrix in a .npy file.
+
+    The rows of each fold of fold_index are contiguous, in a random order,
+    so each fold and the rest of the rows are views of the memory-mapped
+    matrix, which processes share without copies.
+
+    param path: the .npy file to write, opened with np.load(mmap_mode="r")
+    param ntuple: the Parquet file
+    param columns: names of the columns, in the order of the matrix
+    param n_folds: number of folds
+    param seed: seed of the folds and of the order of the rows
+    param batch_size: rows read at once
+    return: array of the first row of each fold, and the number of rows
+    """
+    fold = np.concatenate(
+        [
+            fold_index(batch, n_folds, seed)
+            for batch in iter_ntuple(ntuple, list(SPLIT_COLUMNS), batch_size)
+        ]
+    )
+    counts = np.bincount(fold, minlength=n_folds)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    # the matrix row of each ntuple row
+    rng = np.random.default_rng(seed)
+    rows = np.empty(len(fold), dtype=np.int64)
+    for i in range(n_folds):
+        rows[fold == i] = offsets[i] + rng.permutation(counts[i])
+    matrix = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(len(fold), len(columns))
+    )
+    start = 0
+    for batch in iter_ntuple(ntuple, list(columns), batch_size):
+        matrix[rows[start : start + len(batch)]] = batch[list(columns)].to_numpy(
+            np.float32
+        )
+        start += len(batch)
+    matrix.flush()
+    return offsets
@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 from coffea import hist
 from cycler import cycler
+from roc import auc, roc_curve
 
 """increase resolution of output .png files"""
 plt.figure(dpi=400)
@@ -126,172 +127,25 @@ plt.savefig("pandas/pandas_coffea_key_pattern.png")
 
 """want to find both false positive rate and true positive rate for a classification"""
 
-true_pos_rate_layers = []
-false_pos_rate_layers = []
-accuracy_layers = []
 
-true_pos_rate_chi2 = []
-false_pos_rate_chi2 = []
-accuracy_chi2 = []
-
-true_pos_rate_pattern = []
-false_pos_rate_pattern = []
-accuracy_pattern = []
-
-
-def get_positives(data):
-    return data[data.foundSegment is True].size
-
-
-def get_negatives(data):
-    return data[data.foundSegment is False].size
-
-
-def get_true_positives(data, classifier):
-    """Find the total positives that also are selected by our classifier."""
-    return data[data["foundSegment"] & classifier(data)].size
-
-
-def get_true_negatives(data, classifier):
-    """Find the total negatives that also are not selected by our classifier."""
-    return data[(data["foundSegment"] == 0) & classifier(data)].size
-
-
-def layer_classifier(data, layer_threshold):
-    """Return an array mask passing our selection."""
-    return data["entry_layers"] > layer_threshold
-
-
-def not_layer_classifier(data, layer_threshold):
-    """Return an array mask failing our selection."""
-    return data["entry_layers"] <= layer_threshold
-
-
-def chi2_classifier(data, chi2_threshold):
-    """Return an array mask passing our selection."""
-    return data["entry_chi2"] < chi2_threshold
-
-
-def not_chi2_classifier(data, chi2_threshold):
-    """Return an array mask failing our selection."""
-    return data["entry_chi2"] >= chi2_threshold
-
-
-def pattern_classifier(data, pattern_threshold):
-    """Return an array mask passing our selection."""
-    return data["key_pattern"] > pattern_threshold
-
-
-def not_pattern_classifier(data, pattern_threshold):
-    """Return an array mask failing our selection."""
-    return data["key_pattern"] <= pattern_threshold
-
-
-for layer in range(0, 7):
-    # print(f"Layer: {layer}")
-    def classifier(data):
-        return layer_classifier(data, layer)
-
-    def not_classifier(data):
-        return not_layer_classifier(data, layer)
-
-    # print(f"Classifier: {classifier(df)}")
-    # print(f"!Classifier: {not_classifier(df)}")
-
-    # print(f"Negatives: {get_negatives(df)}")
-    # print(f"Positives: {get_positives(df)}")
-    # print(f"True Positives: {get_true_positives(df,classifier)}")
-    # print(f"True Negatives: {get_true_negatives(df,not_classifier)}")
-    pos = get_positives(df)
-    neg = get_negatives(df)
-    true_pos = get_true_positives(df, classifier)
-    true_neg = get_true_negatives(df, not_classifier)
-    false_neg = pos - true_pos
-    false_pos = neg - true_neg
-    tpr = (
-        0.0 if true_pos + false_neg == 0.0 else float(true_pos / (true_pos + false_neg))
-    )
-    fpr = (
-        0.0
-        if false_pos + true_neg == 0.0
-        else float(false_pos / (false_pos + true_neg))
-    )
-    true_pos_rate_layers.append(tpr)
-    false_pos_rate_layers.append(fpr)
-    accuracy_layers.append(
-        (true_pos + true_neg) / (true_pos + true_neg + false_pos + false_neg)
-    )
-
-for chi2 in range(0, 10):
-    # print(f"Chi2: {chi2}")
-    def classifier(data):
-        return chi2_classifier(data, chi2)
-
-    def not_classifier(data):
-        return not_chi2_classifier(data, chi2)
-
-    # print(f"Classifier: {classifier(df)}")
-    # print(f"!Classifier: {not_classifier(df)}")
-
-    # print(f"Negatives: {get_negatives(df)}")
-    # print(f"Positives: {get_positives(df)}")
-    # print(f"True Positives: {get_true_positives(df,classifier)}")
-    # print(f"True Negatives: {get_true_negatives(df,not_classifier)}")
-    pos = get_positives(df)
-    neg = get_negatives(df)
-    true_pos = get_true_positives(df, classifier)
-    true_neg = get_true_negatives(df, not_classifier)
-    false_neg = pos - true_pos
-    false_pos = neg - true_neg
-    tpr = (
-        0.0 if true_pos + false_neg == 0.0 else float(true_pos / (true_pos + false_neg))
-    )
-    fpr = (
-        0.0
-        if false_pos + true_neg == 0.0
-        else float(false_pos / (false_pos + true_neg))
-    )
-    true_pos_rate_chi2.append(tpr)
-    false_pos_rate_chi2.append(fpr)
-    accuracy_chi2.append(
-        (true_pos + true_neg) / (true_pos + true_neg + false_pos + false_neg)
-    )
-
-for pattern in range(0, 4):
-    # print(f"PatternID: {55 + 20*pattern}")
-    def classifier(data):
-        return pattern_classifier(data, pattern)
-
-    def not_classifier(data):
-        return not_pattern_classifier(
-            data, pattern
-        )  # print(f"Classifier: {classifier(df)}")
-
-    # print(f"!Classifier: {not_classifier(df)}")
-
-    # print(f"Negatives: {get_negatives(df)}")
-    # print(f"Positives: {get_positives(df)}")
-    # print(f"True Positives: {get_true_positives(df,classifier)}")
-    # print(f"True Negatives: {get_true_negatives(df,not_classifier)}")
-    pos = get_positives(df)
-    neg = get_negatives(df)
-    true_pos = get_true_positives(df, classifier)
-    true_neg = get_true_negatives(df, not_classifier)
-    false_neg = pos - true_pos
-    false_pos = neg - true_neg
-    tpr = (
-        0.0 if true_pos + false_neg == 0.0 else float(true_pos / (true_pos + false_neg))
-    )
-    fpr = (
-        0.0
-        if false_pos + true_neg == 0.0
-        else float(false_pos / (false_pos + true_neg))
-    )
-    true_pos_rate_pattern.append(tpr)
-    false_pos_rate_pattern.append(fpr)
-    accuracy_pattern.append(
-        (true_pos + true_neg) / (true_pos + true_neg + false_pos + false_neg)
-    )
+# the ROC curves at every distinct threshold, sorting each discriminant
+# once, or counting the integer ones in a cumulative histogram
+labels = df["foundSegment"].to_numpy() == 1
+(
+    layer_thresholds,
+    true_pos_rate_layers,
+    false_pos_rate_layers,
+    accuracy_layers,
+) = roc_curve(df["entry_layers"].to_numpy(), labels, greater=True)
+chi2_thresholds, true_pos_rate_chi2, false_pos_rate_chi2, accuracy_chi2 = roc_curve(
+    df["entry_chi2"].to_numpy(), labels, greater=False
+)
+(
+    pattern_thresholds,
+    true_pos_rate_pattern,
+    false_pos_rate_pattern,
+    accuracy_pattern,
+) = roc_curve(df["key_pattern"].to_numpy(), labels, greater=True)
 
 # print(accuracy_layers)
 # print(accuracy_chi2)
@@ -304,7 +158,14 @@ plt.plot(lims, lims, color="black", linestyle="--")
 ax = plt.plot(false_pos_rate_layers, true_pos_rate_layers)
 ax = plt.plot(false_pos_rate_chi2, true_pos_rate_chi2)
 ax = plt.plot(false_pos_rate_pattern, true_pos_rate_pattern)
-plt.legend(["", "num of layers", "$\\chi^2$", "patternID"])
+plt.legend(
+    [
+        "",
+        f"num of layers (AUC {auc(false_pos_rate_layers, true_pos_rate_layers):.3f})",
+        f"$\\chi^2$ (AUC {auc(false_pos_rate_chi2, true_pos_rate_chi2):.3f})",
+        f"patternID (AUC {auc(false_pos_rate_pattern, true_pos_rate_pattern):.3f})",
+    ]
+)
 plt.xlabel("False Positive Rate")
 plt.ylabel("True Positive Rate")
 plt.savefig("pandas/pandas_ROC.png")
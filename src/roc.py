@@ -0,0 +1,76 @@
+"""ROC curves of cuts on a discriminant, at every distinct threshold."""
+import numpy as np
+
+
+def _cumulative_counts(values, labels):
+    """
+    Count the positives and negatives passing values >= each distinct value.
+
+    Integer values of a range no wider than the number of rows are counted
+    by a cumulative histogram, others are sorted once.
+
+    return: the distinct values in decreasing order, and the counts of
+        positives and negatives passing each of them
+    """
+    if (
+        np.issubdtype(values.dtype, np.integer)
+        and len(values)
+        and int(values.max()) - int(values.min()) <= len(values)
+    ):
+        low = values.min()
+        offset = (values - low).astype(np.int64)
+        totals = np.bincount(offset)
+        positives = np.bincount(offset[labels], minlength=len(totals))
+        # rows at or above each value
+        passing = np.cumsum(totals[::-1])[::-1]
+        true_positives = np.cumsum(positives[::-1])[::-1]
+        present = np.flatnonzero(totals)[::-1]
+        return (
+            present + low,
+            true_positives[present],
+            passing[present] - true_positives[present],
+        )
+    order = np.argsort(values)[::-1]
+    values, labels = values[order], labels[order]
+    true_positives = np.cumsum(labels)
+    false_positives = np.arange(1, len(labels) + 1) - true_positives
+    # the last row of each distinct value
+    last = np.flatnonzero(np.append(values[1:] != values[:-1], len(values) > 0))
+    return values[last], true_positives[last], false_positives[last]
+
+
+def roc_curve(values, labels, greater=True):
+    """
+    Get the ROC curve of a cut on a discriminant, in O(n log n).
+
+    param values: discriminant of each row
+    param labels: whether each row is a positive
+    param greater: the cut passes rows with values >= threshold if True,
+        and rows with values <= threshold if False
+    return: the thresholds, from the tightest to the loosest cut, and the
+        true positive rate, false positive rate and accuracy of each of
+        them; the rates are 0 without positives or negatives
+    """
+    values = np.asarray(values)
+    labels = np.asarray(labels, dtype=bool)
+    sign = 1 if greater else -1
+    thresholds, true_positives, false_positives = _cumulative_counts(
+        sign * values, labels
+    )
+    positives = np.count_nonzero(labels)
+    negatives = len(labels) - positives
+    tpr = true_positives / max(positives, 1)
+    fpr = false_positives / max(negatives, 1)
+    accuracy = (true_positives + negatives - false_positives) / max(len(labels), 1)
+    return sign * thresholds, tpr, fpr, accuracy
+
+
+def auc(fpr, tpr):
+    """
+    Get the area under a ROC curve of roc_curve.
+
+    param fpr: false positive rates, increasing
+    param tpr: true positive rates, increasing
+    return: the area, starting from the cut passing nothing at (0, 0)
+    """
+    return np.trapz(np.append(0, tpr), np.append(0, fpr))
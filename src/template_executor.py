@@ -3,8 +3,8 @@ import glob
 import coffea.hist as hist
 import coffea.processor as processor
 import matplotlib.pyplot as plt
-from coffea.nanoevents import BaseSchema
-from template_processor import TemplateProcessor
+from template_processor import TemplateProcessor, TemplateSchema
+from helpers import log_metrics
 
 # increase resolution of output .png files
 plt.figure(dpi=400)
@@ -13,13 +13,14 @@ files = glob.glob("/eos/cms/store/user/wnash/CSCDigiTree_*.root")
 
 fileset = {"dummy": files}
 
-out = processor.run_uproot_job(
+out, metrics = processor.run_uproot_job(
     fileset=fileset,
     treename="CSCDigiTree",
     processor_instance=TemplateProcessor(),
     executor=processor.iterative_executor,
-    executor_args={"schema": BaseSchema, "workers": 8},
+    executor_args={"schema": TemplateSchema, "workers": 8, "savemetrics": True},
 )
+log_metrics(metrics)
 
 
 fig, ax = plt.subplots()
@@ -1,11 +1,26 @@
 """Template processor to show how things work."""
 import awkward as ak
 from coffea import hist, processor
+from cscdigitree_schema import CSCDigiTreeSchema
 
-# register our candidate behaviors
-from coffea.nanoevents.methods import candidate
+# the only branches of the CSCDigiTree the processor reads,
+# add to these when reading more in process
+BRANCHES = [
+    "muon_pt",
+    "muon_eta",
+    "muon_phi",
+    "muon_q",
+    "segment_mu_id",
+    "segment_dxdz",
+    "segment_chisq",
+    "segment_nHits",
+]
 
-ak.behavior.update(candidate.behavior)
+
+class TemplateSchema(CSCDigiTreeSchema):
+    """CSCDigiTree with only the branches used by the TemplateProcessor."""
+
+    branches = BRANCHES
 
 
 class TemplateProcessor(processor.ProcessorABC):
@@ -82,34 +97,14 @@ class TemplateProcessor(processor.ProcessorABC):
         output["allevents"][dataset] += len(events)
 
         """
-        Now, you'll need to unzip the variable, this stores the data into
-        the histograms we defined earlier.
+        Now, you'll need the collections, the TemplateSchema groups the
+        branches of the tree by their prefix, so that the muon_* branches
+        are the fields of events.muon:
 
-        variable = ak.zip(
-            {
-                "leaf": location_in_root_file,
-            },
-        )
+        variable = events.collection
         """
 
-        muons = ak.zip(
-            {
-                "pt": events.muon_pt,
-                "eta": events.muon_eta,
-                "phi": events.muon_phi,
-                "mass": ak.Array([0.105658375 for _ in range(len(events.muon_pt))]),
-                "charge": events.muon_q,
-            },
-            with_name="PtEtaPhiMCandidate",
-        )
-        segment = ak.zip(
-            {
-                "mu_id": events.segment_mu_id,
-                "dxdz": events.segment_dxdz,
-                "chisq": events.segment_chisq,
-                "nHits": events.segment_nHits,
-            },
-        )
+        segment = events.segment
 
         """
         Finally, we must assign the histograms to the output to return
@@ -130,7 +125,7 @@ class TemplateProcessor(processor.ProcessorABC):
 
         segments_w_muon = segment[segment.mu_id != -1]
 
-        segment_associated_muons = muons[segments_w_muon.mu_id]
+        segment_associated_muons = segments_w_muon.muon
 
         segment_slice_2 = segments_w_muon[
             (segment_associated_muons.pt > 2) & (segment_associated_muons.pt < 5)
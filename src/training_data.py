@@ -0,0 +1,109 @@
+"""Streaming tf.data input pipelines of the Parquet ntuples, for training."""
+import numpy as np
+import pyarrow.parquet as pq
+import tensorflow as tf
+from ntuple import subset_mask
+
+# the training label
+LABEL = "dp"
+# columns which are neither features nor labels
+UNUSED_COLUMNS = ("p",)
+# the default batch size of model.fit
+BATCH_SIZE = 32
+# rows held in the shuffle buffer of the training set
+SHUFFLE_BUFFER = 100000
+
+
+def feature_columns(path, label=LABEL, unused=UNUSED_COLUMNS):
+    """
+    Get the names of the feature columns of a Parquet ntuple.
+
+    param path: the Parquet file
+    param label: the label column
+    param unused: columns which are not features
+    return: list of the feature columns, in the order of the file
+    """
+    return [
+        column
+        for column in pq.read_schema(path).names
+        if column != label and column not in unused
+    ]
+
+
+def _row_group_reader(path, columns, subset, seed):
+    """Make a generator function reading the subset rows of a row group."""
+
+    def read(index):
+        file = pq.ParquetFile(path, memory_map=True)
+        batch = file.read_row_group(int(index)).to_pandas()
+        batch = batch[subset_mask(batch, subset, seed)]
+        yield {column: batch[column].to_numpy(np.float32) for column in columns}
+
+    return read
+
+
+def dataset(
+    path,
+    subset,
+    batch_size=BATCH_SIZE,
+    label=LABEL,
+    unused=UNUSED_COLUMNS,
+    cache=None,
+    shuffle=None,
+    seed=0,
+):
+    """
+    Stream a subset of a Parquet ntuple as batches of features and labels.
+
+    The row groups are read and split on parallel threads, so only a few
+    of them are in memory at once and the ntuple may be larger than
+    memory. The rows are split by ntuple.subset_mask, so the subsets don't
+    overlap whatever the order the rows are read in.
+
+    param path: the Parquet file
+    param subset: "train", "validation" or "test"
+    param batch_size: rows per batch
+    param label: the label column
+    param unused: columns which are neither features nor labels
+    param cache: file to cache the rows of the subset to after the first
+        epoch, "" to cache them in memory, None to not cache them
+    param shuffle: shuffle the rows, by default only of the training set
+    param seed: seed of the hash of ntuple.subset_mask
+    return: tf.data.Dataset of (features, label) batches, with the features
+        in the order of feature_columns
+    """
+    if shuffle is None:
+        shuffle = subset == "train"
+    features = feature_columns(path, label, unused)
+    columns = features + [label]
+    read = _row_group_reader(path, columns, subset, seed)
+    signature = {
+        column: tf.TensorSpec(shape=(None,), dtype=tf.float32) for column in columns
+    }
+
+    row_groups = tf.data.Dataset.range(pq.ParquetFile(path).num_row_groups)
+    if shuffle and cache is None:
+        # a cache would freeze the order of the row groups
+        row_groups = row_groups.shuffle(row_groups.cardinality())
+    rows = row_groups.interleave(
+        lambda index: tf.data.Dataset.from_generator(
+            read, args=(index,), output_signature=signature
+        ).unbatch(),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle,
+    )
+    if cache is not None:
+        rows = rows.cache(cache)
+    if shuffle:
+        rows = rows.shuffle(SHUFFLE_BUFFER, reshuffle_each_iteration=True)
+    return (
+        rows.batch(batch_size)
+        .map(
+            lambda batch: (
+                tf.stack([batch[column] for column in features], axis=-1),
+                batch[label],
+            ),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+        .prefetch(tf.data.AUTOTUNE)
+    )
@@ -0,0 +1,170 @@
+"""Hyper-parameter scans of the momentum loss models, on parallel processes."""
+import logging
+import multiprocessing
+import os
+import shutil
+import keras_tuner as kt
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers.experimental import preprocessing
+from helpers import OUTPUT_DIR, available_cores
+from models import neural_network, set_threads
+import training_data
+
+PROJECT_NAME = "hyperparameter_scan"
+ORACLE_IP = "127.0.0.1"
+ORACLE_PORT = 8000
+MAX_EPOCHS = 20
+FACTOR = 3
+# epochs without an improvement of val_loss before a trial is stopped
+PATIENCE = 3
+
+
+class NormalizedHyperModel(kt.HyperModel):
+    """
+    models.neural_network with a normalizer of fixed statistics.
+
+    Unlike a closure over an adapted normalizer, it can be pickled to the
+    worker processes, which then don't adapt a normalizer of their own.
+    """
+
+    def __init__(self, mean, variance, build_model=neural_network):
+        """
+        Initialize.
+
+        param mean: mean of each feature
+        param variance: variance of each feature
+        param build_model: function of a normalizer and hp returning a model
+        """
+        super().__init__()
+        self.mean = np.asarray(mean)
+        self.variance = np.asarray(variance)
+        self.build_model = build_model
+
+    def build(self, hp):
+        """Build the model of the hyper-parameters."""
+        normalizer = preprocessing.Normalization(
+            axis=-1, mean=self.mean, variance=self.variance
+        )
+        return self.build_model(normalizer, hp)
+
+
+def hyperband(hypermodel, overwrite=False, max_epochs=MAX_EPOCHS, factor=FACTOR):
+    """
+    Get the Hyperband tuner of the scan stored under OUTPUT_DIR.
+
+    param hypermodel: the model to tune
+    param overwrite: start a new scan, instead of resuming the stored one
+    param max_epochs: epochs of the longest trained models
+    param factor: reduction factor of the epochs and models in each bracket
+    return: keras_tuner.Hyperband
+    """
+    return kt.Hyperband(
+        hypermodel,
+        objective="val_loss",
+        max_epochs=max_epochs,
+        factor=factor,
+        directory=OUTPUT_DIR,
+        project_name=PROJECT_NAME,
+        overwrite=overwrite,
+    )
+
+
+def _search(tuner_id, hypermodel, ntuple, threads, port, max_epochs, factor):
+    """Run the chief oracle, or a worker trying models, of a distributed scan."""
+    # read by keras_tuner to distribute the scan
+    os.environ["KERASTUNER_TUNER_ID"] = tuner_id
+    os.environ["KERASTUNER_ORACLE_IP"] = ORACLE_IP
+    os.environ["KERASTUNER_ORACLE_PORT"] = str(port)
+    set_threads(threads, inter_op=1)
+    tuner = hyperband(hypermodel, max_epochs=max_epochs, factor=factor)
+    tuner.search(
+        training_data.dataset(ntuple, "train"),
+        epochs=max_epochs,
+        validation_data=training_data.dataset(ntuple, "validation"),
+        callbacks=[tf.keras.callbacks.EarlyStopping("val_loss", patience=PATIENCE)],
+    )
+
+
+def parallel_search(
+    hypermodel,
+    ntuple,
+    n_workers=None,
+    threads_per_worker=None,
+    overwrite=False,
+    port=ORACLE_PORT,
+    max_epochs=MAX_EPOCHS,
+    factor=FACTOR,
+):
+    """
+    Scan the hyper-parameters with trials running at once in worker processes.
+
+    The worker processes are spawned, which re-imports the __main__
+    module, so call this from a script guarded by __name__ == "__main__",
+    such as this module.
+
+    A chief process serves the Hyperband oracle, which hands the trials to
+    the workers and stops the brackets of the worst models early. The
+    trials are stored under OUTPUT_DIR, so an interrupted scan resumes
+    where it stopped unless overwrite. Each trial also stops once val_loss
+    stops improving.
+
+    param hypermodel: the model to tune, which is pickled to the workers
+    param ntuple: the Parquet ntuple of the training data
+    param n_workers: number of trials at once, by default one per
+        threads_per_worker cores
+    param threads_per_worker: CPU threads of each trial, by default the
+        cores split evenly between the workers
+    param overwrite: start a new scan, instead of resuming the stored one
+    param port: local port of the oracle
+    param max_epochs: epochs of the longest trained models
+    param factor: reduction factor of the epochs and models in each bracket
+    return: the tuner of the finished scan
+    """
+    cores = available_cores()
+    if n_workers is None:
+        n_workers = max(1, cores // (threads_per_worker or 2))
+    if threads_per_worker is None:
+        threads_per_worker = max(1, cores // n_workers)
+    if overwrite:
+        # before any tuner could write to the scan
+        shutil.rmtree(os.path.join(OUTPUT_DIR, PROJECT_NAME), ignore_errors=True)
+    # tensorflow doesn't survive a fork
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_search,
+            args=(
+                tuner_id,
+                hypermodel,
+                ntuple,
+                threads,
+                port,
+                max_epochs,
+                factor,
+            ),
+        )
+        for tuner_id, threads in [("chief", 1)]
+        + [(f"tuner{i}", threads_per_worker) for i in range(n_workers)]
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logging.error(f"Tuner process exited with code {process.exitcode}")
+    # reload the finished scan
+    return hyperband(hypermodel, max_epochs=max_epochs, factor=factor)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    ntuple = OUTPUT_DIR + "brem_dataset.parquet"
+    normalizer = preprocessing.Normalization(axis=-1)
+    normalizer.adapt(
+        training_data.dataset(ntuple, "train").map(lambda features, label: features)
+    )
+    tuner = parallel_search(
+        NormalizedHyperModel(normalizer.mean, normalizer.variance), ntuple
+    )
+    tuner.results_summary()
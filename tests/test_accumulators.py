@@ -0,0 +1,116 @@
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+from coffea import processor
+from accumulators import ChunkedColumnAccumulator
+
+
+class TestChunkedColumnAccumulator(unittest.TestCase):
+    """Unit tester for the chunked column accumulator."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(3)
+        cls.chunks = [rng.normal(size=n) for n in (100, 0, 37, 250)]
+        cls.expected = np.concatenate(cls.chunks)
+
+    def setUp(self):
+        """Give each test its own spill directory."""
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the spill files."""
+        self.directory.cleanup()
+
+    def merge(self, memory_budget=None):
+        """Merge the chunks as the executors do."""
+        output = processor.dict_accumulator(
+            {
+                "x": ChunkedColumnAccumulator(
+                    np.zeros(shape=(0,)),
+                    memory_budget=memory_budget,
+                    spill_dir=self.directory.name,
+                )
+            }
+        )
+        total = output.identity()
+        for chunk in self.chunks:
+            out = output.identity()
+            out["x"] += ChunkedColumnAccumulator(chunk)
+            total += out
+        return total["x"]
+
+    def test_merge(self):
+        merged = self.merge()
+        self.assertEqual(len(merged), len(self.expected))
+        self.assertNotIsInstance(merged.value, np.memmap)
+        np.testing.assert_array_equal(merged.value, self.expected)
+        # the value is concatenated only once
+        self.assertIs(merged.value, merged.value)
+
+    def test_spill(self):
+        merged = self.merge(memory_budget=1000)
+        self.assertLessEqual(merged.nbytes, 1000)
+        value = merged.value
+        self.assertIsInstance(value, np.memmap)
+        np.testing.assert_array_equal(value, self.expected)
+
+    def test_cleanup(self):
+        merged = self.merge(memory_budget=1000)
+        np.testing.assert_array_equal(merged.value, self.expected)
+        self.assertTrue(os.listdir(self.directory.name))
+        merged.cleanup()
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(len(merged), 0)
+        self.assertEqual(len(merged.value), 0)
+
+    def test_matches_column_accumulator(self):
+        column = processor.column_accumulator(np.zeros(shape=(0,)))
+        for chunk in self.chunks:
+            column += processor.column_accumulator(chunk.astype(np.float32))
+        merged = ChunkedColumnAccumulator(np.zeros(shape=(0,)))
+        for chunk in self.chunks:
+            merged += ChunkedColumnAccumulator(chunk.astype(np.float32))
+        self.assertEqual(merged.value.dtype, column.value.dtype)
+        np.testing.assert_array_equal(merged.value, column.value)
+
+    def test_empty(self):
+        empty = ChunkedColumnAccumulator(np.zeros(shape=(0, 3), dtype=np.int32))
+        self.assertEqual(empty.value.shape, (0, 3))
+        self.assertEqual(empty.identity().value.dtype, np.int32)
+
+    def test_pickle(self):
+        merged = pickle.loads(pickle.dumps(self.merge()))
+        np.testing.assert_array_equal(merged.value, self.expected)
+
+    def test_dissimilar(self):
+        column = ChunkedColumnAccumulator(np.zeros(shape=(0,)))
+        with self.assertRaises(ValueError):
+            column += ChunkedColumnAccumulator(np.zeros(shape=(2, 2)))
+        with self.assertRaises(ValueError):
+            column += processor.column_accumulator(np.zeros(shape=(2,)))
+
+    def test_merge_spilled(self):
+        column = ChunkedColumnAccumulator(np.arange(20.0))
+        other = ChunkedColumnAccumulator(
+            np.arange(20.0, 22.0), spill_dir=self.directory.name
+        )
+        other.spill()
+        other += ChunkedColumnAccumulator(np.arange(22.0, 42.0))
+        column += other
+        # the rows of column held in memory stay before the spilled ones
+        np.testing.assert_array_equal(column.value, np.arange(42.0))
+
+    def test_spilled_dtype(self):
+        column = ChunkedColumnAccumulator(np.arange(20.0))
+        other = ChunkedColumnAccumulator(
+            np.arange(2, dtype=np.float32), spill_dir=self.directory.name
+        )
+        other.spill()
+        with self.assertRaises(ValueError):
+            column += other
+        # nothing was taken from other
+        np.testing.assert_array_equal(column.value, np.arange(20.0))
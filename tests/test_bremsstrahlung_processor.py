@@ -0,0 +1,303 @@
+import os
+import tempfile
+import unittest
+import awkward as ak
+import numpy as np
+import uproot
+from coffea import processor
+import bremsstrahlung_processor as bp
+from benchmarks import synthetic_branches
+
+
+def random_collection(rng, counts, fields):
+    """Build a jagged record array with uniformly distributed fields."""
+    total = int(np.sum(counts))
+    return ak.zip(
+        {
+            field: ak.unflatten(
+                rng.uniform(low, high, total).astype(np.float32), counts
+            )
+            for field, (low, high) in fields.items()
+        }
+    )
+
+
+class TestAssociation(unittest.TestCase):
+    """Unit tester for the muon / deposit association kernels."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(42)
+        n_events = 200
+        cls.gen_muons = random_collection(
+            rng,
+            rng.integers(0, 6, n_events),
+            {"eta": (-2.5, 2.5), "phi": (-np.pi, np.pi)},
+        )
+        cls.deposits = random_collection(
+            rng,
+            rng.integers(0, 300, n_events),
+            {"eta": (-3.0, 3.0), "phi": (-np.pi, np.pi), "energy": (0.0, 10.0)},
+        )
+        # the csc hits need a station to split their energy by
+        cls.deposits = ak.with_field(
+            cls.deposits,
+            ak.unflatten(
+                rng.integers(1, bp.N_STATIONS + 1, ak.sum(ak.num(cls.deposits))),
+                ak.num(cls.deposits),
+            ),
+            "station",
+        )
+        cls.hits = random_collection(
+            rng,
+            rng.integers(0, 50, n_events),
+            {"eta": (-3.0, 3.0), "phi": (-np.pi, np.pi), "p_at_entry": (0.0, 4000.0)},
+        )
+        # muons and deposits on either side of the phi = +/- pi boundary
+        cls.wrapped_muons = ak.zip(
+            {"eta": [[1.0, -2.0]], "phi": [[3.1, -3.13]]},
+        )
+        cls.wrapped_deposits = ak.zip(
+            {
+                "eta": [[1.05, 1.0, -2.01, -1.5]],
+                "phi": [[-3.1, 2.95, 3.12, 3.12]],
+                "energy": [[1.0, 2.0, 4.0, 8.0]],
+            }
+        )
+
+    def test_indexed_associated_energy(self):
+        expected = bp.get_associated_energy(
+            ak.ArrayBuilder(), self.gen_muons, self.deposits
+        ).snapshot()
+        for index_min_muons in (0, bp.INDEX_MIN_MUONS):
+            indexed = bp.get_indexed_associated_energy(
+                ak.ArrayBuilder(), self.gen_muons, self.deposits, index_min_muons
+            ).snapshot()
+            self.assertEqual(ak.to_list(indexed), ak.to_list(expected))
+
+    def test_indexed_p_at_exit(self):
+        expected = bp.get_p_at_exit(
+            ak.ArrayBuilder(), self.gen_muons, self.hits
+        ).snapshot()
+        for index_min_muons in (0, bp.INDEX_MIN_MUONS):
+            indexed = bp.get_indexed_p_at_exit(
+                ak.ArrayBuilder(), self.gen_muons, self.hits, index_min_muons
+            ).snapshot()
+            self.assertEqual(ak.to_list(indexed), ak.to_list(expected))
+
+    def test_phi_wrap_around(self):
+        indexed = bp.get_indexed_associated_energy(
+            ak.ArrayBuilder(), self.wrapped_muons, self.wrapped_deposits, 0
+        ).snapshot()
+        self.assertEqual(ak.to_list(indexed), [[3.0, 4.0]])
+
+    def test_muon_associations(self):
+        associations = bp.get_muon_associations(
+            ak.ArrayBuilder(),
+            self.gen_muons,
+            (self.deposits,),
+            (self.deposits[:, ::2],),
+            (self.deposits[:, 1::3],),
+            (self.hits,),
+            weighted=True,
+        ).snapshot()
+        for field, deposits in (
+            ("hcal", self.deposits),
+            ("ecal", self.deposits[:, ::2]),
+            ("csc", self.deposits[:, 1::3]),
+        ):
+            expected = bp.get_associated_energy(
+                ak.ArrayBuilder(), self.gen_muons, deposits
+            ).snapshot()
+            self.assertEqual(ak.to_list(associations[field]), ak.to_list(expected))
+            expected = bp.get_deltar_weighted_associated_energy(
+                ak.ArrayBuilder(), self.gen_muons, deposits
+            ).snapshot()
+            self.assertEqual(
+                ak.to_list(associations[field + "_weighted"]), ak.to_list(expected)
+            )
+        expected = bp.get_p_at_exit(
+            ak.ArrayBuilder(), self.gen_muons, self.hits
+        ).snapshot()
+        self.assertEqual(ak.to_list(associations.p_exit), ak.to_list(expected))
+
+    def test_station_energy(self):
+        for weighted in (False, True):
+            for index_min_muons in (0, bp.INDEX_MIN_MUONS):
+                associations = bp.get_muon_associations(
+                    ak.ArrayBuilder(),
+                    self.gen_muons,
+                    (self.deposits,),
+                    (self.deposits,),
+                    (self.deposits[:, :100], self.deposits[:, 100:]),
+                    (self.hits,),
+                    weighted,
+                    index_min_muons,
+                ).snapshot()
+                for station, field in enumerate(bp.STATION_FIELDS, 1):
+                    expected = bp.get_associated_energy(
+                        ak.ArrayBuilder(),
+                        self.gen_muons,
+                        self.deposits[self.deposits.station == station],
+                    ).snapshot()
+                    self.assertTrue(
+                        np.allclose(
+                            ak.flatten(associations[field]), ak.flatten(expected)
+                        )
+                    )
+                total = sum(associations[field] for field in bp.STATION_FIELDS)
+                self.assertTrue(
+                    np.allclose(ak.flatten(total), ak.flatten(associations.csc))
+                )
+
+    def test_unweighted_muon_associations(self):
+        associations = bp.get_muon_associations(
+            ak.ArrayBuilder(),
+            self.gen_muons,
+            (self.deposits,),
+            (self.deposits,),
+            (self.deposits,),
+            (self.hits,),
+            index_min_muons=0,
+        ).snapshot()
+        self.assertEqual(
+            associations.fields,
+            ["hcal", "ecal", "csc", "p_exit"] + list(bp.STATION_FIELDS),
+        )
+        expected = bp.get_associated_energy(
+            ak.ArrayBuilder(), self.gen_muons, self.deposits
+        ).snapshot()
+        self.assertEqual(ak.to_list(associations.csc), ak.to_list(expected))
+
+    def test_preallocated_muon_associations(self):
+        for weighted in (False, True):
+            detectors = (
+                self.gen_muons,
+                self.deposits,
+                self.deposits[:, ::2],
+                self.deposits[:, 1::3],
+                self.hits,
+            )
+            expected = bp.get_muon_associations(
+                ak.ArrayBuilder(),
+                self.gen_muons,
+                *((collection,) for collection in detectors[1:]),
+                weighted,
+            ).snapshot()
+            associations = bp.muon_associations(*detectors, weighted)
+            self.assertEqual(associations.fields, expected.fields)
+            self.assertEqual(ak.to_list(associations), ak.to_list(expected))
+
+    def test_unflatten_like(self):
+        for jagged in (self.gen_muons, self.gen_muons[5:]):
+            flat = np.arange(ak.sum(ak.num(jagged)), dtype=np.float64)
+            wrapped = bp.unflatten_like(flat, jagged)
+            self.assertEqual(ak.to_list(ak.num(wrapped)), ak.to_list(ak.num(jagged)))
+            self.assertEqual(ak.to_list(ak.flatten(wrapped)), list(flat))
+
+    def test_split_collections(self):
+        # float64 and float32 parts, as the ecal collections needn't share a type
+        parts = [
+            self.deposits[:, :50],
+            ak.zip(
+                {
+                    field: self.deposits[field][:, 50:100] * 1.0
+                    for field in self.deposits.fields
+                }
+            ),
+            self.deposits[:, 100:],
+        ]
+        for weighted in (False, True):
+            for index_min_muons in (0, bp.INDEX_MIN_MUONS):
+                expected = bp.get_muon_associations(
+                    ak.ArrayBuilder(),
+                    self.gen_muons,
+                    (self.deposits,),
+                    (ak.concatenate(parts, axis=-1),),
+                    (self.deposits,),
+                    (ak.concatenate([self.hits[:, 10:], self.hits[:, :10]], axis=-1),),
+                    weighted,
+                    index_min_muons,
+                ).snapshot()
+                associations = bp.get_muon_associations(
+                    ak.ArrayBuilder(),
+                    self.gen_muons,
+                    (self.deposits,),
+                    tuple(parts),
+                    (self.deposits,),
+                    (self.hits[:, 10:], self.hits[:, :10]),
+                    weighted,
+                    index_min_muons,
+                ).snapshot()
+                self.assertEqual(ak.to_list(associations), ak.to_list(expected))
+        associations = bp.muon_associations(
+            self.gen_muons, self.deposits, parts, self.deposits, self.hits
+        )
+        self.assertEqual(ak.to_list(associations.ecal), ak.to_list(expected.ecal))
+
+
+class TestSchema(unittest.TestCase):
+    """Unit tester for reading only the declared branches."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.filename = os.path.join(cls.directory.name, "CSCDigiTree.root")
+        branches = synthetic_branches(100)
+        branches["unused"] = branches["hcal_calo_hits_eta"]
+        with uproot.recreate(cls.filename) as file:
+            file["CSCDigiTree"] = branches
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the test file."""
+        cls.directory.cleanup()
+
+    def test_pruned_branches(self):
+        out, metrics = processor.run_uproot_job(
+            {"test": [self.filename]},
+            "CSCDigiTree",
+            bp.BremsstrahlungProcessor(),
+            processor.iterative_executor,
+            {"schema": bp.BremsstrahlungSchema, "savemetrics": True},
+            chunksize=40,
+        )
+        self.assertEqual(out["allevents"]["test"], 100)
+        self.assertEqual(metrics["chunks"], 2)
+        self.assertGreater(metrics["bytesread"], 0)
+        # everything declared is used, and nothing else is read
+        self.assertEqual(set(metrics["columns"]), set(bp.BRANCHES))
+
+    def check_compiled_once(self, kernel, preallocate):
+        # the kernel compiles for the first chunk, and not again for the others
+        compiled = len(kernel.signatures)
+        processor.run_uproot_job(
+            {"test": [self.filename]},
+            "CSCDigiTree",
+            bp.BremsstrahlungProcessor(preallocate=preallocate),
+            processor.iterative_executor,
+            {"schema": bp.BremsstrahlungSchema},
+            chunksize=25,
+        )
+        self.assertLessEqual(len(kernel.signatures), compiled + 1)
+
+    def test_builder_compiled_once(self):
+        self.check_compiled_once(bp.get_muon_associations, preallocate=False)
+
+    def test_preallocated_compiled_once(self):
+        self.check_compiled_once(bp.fill_muon_associations, preallocate=True)
+
+    def test_missing_branch(self):
+        class MissingSchema(bp.BremsstrahlungSchema):
+            branches = bp.BRANCHES + ["missing"]
+
+        with self.assertRaises(Exception):
+            processor.run_uproot_job(
+                {"test": [self.filename]},
+                "CSCDigiTree",
+                bp.BremsstrahlungProcessor(),
+                processor.iterative_executor,
+                {"schema": MissingSchema},
+            )
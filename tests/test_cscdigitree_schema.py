@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+import awkward as ak
+import numpy as np
+import uproot
+from coffea.nanoevents import NanoEventsFactory
+import cscdigitree_schema
+import helpers
+from benchmarks import synthetic_branches
+
+
+class TestCSCDigiTreeSchema(unittest.TestCase):
+    """Unit tester for the CSCDigiTree schema."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(7)
+        n_events = 50
+        cls.branches = synthetic_branches(n_events)
+        n_muons = rng.integers(0, 3, n_events)
+        for field, (low, high) in {
+            "pt": (1, 50),
+            "eta": (-2.4, 2.4),
+            "phi": (-np.pi, np.pi),
+        }.items():
+            cls.branches[f"muon_{field}"] = ak.unflatten(
+                rng.uniform(low, high, np.sum(n_muons)).astype(np.float32), n_muons
+            )
+        cls.branches["muon_q"] = ak.unflatten(
+            rng.choice([-1, 1], np.sum(n_muons)).astype(np.int32), n_muons
+        )
+        # segments of an event point at one of its muons, or -1
+        n_segments = rng.integers(0, 4, n_events)
+        mu_id = np.array(
+            [rng.integers(-1, n) for n in np.repeat(n_muons, n_segments)],
+            dtype=np.int32,
+        )
+        cls.branches["segment_mu_id"] = ak.unflatten(mu_id, n_segments)
+        cls.branches["segment_chisq"] = ak.unflatten(
+            rng.uniform(0, 10, np.sum(n_segments)).astype(np.float32), n_segments
+        )
+        cls.branches["run"] = np.arange(n_events)
+
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.filename = os.path.join(cls.directory.name, "CSCDigiTree.root")
+        with uproot.recreate(cls.filename) as file:
+            file["CSCDigiTree"] = cls.branches
+        cls.events = NanoEventsFactory.from_root(
+            cls.filename,
+            treepath="CSCDigiTree",
+            schemaclass=cscdigitree_schema.CSCDigiTreeSchema,
+        ).events()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the test file."""
+        cls.directory.cleanup()
+
+    def test_collections(self):
+        self.assertEqual(
+            set(self.events.fields),
+            {
+                "gen",
+                "muon",
+                "segment",
+                "sim_hits",
+                "hcal_calo_hits",
+                "ecalPreshower_calo_hits",
+                "ecalBarrel_calo_hits",
+                "ecalEndcap_calo_hits",
+                "run",
+            },
+        )
+        self.assertEqual(self.events.muon.fields, ["pt", "eta", "phi", "charge"])
+        self.assertEqual(
+            ak.to_list(self.events.hcal_calo_hits.eta),
+            ak.to_list(self.branches["hcal_calo_hits_eta"]),
+        )
+
+    def test_muon_mass(self):
+        for muons in (self.events.gen, self.events.muon):
+            self.assertEqual(
+                ak.to_list(ak.num(muons.mass)), ak.to_list(ak.num(muons.pt))
+            )
+            self.assertTrue(
+                ak.all(ak.flatten(muons.mass) == cscdigitree_schema.MUON_MASS)
+            )
+        self.assertTrue(
+            np.allclose(
+                ak.flatten(self.events.muon.energy),
+                np.hypot(ak.flatten(self.events.muon.p), cscdigitree_schema.MUON_MASS),
+            )
+        )
+
+    def test_segment_muon(self):
+        segments = self.events.segment
+        expected = [
+            [muons[index] if index != -1 else None for index in indices]
+            for muons, indices in zip(
+                ak.to_list(self.events.muon.pt), ak.to_list(segments.mu_id)
+            )
+        ]
+        self.assertEqual(ak.to_list(segments.muon.pt), expected)
+        # the reference also resolves after a selection
+        selected = segments[segments.mu_id != -1]
+        self.assertEqual(
+            ak.to_list(selected.muon.pt),
+            ak.to_list(self.events.muon.pt[selected.mu_id]),
+        )
+
+    def test_derived_fields(self):
+        sim_hits = self.events.sim_hits
+        ch_id = self.branches["sim_hits_ch_id"]
+        self.assertEqual(
+            ak.to_list(sim_hits.station), ak.to_list(helpers.serial_to_station(ch_id))
+        )
+        self.assertEqual(
+            ak.to_list(sim_hits.eta),
+            ak.to_list(helpers.theta_to_eta(self.branches["sim_hits_thetaAtEntry"])),
+        )
+        calo_hits = self.events.ecalBarrel_calo_hits
+        self.assertEqual(
+            ak.to_list(calo_hits.energy),
+            ak.to_list(
+                self.branches["ecalBarrel_calo_hits_energyEM"]
+                + self.branches["ecalBarrel_calo_hits_energyHad"]
+            ),
+        )
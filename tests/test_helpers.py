@@ -1,4 +1,9 @@
+import os
 import unittest
+from unittest import mock
+import awkward as ak
+import numpy as np
+import scipy.stats as st
 import helpers
 
 
@@ -36,3 +41,141 @@ class TestHelpers(unittest.TestCase):
             self.assertEqual(
                 helpers.serial_to_chamber(ch_id), self.ids[ch_id]["chamber"]
             )
+
+    def test_decode_chamber_id(self):
+        decoded = helpers.decode_chamber_id(np.array(list(self.ids)))
+        for i, ch_id in enumerate(self.ids):
+            for field in ("endcap", "station", "ring", "chamber"):
+                self.assertEqual(decoded[field][i], self.ids[ch_id][field])
+
+    def test_decode_chamber_id_out_of_range(self):
+        for ch_id in (-1, helpers.N_CHAMBER_IDS):
+            with self.assertRaises(ValueError):
+                helpers.decode_chamber_id(np.array([26, ch_id]))
+            with self.assertRaises(ValueError):
+                helpers.decode_chamber_id(ak.Array([[26], [ch_id]]))
+        self.assertEqual(len(helpers.decode_chamber_id(np.array([], dtype=int))), 0)
+
+    def test_decode_chamber_id_table(self):
+        ch_id = np.arange(helpers.N_CHAMBER_IDS)
+        table = helpers.CHAMBER_ID_TABLE
+        self.assertTrue(np.all(table["endcap"] == helpers.serial_to_endcap(ch_id)))
+        self.assertTrue(np.all(table["station"] == helpers.serial_to_station(ch_id)))
+        self.assertTrue(np.all(table["ring"] == helpers.serial_to_ring(ch_id)))
+        self.assertTrue(np.all(table["chamber"] == helpers.serial_to_chamber(ch_id)))
+        # each existing chamber has its own index
+        index = table["index"][table["index"] != -1]
+        self.assertEqual(sorted(index), list(range(helpers.N_CHAMBERS)))
+        self.assertEqual(
+            helpers.N_CHAMBERS, 2 * sum(helpers.CHAMBERS_PER_RING.values())
+        )
+
+    def test_decode_jagged_chamber_id(self):
+        ch_id = ak.Array([[26, 313], [], [420, 953, 1337]])
+        decoded = helpers.decode_chamber_id(ch_id)
+        self.assertEqual(ak.to_list(ak.num(decoded)), [2, 0, 3])
+        self.assertEqual(
+            ak.to_list(decoded.station), ak.to_list(helpers.serial_to_station(ch_id))
+        )
+        self.assertEqual(
+            ak.to_list(ak.flatten(decoded.index)),
+            list(helpers.decode_chamber_id(ak.to_numpy(ak.flatten(ch_id)))["index"]),
+        )
+
+    def test_available_cores(self):
+        self.assertGreaterEqual(helpers.available_cores(), 1)
+        # without the affinity, which only Linux has
+        with mock.patch.object(helpers, "os", mock.Mock(spec=["cpu_count"])) as os_:
+            os_.cpu_count.return_value = os.cpu_count()
+            self.assertEqual(helpers.available_cores(), os.cpu_count())
+
+    def test_kinematics(self):
+        eta = np.linspace(-2.5, 2.5, 11)
+        theta = 2.0 * np.arctan(np.exp(-eta))
+        pt = np.linspace(1.0, 100.0, 11)
+        for dtype in (np.float32, np.float64):
+            self.assertTrue(np.allclose(helpers.theta_to_eta(theta.astype(dtype)), eta))
+            self.assertTrue(np.allclose(helpers.eta_to_theta(eta.astype(dtype)), theta))
+            p = helpers.pt_eta_to_p(pt.astype(dtype), eta.astype(dtype))
+            self.assertEqual(p.dtype, np.float64)
+            # only the inputs are rounded
+            np.testing.assert_allclose(
+                p, pt.astype(dtype) * np.cosh(eta.astype(dtype).astype(np.float64))
+            )
+        self.assertAlmostEqual(helpers.theta_to_eta(np.pi / 2), 0.0)
+
+    def test_kinematics_out(self):
+        eta = np.linspace(-2.5, 2.5, 11)
+        out = np.empty_like(eta)
+        theta = helpers.eta_to_theta(eta, out=out)
+        self.assertIs(theta, out)
+        # the input is left alone
+        self.assertTrue(np.array_equal(eta, np.linspace(-2.5, 2.5, 11)))
+        p = helpers.pt_eta_to_p(2.0, eta, out=out)
+        self.assertIs(p, out)
+        self.assertTrue(np.allclose(p, 2.0 * np.cosh(eta)))
+
+    def test_jagged_kinematics(self):
+        eta = ak.Array([[0.5, -1.0], [], [2.0]])
+        self.assertEqual(
+            ak.to_list(helpers.eta_to_theta(eta)),
+            [list(helpers.eta_to_theta(np.array(e))) for e in ak.to_list(eta)],
+        )
+        p = helpers.pt_eta_to_p(eta * 0 + 10.0, ak.values_astype(eta, np.float32))
+        self.assertEqual(ak.to_list(ak.num(p)), [2, 0, 1])
+        self.assertEqual(ak.type(p).type.type.dtype, "float64")
+
+    def test_moyal(self):
+        z = np.linspace(-3, 50, 1061)
+        for loc, scale in ((0.0, 1.0), (3.0, 0.5), (-1.0, 10.0)):
+            x = loc + scale * z
+            for moyal, scipy_moyal in (
+                (helpers.moyal_pdf, st.moyal.pdf),
+                (helpers.moyal_logpdf, st.moyal.logpdf),
+                (helpers.moyal_cdf, st.moyal.cdf),
+            ):
+                np.testing.assert_allclose(
+                    moyal(x, loc, scale),
+                    scipy_moyal(x, loc=loc, scale=scale),
+                    rtol=1e-12,
+                )
+        self.assertEqual(helpers.moyal_pdf(-1000.0, 0.0, 1.0), 0.0)
+        self.assertEqual(helpers.moyal_cdf(-1000.0, 0.0, 1.0), 0.0)
+        # unlike scipy's, the logpdf stays finite where the pdf underflows
+        self.assertTrue(np.isfinite(helpers.moyal_logpdf(-100.0, 0.0, 1.0)))
+        self.assertTrue(np.isnan(helpers.moyal_pdf(1.0, 0.0, 0.0)))
+        self.assertTrue(np.isnan(helpers.moyal_logpdf(1.0, 0.0, -1.0)))
+
+    def test_moyal_gradient(self):
+        x = np.linspace(-5, 30, 351)
+        loc, scale, step = 2.0, 3.0, 1e-6
+        for moyal, gradient in (
+            (helpers.moyal_pdf, helpers.moyal_pdf_gradient),
+            (helpers.moyal_logpdf, helpers.moyal_logpdf_gradient),
+        ):
+            d_loc, d_scale = gradient(x, loc, scale)
+            np.testing.assert_allclose(
+                d_loc,
+                (moyal(x, loc + step, scale) - moyal(x, loc - step, scale))
+                / (2 * step),
+                rtol=1e-5,
+                atol=1e-10,
+            )
+            np.testing.assert_allclose(
+                d_scale,
+                (moyal(x, loc, scale + step) - moyal(x, loc, scale - step))
+                / (2 * step),
+                rtol=1e-5,
+                atol=1e-10,
+            )
+        # the pdf and its derivatives underflow together
+        self.assertEqual(helpers.moyal_pdf_gradient(-1000.0, 0.0, 1.0), (0.0, 0.0))
+
+    def test_landau(self):
+        dp = np.linspace(0, 100, 101)
+        p = np.full_like(dp, 2000.0)
+        np.testing.assert_allclose(
+            helpers.landau((dp, p), 2.0, 0.004, 0.002, 100.0),
+            100.0 * st.moyal.pdf(dp, loc=2.0 + 0.004 * p, scale=0.002 * p),
+            rtol=1e-12,
+        )
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from inference import DenseModel, export_model, load_model
+
+
+class Normalization:
+    """Stand-in of the Keras layer, with only what export_model reads."""
+
+    def __init__(self, mean, variance):
+        self.mean = mean[np.newaxis]
+        self.variance = variance[np.newaxis]
+
+
+class Dense:
+    """Stand-in of the Keras layer, with only what export_model reads."""
+
+    def __init__(self, kernel, bias, activation):
+        self._weights = [kernel, bias]
+        self._activation = activation
+
+    def get_weights(self):
+        return self._weights
+
+    def get_config(self):
+        return {"activation": self._activation}
+
+
+class Sequential:
+    def __init__(self, layers):
+        self.layers = layers
+
+
+class TestInference(unittest.TestCase):
+    """Unit tester for the NumPy inference."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(7)
+        cls.features = ["eta", "phi", "hcal"]
+        cls.mean = rng.normal(size=3)
+        cls.variance = rng.uniform(0.5, 2, size=3)
+        cls.variance[2] = 0
+        shapes = [(3, 8), (8, 8), (8, 1)]
+        cls.kernels = [rng.normal(size=shape) for shape in shapes]
+        cls.biases = [rng.normal(size=shape[1]) for shape in shapes]
+        cls.activations = ["elu", "relu", "linear"]
+        cls.x = rng.normal(size=(1000, 3))
+
+    def expected(self):
+        """Evaluate the network in double precision."""
+        x = (self.x - self.mean) / np.maximum(np.sqrt(self.variance), 1e-7)
+        for kernel, bias, activation in zip(
+            self.kernels, self.biases, self.activations
+        ):
+            x = x @ kernel + bias
+            if activation == "relu":
+                x = np.maximum(x, 0)
+            elif activation == "elu":
+                x = np.where(x > 0, x, np.exp(x) - 1)
+        return x
+
+    def test_predict(self):
+        model = DenseModel(
+            self.kernels, self.biases, self.activations, self.mean, self.variance
+        )
+        predicts = model.predict(self.x, batch_size=300)
+        self.assertEqual(predicts.shape, (1000, 1))
+        self.assertEqual(predicts.dtype, np.float32)
+        np.testing.assert_allclose(predicts, self.expected(), rtol=1e-4, atol=1e-4)
+
+    def test_export(self):
+        layers = [Normalization(self.mean, self.variance)] + [
+            Dense(*layer) for layer in zip(self.kernels, self.biases, self.activations)
+        ]
+        popt = np.array([1.0, 0.01, 0.002, 100.0])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.npz")
+            export_model(Sequential(layers), path, self.features, popt)
+            model = load_model(path)
+        np.testing.assert_array_equal(model.popt, popt)
+        self.assertEqual(model.features, self.features)
+        columns = dict(zip(self.features, self.x.T))
+        np.testing.assert_allclose(
+            model.predict_columns(columns), self.expected(), rtol=1e-4, atol=1e-4
+        )
+
+    def test_export_unknown_layer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.npz")
+            with self.assertRaises(ValueError):
+                export_model(Sequential([Sequential([])]), path, self.features)
+            layer = Dense(self.kernels[0], self.biases[0], "softmax")
+            with self.assertRaises(ValueError):
+                export_model(Sequential([layer]), path, self.features)
+
+    def test_save(self):
+        model = DenseModel(
+            self.kernels, self.biases, self.activations, self.mean, self.variance
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.npz")
+            model.save(path)
+            loaded = load_model(path)
+        self.assertIsNone(loaded.features)
+        self.assertIsNone(loaded.popt)
+        self.assertEqual(loaded.activations, self.activations)
+        np.testing.assert_array_equal(loaded.predict(self.x), model.predict(self.x))
+        with self.assertRaises(ValueError):
+            DenseModel(
+                self.kernels, self.biases, ["softmax"] * 3, self.mean, self.variance
+            )
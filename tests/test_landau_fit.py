@@ -0,0 +1,117 @@
+import unittest
+import numpy as np
+import scipy.stats as st
+from coffea import hist
+import helpers
+import landau_fit
+
+
+class TestLandauFit(unittest.TestCase):
+    """Unit tester for the binned Landau fit."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(11)
+        cls.dp = np.linspace(0, 100, 51)[:-1] + 1
+        cls.p = np.linspace(-10, 4010, 101)[:-1] + 20.1
+        cls.parameters = np.array([2.0, 0.004, 0.002, 3e4])
+        cls.X = np.meshgrid(cls.dp, cls.p)
+        cls.counts = rng.poisson(helpers.landau(cls.X, *cls.parameters))
+        # the dp and p of each muon for the unbinned fit
+        cls.muon_p = np.exp(rng.uniform(np.log(10), np.log(4000), 20000))
+        cls.muon_dp = st.moyal.rvs(
+            loc=cls.parameters[0] + cls.parameters[1] * cls.muon_p,
+            scale=cls.parameters[2] * cls.muon_p,
+            random_state=rng,
+        )
+
+    def test_jacobian(self):
+        jacobian = landau_fit.landau_jacobian(self.X, *self.parameters)
+        self.assertEqual(jacobian.shape, self.counts.shape + (4,))
+        for i, parameter in enumerate(self.parameters):
+            step = np.zeros(4)
+            step[i] = parameter * 1e-6
+            numeric = (
+                helpers.landau(self.X, *(self.parameters + step))
+                - helpers.landau(self.X, *(self.parameters - step))
+            ) / (2 * step[i])
+            np.testing.assert_allclose(
+                jacobian[..., i], numeric, atol=1e-7 * np.max(np.abs(numeric))
+            )
+
+    def test_fit(self):
+        popt, pcov, chi2, ndf = landau_fit.fit_landau(self.counts, self.dp, self.p)
+        pulls = (popt - self.parameters) / np.sqrt(np.diag(pcov))
+        self.assertTrue(np.all(np.abs(pulls) < 5), pulls)
+        self.assertLess(abs(chi2 / ndf - 1), 0.2)
+
+    def test_chi2_fit(self):
+        # the sqrt(counts) errors bias the fit a little where counts are low
+        popt, _, chi2, ndf = landau_fit.fit_landau(
+            self.counts, self.dp, self.p, likelihood="chi2"
+        )
+        np.testing.assert_allclose(popt, self.parameters, rtol=0.02)
+        self.assertLess(abs(chi2 / ndf - 1), 0.2)
+
+    def test_unknown_likelihood(self):
+        with self.assertRaises(ValueError):
+            landau_fit.fit_landau(self.counts, self.dp, self.p, likelihood="l2")
+
+    def test_histogram_values(self):
+        histogram = hist.Hist(
+            "Muons",
+            hist.Bin("p", "$p$ [GeV]", 100, -10, 4010),
+            hist.Bin("dp", "$\\Delta p$ [GeV]", 50, 0, 100),
+        )
+        histogram.fill(p=np.array([100.0, 100.0, 3000.0]), dp=np.array([1, 1, 99]))
+        counts, dp, p = landau_fit.histogram_values(histogram)
+        self.assertEqual(counts.shape, (100, 50))
+        self.assertEqual(counts[2, 0], 2)
+        self.assertEqual(counts[74, 49], 1)
+        np.testing.assert_allclose(dp, self.dp)
+        np.testing.assert_allclose(p, self.p)
+
+    def test_nll(self):
+        parameters = self.parameters[:3]
+        nll, gradient, hessian = landau_fit.landau_nll(
+            self.muon_dp, self.muon_p, *parameters
+        )
+        self.assertAlmostEqual(
+            nll,
+            -np.sum(
+                st.moyal.logpdf(
+                    self.muon_dp,
+                    loc=parameters[0] + parameters[1] * self.muon_p,
+                    scale=parameters[2] * self.muon_p,
+                )
+            ),
+            delta=1e-9 * nll,
+        )
+        for i, parameter in enumerate(parameters):
+            step = np.zeros(3)
+            step[i] = parameter * 1e-6
+            up = landau_fit.landau_nll(self.muon_dp, self.muon_p, *(parameters + step))
+            down = landau_fit.landau_nll(
+                self.muon_dp, self.muon_p, *(parameters - step)
+            )
+            np.testing.assert_allclose(
+                gradient[i], (up[0] - down[0]) / (2 * step[i]), rtol=1e-4
+            )
+            np.testing.assert_allclose(
+                hessian[i], (up[1] - down[1]) / (2 * step[i]), rtol=1e-4
+            )
+        # splitting the muons into other blocks only changes the rounding
+        for n_blocks in (1, 7):
+            np.testing.assert_allclose(
+                landau_fit.landau_nll(
+                    self.muon_dp, self.muon_p, *parameters, n_blocks=n_blocks
+                )[0],
+                nll,
+                rtol=1e-12,
+            )
+
+    def test_unbinned_fit(self):
+        popt, pcov = landau_fit.fit_landau_unbinned(self.muon_dp, self.muon_p)
+        pulls = (popt - self.parameters[:3]) / np.sqrt(np.diag(pcov))
+        self.assertTrue(np.all(np.abs(pulls) < 5), pulls)
@@ -0,0 +1,163 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import scipy.stats as st
+from helpers import landau
+import momentum_estimator as me
+
+
+def loop_find_bounds(ydata, xdata, ypoint=1):
+    """The per muon search of learn_momentum_loss.py this replaces."""
+    pred_p = xdata[np.argmin(ydata)]
+    low = high = -999.0
+    for i, point in enumerate(ydata):
+        if low == high and point <= ypoint:
+            low = xdata[i]
+        if low != high and point > ypoint:
+            high = xdata[i - 1]
+            break
+    if high == -999.0:
+        high = xdata[-1]
+    return pred_p, low, high
+
+
+class TestMomentumEstimator(unittest.TestCase):
+    """Unit tester for the momentum estimate."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(13)
+        cls.popt = np.array([2.0, 0.004, 0.002, 3e4])
+        # predictions of the network, as an (n, 1) array
+        cls.pred_dp = np.concatenate(
+            (rng.exponential(10, 40), [0.0, 0.5, 80.0, 500.0])
+        ).reshape(-1, 1)
+
+    def loop(self, levels):
+        """The rv_continuous scan of learn_momentum_loss.py this replaces."""
+        results = []
+        for pred_dp in self.pred_dp:
+
+            class landau_p_pdf(st.rv_continuous):
+                def _pdf(self_, x):
+                    return landau((pred_dp, x), *self.popt)
+
+            cv = landau_p_pdf(a=me.MIN, b=me.MAX, name="landau_p_pdf")
+            ydata = []
+            for p in me.P_AXIS:
+                ydata.append(-2 * cv.logpdf(p))
+            ydata = np.array(ydata)
+            ydata -= min(ydata)
+            results.append(
+                [loop_find_bounds(ydata, me.P_AXIS, level) for level in levels]
+            )
+        return np.array(results)
+
+    def test_matches_loop(self):
+        expected = self.loop(me.LEVELS)
+        pred_p, low, high = me.estimate_momentum(self.pred_dp, self.popt, chunk_size=7)
+        for level in range(len(me.LEVELS)):
+            np.testing.assert_array_equal(pred_p, expected[:, level, 0])
+            np.testing.assert_array_equal(low[:, level], expected[:, level, 1])
+            np.testing.assert_array_equal(high[:, level], expected[:, level, 2])
+        # the intervals are nested
+        self.assertTrue(np.all(low[:, 1] <= low[:, 0]))
+        self.assertTrue(np.all(high[:, 1] >= high[:, 0]))
+
+    def test_likelihood(self):
+        neg2_log_l = me.neg2_delta_log_likelihood(self.pred_dp[:3], self.popt)
+        self.assertEqual(neg2_log_l.shape, (3, len(me.P_AXIS)))
+        np.testing.assert_array_equal(np.min(neg2_log_l, axis=1), 0)
+
+    def test_bounds_edges(self):
+        p_axis = np.array([10.0, 20.0, 30.0, 40.0])
+        neg2_log_l = np.array(
+            [
+                [2.0, 0.0, 0.5, 3.0],
+                # the level is never exceeded again
+                [2.0, 0.0, 0.5, 0.9],
+                # nor is it exceeded at the start
+                [0.0, 0.5, 2.0, 4.0],
+            ]
+        )
+        pred_p, low, high = me.find_bounds(neg2_log_l, p_axis, np.array([1.0]))
+        np.testing.assert_array_equal(pred_p, [20.0, 20.0, 10.0])
+        np.testing.assert_array_equal(low[:, 0], [20.0, 20.0, 10.0])
+        np.testing.assert_array_equal(high[:, 0], [30.0, 40.0, 20.0])
+
+    def test_refine(self):
+        pred_p, low, high = me.refine_momentum(self.pred_dp, self.popt)
+        self.assertEqual(low.shape, (len(self.pred_dp), len(me.LEVELS)))
+        # within the resolution of a fine scan
+        fine = np.arange(me.P_AXIS[0], me.P_AXIS[-1] + 0.05, 0.1)
+        scan = me.estimate_momentum(self.pred_dp, self.popt, p_axis=fine)
+        for refined, scanned in zip((pred_p, low, high), scan):
+            np.testing.assert_allclose(refined, scanned, atol=0.1 + 1e-9)
+        # and on the likelihood curve
+        for level, level_value in enumerate(me.LEVELS):
+            for bound in (low[:, level], high[:, level]):
+                inside = (bound > fine[0]) & (bound < fine[-1])
+                neg2_log_l = -2 * np.log(
+                    landau((np.ravel(self.pred_dp), bound), *self.popt)
+                ) + 2 * np.log(landau((np.ravel(self.pred_dp), pred_p), *self.popt))
+                np.testing.assert_allclose(neg2_log_l[inside], level_value, atol=1e-6)
+
+    def test_crossing_on_node(self):
+        popt = np.asarray(self.popt, dtype=np.float64)
+        p_nodes = np.array([10.0, 20.0, 30.0, 40.0])
+        # the node at 20 GeV is exactly on the level, the crossing is past it
+        y_nodes = np.array([0.0, 1.0, 5.0, 9.0])
+        self.assertEqual(
+            me._crossing(p_nodes, y_nodes, 0, 1, 10.0, popt, 0.0, 1.0, me.XTOL), 20.0
+        )
+        # a root at either end of the bracket is returned as is
+        for f_pre, f_cur, root in ((0.0, 4.0, 20.0), (-1.0, 0.0, 30.0)):
+            self.assertEqual(
+                me._brentq(False, 20.0, 30.0, f_pre, f_cur, 10.0, popt, 1.0, me.XTOL),
+                root,
+            )
+
+    def test_interval_table(self):
+        dp_grid = np.linspace(0, 100, 201)
+        table = me.interval_table(self.popt, dp_grid)
+        # at the grid points the table is the refined estimate
+        for expected, interpolated in zip(
+            me.refine_momentum(dp_grid, self.popt),
+            me.interpolate_momentum(dp_grid, table),
+        ):
+            np.testing.assert_array_equal(interpolated, expected)
+        # in between it is close to it
+        pred_dp = np.clip(np.ravel(self.pred_dp), 0.0, 99.0)
+        pred_p, low, high = me.interpolate_momentum(pred_dp, table)
+        refined_p, refined_low, _ = me.refine_momentum(pred_dp, self.popt)
+        self.assertEqual(low.shape, (len(pred_dp), len(me.LEVELS)))
+        self.assertLess(np.median(np.abs(pred_p - refined_p)), 1)
+        self.assertLess(np.median(np.abs(low - refined_low)), 1)
+        # outside the grid the edge is used
+        edge = me.interpolate_momentum(np.array([-5.0, 500.0]), table)[0]
+        np.testing.assert_array_equal(edge, table["pred_p"][[0, -1]])
+
+    def test_save_interval_table(self):
+        table = me.interval_table(self.popt, np.linspace(0, 10, 11))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, me.INTERVAL_TABLE_FILE)
+            me.save_interval_table(table, filename)
+            loaded = me.load_interval_table(filename)
+        self.assertEqual(set(loaded), set(table))
+        for name, values in table.items():
+            np.testing.assert_array_equal(loaded[name], values)
+
+    def test_interval_metrics(self):
+        rng = np.random.default_rng(11)
+        true_p = rng.uniform(100, 3000, 100000)
+        width = 0.1 * true_p
+        pred_p = true_p + 0.5 * width * rng.normal(size=len(true_p))
+        metrics = me.interval_metrics(
+            pred_p, pred_p - width / 2, pred_p + width / 2, true_p
+        )
+        # within half an interval width of the truth is within one sigma
+        self.assertAlmostEqual(metrics["fraction_in_interval"], 0.683, delta=0.01)
+        self.assertAlmostEqual(metrics["res_norm_mean"], 0, delta=0.01)
+        self.assertAlmostEqual(metrics["res_norm_sigma"], 0.5, delta=0.01)
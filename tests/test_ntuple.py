@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pyarrow.parquet as pq
+from ntuple import (
+    SUBSETS,
+    NtupleWriter,
+    fold_index,
+    iter_ntuple,
+    read_ntuple,
+    read_subset,
+    split_fraction,
+    subset_mask,
+    write_fold_matrix,
+    write_ntuple,
+)
+
+
+class TestNtuple(unittest.TestCase):
+    """Unit tester for the Parquet ntuples."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(5)
+        cls.columns = {name: rng.normal(size=250) for name in ("p", "dp", "eta", "phi")}
+
+    def setUp(self):
+        """Give each test its own file."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "ntuple.parquet")
+
+    def tearDown(self):
+        """Remove the file."""
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        write_ntuple(self.path, self.columns, row_group_size=100)
+        self.assertEqual(pq.ParquetFile(self.path).num_row_groups, 3)
+        dataset = read_ntuple(self.path)
+        self.assertEqual(list(dataset.columns), list(self.columns))
+        for name, values in self.columns.items():
+            np.testing.assert_array_equal(dataset[name].to_numpy(), values)
+
+    def test_memmap_columns(self):
+        memmap = np.memmap(
+            os.path.join(self.directory.name, "p.bin"),
+            dtype=np.float64,
+            mode="w+",
+            shape=self.columns["p"].shape,
+        )
+        memmap[:] = self.columns["p"]
+        write_ntuple(self.path, {"p": memmap})
+        np.testing.assert_array_equal(read_ntuple(self.path)["p"], self.columns["p"])
+
+    def test_column_selection(self):
+        write_ntuple(self.path, self.columns)
+        dataset = read_ntuple(self.path, columns=["eta", "p"])
+        self.assertEqual(list(dataset.columns), ["eta", "p"])
+        np.testing.assert_array_equal(dataset["eta"], self.columns["eta"])
+
+    def test_incremental(self):
+        with NtupleWriter(self.path, list(self.columns)) as writer:
+            for chunk in (slice(0, 50), slice(50, 50), slice(50, 250)):
+                writer.write(
+                    {name: values[chunk] for name, values in self.columns.items()}
+                )
+        batches = list(iter_ntuple(self.path, columns=["dp"], batch_size=120))
+        self.assertEqual([len(batch) for batch in batches], [120, 120, 10])
+        np.testing.assert_array_equal(
+            np.concatenate([batch["dp"] for batch in batches]), self.columns["dp"]
+        )
+
+    def test_split(self):
+        fraction = split_fraction(self.columns)
+        self.assertTrue(np.all((fraction >= 0) & (fraction < 1)))
+        # the split doesn't depend on the order of the rows
+        order = np.random.default_rng(6).permutation(250)
+        shuffled = {name: values[order] for name, values in self.columns.items()}
+        np.testing.assert_array_equal(split_fraction(shuffled), fraction[order])
+        self.assertFalse(np.array_equal(split_fraction(self.columns, seed=1), fraction))
+        masks = [subset_mask(self.columns, subset) for subset in SUBSETS]
+        # every row is in exactly one subset
+        np.testing.assert_array_equal(np.sum(masks, axis=0), 1)
+        for mask, (low, high) in zip(masks, SUBSETS.values()):
+            self.assertAlmostEqual(np.mean(mask), high - low, delta=0.1)
+
+    def test_read_subset(self):
+        write_ntuple(self.path, self.columns, row_group_size=100)
+        mask = subset_mask(self.columns, "test")
+        dataset = read_subset(self.path, "test", columns=["dp"], batch_size=60)
+        self.assertEqual(list(dataset.columns), ["dp"])
+        np.testing.assert_array_equal(dataset["dp"], self.columns["dp"][mask])
+        self.assertEqual(
+            len(read_subset(self.path, "train")),
+            np.sum(subset_mask(self.columns, "train")),
+        )
+
+    def test_fold_matrix(self):
+        write_ntuple(self.path, self.columns, row_group_size=100)
+        fold = fold_index(self.columns, 4)
+        self.assertEqual(set(fold), {0, 1, 2, 3})
+        path = os.path.join(self.directory.name, "matrix.npy")
+        offsets = write_fold_matrix(path, self.path, ["dp", "p"], 4, batch_size=60)
+        np.testing.assert_array_equal(np.diff(offsets), np.bincount(fold))
+        matrix = np.load(path, mmap_mode="r")
+        self.assertEqual(matrix.shape, (250, 2))
+        self.assertEqual(matrix.dtype, np.float32)
+        expected = np.stack([self.columns["dp"], self.columns["p"]], axis=-1)
+        for i in range(4):
+            rows = matrix[offsets[i] : offsets[i + 1]]
+            fold_rows = expected[fold == i].astype(np.float32)
+            np.testing.assert_array_equal(
+                rows[np.argsort(rows[:, 0])], fold_rows[np.argsort(fold_rows[:, 0])]
+            )
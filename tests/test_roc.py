@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from roc import auc, roc_curve
+
+
+def masked_roc(values, labels, threshold, greater):
+    """The ROC point of a threshold, by masking the rows."""
+    passing = values >= threshold if greater else values <= threshold
+    positives = np.count_nonzero(labels)
+    negatives = len(labels) - positives
+    true_positives = np.count_nonzero(passing & labels)
+    false_positives = np.count_nonzero(passing & ~labels)
+    return (
+        true_positives / positives,
+        false_positives / negatives,
+        (true_positives + negatives - false_positives) / len(labels),
+    )
+
+
+class TestRoc(unittest.TestCase):
+    """Unit tester for the ROC curves."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Sets up variables needed for testing."""
+        rng = np.random.default_rng(13)
+        cls.labels = rng.random(5000) < 0.3
+        cls.chi2 = rng.exponential(2, 5000) - cls.labels
+        cls.layers = rng.integers(3, 7, 5000) + cls.labels
+        cls.pattern = rng.choice([60, 70, 80, 90, 100], 5000) + 10 * cls.labels
+
+    def check(self, values, greater):
+        thresholds, tpr, fpr, accuracy = roc_curve(values, self.labels, greater)
+        np.testing.assert_array_equal(
+            thresholds, np.unique(values)[::-1] if greater else np.unique(values)
+        )
+        for i, threshold in enumerate(thresholds):
+            np.testing.assert_allclose(
+                (tpr[i], fpr[i], accuracy[i]),
+                masked_roc(values, self.labels, threshold, greater),
+            )
+        # the loosest cut passes everything
+        self.assertEqual((tpr[-1], fpr[-1]), (1, 1))
+
+    def test_float(self):
+        self.check(self.chi2, greater=False)
+        self.check(self.chi2, greater=True)
+
+    def test_integer(self):
+        self.check(self.layers, greater=True)
+        self.check(self.pattern, greater=False)
+        # wider than the number of rows, so sorted
+        self.check(self.pattern * 1000, greater=True)
+
+    def test_auc(self):
+        _, tpr, fpr, _ = roc_curve(self.chi2, self.labels, greater=False)
+        # the probability of a positive below a negative
+        positives, negatives = self.chi2[self.labels], self.chi2[~self.labels]
+        expected = np.mean(positives[:, np.newaxis] < negatives)
+        self.assertAlmostEqual(auc(fpr, tpr), expected, places=6)
+        _, tpr, fpr, _ = roc_curve(np.zeros(10), np.arange(10) < 5)
+        self.assertEqual(auc(fpr, tpr), 0.5)
+
+    def test_empty(self):
+        thresholds, tpr, fpr, accuracy = roc_curve([], [])
+        self.assertEqual(len(thresholds), 0)
+        thresholds, tpr, fpr, accuracy = roc_curve([1, 2], [True, True])
+        np.testing.assert_array_equal(fpr, [0, 0])